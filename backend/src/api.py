@@ -1,15 +1,47 @@
 import traceback
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hashlib
+import json
+import time
+import threading
+from collections import OrderedDict
+from fastapi import FastAPI, HTTPException, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
 import pandas as pd
 import numpy as np
 import os
 import uvicorn
 from sqlalchemy import text
-from db_direct import get_db, engine
-from datetime import datetime
-
-app = FastAPI(title="Inventory Engine API", version="1.0")
+from sqlalchemy.ext.asyncio import AsyncSession
+os.environ.setdefault("DB_PROCESS_TYPE", "api") # API pool profile (see db_direct.py)
+from db_direct import get_db, engine, pool_metrics, PROCESS_TYPE, POOLER_MODE
+from db_async import get_async_db, async_engine
+from outbreak_intel import outbreak_cache
+from reorder_policy import MIN_STOCK_THRESHOLD, SUPPLIER_DEFAULTS
+from expiry_simulation import simulate_expiry_loss, risk_level, N_SCENARIOS
+from datetime import datetime, date, timedelta
+from contextlib import asynccontextmanager
+from scheduler import scheduler, SCHEDULER_ENABLED
+from metrics import REGISTRY, CONTENT_TYPE, CACHE_HIT_RATIO, PrometheusMiddleware, cache_lookup
+from sql_instrumentation import slow_query_log
+from circuit_breaker import db_breaker, LastKnownGood, DB_UNAVAILABLE_ERRORS
+from sqlalchemy import exc as sa_exc
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Scheduled jobs run on workers started with SCHEDULER_ENABLED=1 (see scheduler.py)
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+    yield
+    await scheduler.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+app = FastAPI(title="Inventory Engine API", version="1.0", lifespan=lifespan)
+
+# Request latency per route, exported on /metrics with the SQL timings
+# (sql_instrumentation.py, attached in db_direct.py / db_async.py)
+app.add_middleware(PrometheusMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,7 +53,8 @@ app.add_middleware(
 
 # Paths
 DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
-FORECAST_PATH = os.path.join(DATA_DIR, 'forecast_results.csv')
+FORECAST_PATH = os.path.join(DATA_DIR, 'forecast_results.csv')  # per-medicine (forecasting_v2.py)
+TOTAL_FORECAST_PATH = os.path.join(DATA_DIR, 'forecast_total.csv')  # total only (forecasting.py)
 DETAILED_FORECAST_PATH = os.path.join(DATA_DIR, 'forecast_detailed.csv')
 WASTE_PATH = os.path.join(DATA_DIR, 'waste_report.csv')
 REORDER_PATH = os.path.join(DATA_DIR, 'reorder_recommendations.csv')
@@ -30,117 +63,219 @@ WASTE_LOG_PATH = os.path.join(DATA_DIR, 'waste_log.csv')
 
 # ... (Health and Forecast endpoints are fine)
 
+# --- HELPER: Last-known-good results (see circuit_breaker.py) ---
+last_known_good = LastKnownGood()
+
+def serve_last_known_good(key, response: Response, error):
+    """
+    The last real result for key, flagged as stale, while the DB is
+    unavailable. 503 if there is none (never made-up numbers).
+    """
+    if isinstance(error, sa_exc.TimeoutError):
+        # Pool exhausted: connections are stuck on a slow database
+        db_breaker.record_failure(error)
+    entry = last_known_good.get(key)
+    if entry is None:
+        raise HTTPException(status_code=503, detail=f"Database unavailable and no cached result: {error}")
+    payload, stored_at = entry
+    as_of = stored_at.isoformat(timespec='seconds')
+    response.headers["X-Data-Stale"] = "true"
+    response.headers["X-Data-As-Of"] = as_of
+    response.headers["Warning"] = '110 - "Response is Stale"'
+    if isinstance(payload, dict):
+        payload = {**payload, "stale": True, "as_of": as_of}
+    return payload
+
 @app.get("/inventory")
-def get_inventory(limit: int = 100, offset: int = 0, search: str = ""):
+async def get_inventory(response: Response, limit: int = 100, offset: int = 0, search: str = "", db: AsyncSession = Depends(get_async_db)):
     """Returns inventory data (PostgreSQL) with pagination"""
+    key = ("inventory", limit, offset, search)
     try:
-        with engine.connect() as conn:
-            # Base query
-            # Filter out Expired and Zero Quantity items for the active view
-            sql = "SELECT * FROM inventory WHERE status != 'Expired' AND quantity > 0"
-            params = {"limit": limit, "offset": offset}
+        db_breaker.allow()
+        # Base query
+        # Filter out Expired and Zero Quantity items for the active view
+        sql = "SELECT * FROM inventory WHERE status != 'Expired' AND quantity > 0"
+        params = {"limit": limit, "offset": offset}
             
-            # Simple search if provided (optional optimization)
-            if search:
-                sql += " AND (med_name ILIKE :search OR batch_id ILIKE :search)"
-                params["search"] = f"%{search}%"
+        # Simple search if provided (optional optimization)
+        if search:
+            sql += " AND (med_name ILIKE :search OR batch_id ILIKE :search)"
+            params["search"] = f"%{search}%"
             
-            sql += " ORDER BY expiry_date ASC LIMIT :limit OFFSET :offset"
+        sql += " ORDER BY expiry_date ASC LIMIT :limit OFFSET :offset"
             
-            result = conn.execute(text(sql), params)
-            rows = result.mappings().all()
+        result = await db.execute(text(sql), params)
+        rows = result.mappings().all()
             
-            return [dict(row) for row in rows]
+        return last_known_good.store(key, [dict(row) for row in rows])
             
-    except Exception as e:
+    except DB_UNAVAILABLE_ERRORS as e:
         print(f"DB Fetch failed: {e}")
-        return []
+        return serve_last_known_good(key, response, e)
 
 @app.get("/drugs")
-def get_drug_database(limit: int = 100, offset: int = 0, search: str = ""):
+async def get_drug_database(response: Response, limit: int = 100, offset: int = 0, search: str = "", db: AsyncSession = Depends(get_async_db)):
     """Returns the drug catalog (PostgreSQL) with pagination"""
+    key = ("drugs", limit, offset, search)
     try:
-        with engine.connect() as conn:
-            sql = """
-                SELECT 
-                    brand_name, 
-                    generic_name, 
-                    manufacturer, 
-                    dosage, 
-                    dosage_form, 
-                    primary_ingredient 
-                FROM drugs 
-            """
-            params = {"limit": limit, "offset": offset}
+        db_breaker.allow()
+        sql = """
+            SELECT 
+                brand_name, 
+                generic_name, 
+                manufacturer, 
+                dosage, 
+                dosage_form, 
+                primary_ingredient 
+            FROM drugs 
+        """
+        params = {"limit": limit, "offset": offset}
             
-            if search:
-                sql += " WHERE (brand_name ILIKE :search OR generic_name ILIKE :search OR manufacturer ILIKE :search)"
-                params["search"] = f"%{search}%"
+        if search:
+            sql += " WHERE (brand_name ILIKE :search OR generic_name ILIKE :search OR manufacturer ILIKE :search)"
+            params["search"] = f"%{search}%"
                 
-            sql += " ORDER BY brand_name ASC LIMIT :limit OFFSET :offset"
+        sql += " ORDER BY brand_name ASC LIMIT :limit OFFSET :offset"
             
-            result = conn.execute(text(sql), params)
-            rows = result.mappings().all()
-            return [dict(row) for row in rows]
-    except Exception as e:
+        result = await db.execute(text(sql), params)
+        rows = result.mappings().all()
+        return last_known_good.store(key, [dict(row) for row in rows])
+    except DB_UNAVAILABLE_ERRORS as e:
         print(f"Error fetching drugs: {e}")
-        # Return MOCK DATA for Offline Mode
-        return [
-            {"id": 101, "med_name": "Amoxicillin 500mg", "quantity": 120, "expiry_date": "2024-12-01", "batch_id": "B-AMX-01", "status": "Expired", "category": "Antibiotic"},
-            {"id": 102, "med_name": "Dolo 650", "quantity": 500, "expiry_date": "2025-06-15", "batch_id": "B-DOLO-99", "status": "Good", "category": "Pain Relief"},
-            {"id": 103, "med_name": "Azithral 500", "quantity": 45, "expiry_date": "2024-11-20", "batch_id": "B-AZI-22", "status": "Low Stock", "category": "Antibiotic"},
-            {"id": 104, "med_name": "Pan 40", "quantity": 800, "expiry_date": "2025-08-30", "batch_id": "B-PAN-55", "status": "Good", "category": "Gastric"},
-            {"id": 105, "med_name": "Metformin 500", "quantity": 0, "expiry_date": "2025-01-10", "batch_id": "B-MET-12", "status": "Out of Stock", "category": "Diabetes"}
-        ]
+        return serve_last_known_good(key, response, e)
 
 
 @app.get("/stats")
-def get_dashboard_stats():
+async def get_dashboard_stats(response: Response, db: AsyncSession = Depends(get_async_db)):
     """Returns aggregated stats for the dashboard"""
+    key = ("stats",)
     try:
-        with engine.connect() as conn:
-            # Optimize: Single table scan with conditional counts
-            query = text("""
-                SELECT 
-                    COUNT(*) as total,
-                    COALESCE(SUM(quantity), 0) as total_qty,
-                    COUNT(*) FILTER (WHERE status = 'Low Stock') as low,
-                    COUNT(*) FILTER (WHERE quantity < 30) as out_stock,
-                    COUNT(*) FILTER (WHERE expiry_date > NOW() AND expiry_date < NOW() + INTERVAL '60 days') as expiring
-                FROM inventory
-            """)
-            result = conn.execute(query).mappings().one()
+        db_breaker.allow()
+        # Optimize: Single table scan with conditional counts
+        query = text("""
+            SELECT 
+                COUNT(*) as total,
+                COALESCE(SUM(quantity), 0) as total_qty,
+                COUNT(*) FILTER (WHERE status = 'Low Stock') as low,
+                COUNT(*) FILTER (WHERE quantity < 30) as out_stock,
+                COUNT(*) FILTER (WHERE expiry_date > NOW() AND expiry_date < NOW() + INTERVAL '60 days') as expiring
+            FROM inventory
+        """)
+        result = (await db.execute(query)).mappings().one()
             
-            return {
-                "total_products": result['total'],
-                "total_quantity": result['total_qty'],
-                "low_stock": result['low'],
-                "expiring_soon": result['expiring'],
-                "reorders": result['out_stock']
-            }
-    except Exception as e:
+        return last_known_good.store(key, {
+            "total_products": result['total'],
+            "total_quantity": result['total_qty'],
+            "low_stock": result['low'],
+            "expiring_soon": result['expiring'],
+            "reorders": result['out_stock']
+        })
+    except DB_UNAVAILABLE_ERRORS as e:
         print(f"Stats Error: {e}")
-        # Return MOCK DATA for Offline Mode
-        return {
-            "total_products": 2580,
-            "total_quantity": 45000,
-            "low_stock": 15,
-            "expiring_soon": 42,
-            "reorders": 8
-        }
+        return serve_last_known_good(key, response, e)
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "service": "Inventory Forecasting Engine"}
+    breaker = db_breaker.status()
+    return {"status": "ok" if breaker["state"] == "closed" else "degraded",
+            "service": "Inventory Forecasting Engine", "database": breaker}
+
+POOL_GAUGES = {
+    key: REGISTRY.gauge(f"db_pool_{key}", help_text, ["engine"])
+    for key, help_text in [
+        ("pool_size", "Configured pool size"),
+        ("checked_out", "Connections currently checked out"),
+        ("idle", "Idle connections in the pool"),
+        ("overflow", "Overflow connections currently open"),
+        ("checkouts", "Successful checkouts since start"),
+        ("timeouts", "Checkouts that timed out waiting for a connection"),
+        ("wait_seconds_total", "Total time spent waiting for a connection"),
+        ("wait_seconds_max", "Longest wait for a connection"),
+    ]
+}
+OUTBREAK_CACHE_GAUGE = REGISTRY.gauge("outbreak_cache_events", "Outbreak intel cache hits and reloads", ["event"])
+CIRCUIT_STATE_GAUGE = REGISTRY.gauge("db_circuit_breaker_open", "1 while the database circuit breaker is open or half-open")
+
+@REGISTRY.register_collector
+def _collect_pool_and_cache_stats():
+    for name, eng in [("sync", engine), ("async", async_engine)]:
+        stats = pool_metrics(eng) or {}
+        for key, gauge in POOL_GAUGES.items():
+            if key in stats:
+                gauge.set(stats[key], engine=name)
+    OUTBREAK_CACHE_GAUGE.set(outbreak_cache.hits, event="hit")
+    OUTBREAK_CACHE_GAUGE.set(outbreak_cache.reloads, event="reload")
+    CIRCUIT_STATE_GAUGE.set(0 if db_breaker.state == "closed" else 1)
+    lookups = outbreak_cache.hits + outbreak_cache.reloads
+    CACHE_HIT_RATIO.set(outbreak_cache.hits / lookups if lookups else 0.0, cache="outbreak_intel")
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics for this worker: request/query latency, caches, pools"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/metrics/pools")
+def get_pool_metrics():
+    """Connection pool state and checkout wait times for this worker (JSON)"""
+    return {
+        "pid": os.getpid(),
+        "process_type": PROCESS_TYPE,
+        "pooler_mode": POOLER_MODE,
+        "pools": {
+            "sync": pool_metrics(engine),
+            "async": pool_metrics(async_engine)
+        }
+    }
+
+# --- ADMIN ---
+
+@app.get("/admin/slow-queries")
+def get_slow_queries(limit: int = 20):
+    """Slowest statements seen by this worker (threshold SLOW_QUERY_MS), with params and EXPLAIN plans"""
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "explain": slow_query_log.explain,
+        "queries": slow_query_log.top(limit)
+    }
+
+@app.delete("/admin/slow-queries")
+def reset_slow_queries():
+    slow_query_log.reset()
+    return {"status": "cleared"}
+
+# --- JOBS ---
+
+@app.get("/jobs")
+def list_jobs():
+    """Scheduled jobs with their next run and last result"""
+    return {"enabled": SCHEDULER_ENABLED, "jobs": [j.status() for j in scheduler.jobs.values()]}
+
+@app.get("/jobs/{name}")
+def get_job(name: str, limit: int = 20):
+    """Job status plus its recent runs (newest first)"""
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {name}")
+    return {**scheduler.jobs[name].status(), "history": scheduler.get_history(name, limit)}
+
+@app.post("/jobs/{name}/run")
+async def run_job_now(name: str):
+    """Starts a job immediately (still subject to the cross-replica lock)"""
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {name}")
+    if scheduler.jobs[name].running:
+        raise HTTPException(status_code=409, detail=f"{name} is already running")
+    scheduler.trigger(name)
+    return {"status": "started", "job": name}
 
 @app.get("/forecast")
 def get_forecast():
     """Returns sales forecast broken down by Top 5 Medicines"""
-    if not os.path.exists(FORECAST_PATH):
+    forecast_path = FORECAST_PATH if os.path.exists(FORECAST_PATH) else TOTAL_FORECAST_PATH
+    if not os.path.exists(forecast_path):
         raise HTTPException(status_code=404, detail="Forecast data not found. Run forecasting.py first.")
     
     # 1. Load Total Forecast (Time Series)
-    df_total = pd.read_csv(FORECAST_PATH)
+    df_total = pd.read_csv(forecast_path)
     
     # NEW: Check if CSV already has granular columns (from forecasting_v2.py)
     # If it has columns other than 'date' and 'predicted_sales' + 'is_holiday', treat as Real Data
@@ -185,101 +320,108 @@ def get_forecast():
         
     return output_data
 
-import numpy as np # Add this import
+# --- HELPER: Forecast Summary & Stock Caches ---
+FORECAST_SUMMARY_PATH = os.path.join(DATA_DIR, 'forecast_summary.json')
+STOCK_CACHE_TTL = 60 # seconds
+STOCK_CACHE_SIZE = 1024 # medicines
+
+_forecast_summary_cache = {"mtime": None, "data": None}
+_stock_cache = OrderedDict() # med_name -> (fetched_at, qty), oldest fetch first
+_stock_lock = threading.Lock()
 
-# ...
+def load_forecast_summary():
+    """
+    Returns the per-medicine summary written by forecasting_v2.py.
+    Re-reads the file only when its mtime changes, and keeps serving the
+    previous data if the new file can't be read.
+    """
+    if not os.path.exists(FORECAST_SUMMARY_PATH):
+        return None
+    mtime = os.path.getmtime(FORECAST_SUMMARY_PATH)
+    cache_lookup("forecast_summary", _forecast_summary_cache["mtime"] == mtime)
+    if _forecast_summary_cache["mtime"] != mtime:
+        try:
+            with open(FORECAST_SUMMARY_PATH) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Forecast summary reload failed, keeping previous data: {e}")
+            return _forecast_summary_cache["data"]
+        _forecast_summary_cache["data"] = data
+        _forecast_summary_cache["mtime"] = mtime
+    return _forecast_summary_cache["data"]
+
+def get_cached_stock(med_name):
+    """
+    Active stock for a medicine, cached for STOCK_CACHE_TTL seconds.
+    Expired entries are evicted on write and at most STOCK_CACHE_SIZE are kept.
+    """
+    now = time.monotonic()
+    with _stock_lock:
+        cached = _stock_cache.get(med_name)
+    hit = cached is not None and now - cached[0] < STOCK_CACHE_TTL
+    cache_lookup("stock", hit)
+    if hit:
+        return cached[1]
+
+    with engine.connect() as conn:
+        res = conn.execute(text(
+            "SELECT COALESCE(SUM(quantity), 0) FROM inventory WHERE med_name = :m AND status != 'Expired'"
+        ), {"m": med_name}).scalar()
+    qty = int(res) if res else 0
+    with _stock_lock:
+        _stock_cache[med_name] = (now, qty)
+        _stock_cache.move_to_end(med_name)
+        while _stock_cache and (len(_stock_cache) > STOCK_CACHE_SIZE
+                                or now - next(iter(_stock_cache.values()))[0] >= STOCK_CACHE_TTL):
+            _stock_cache.popitem(last=False)
+    return qty
+
+def etag_response(request: Request, response: Response, payload):
+    """
+    Tags a JSON payload with a content hash. Returns a bare 304 if the
+    client already holds the same version.
+    """
+    body = json.dumps(payload, sort_keys=True, default=str).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={STOCK_CACHE_TTL}"}
+    not_modified = request.headers.get("if-none-match") == etag
+    cache_lookup("etag", not_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return payload
 
 @app.get("/forecast/detail")
-def get_forecast_detail(med_name: str = "all"):
+def get_forecast_detail(request: Request, response: Response, med_name: str = "all"):
     """
-    Returns detailed enhanced forecast data for UI.
-    Includes: 6-month predictions, confidence, "Why" reasons, seasonal factors, and reorder schedule.
+    Returns detailed forecast data for UI, served from forecasting_v2.py output.
+    Includes: 6-month predictions with CIs, seasonal factors, YoY growth and reorder schedule.
     """
-    # Synthetic Data Generator for "AI Insights"
-    from datetime import datetime, timedelta
-    import random
+    summary = load_forecast_summary()
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Forecast summary not found. Run forecasting_v2.py first.")
+
+    medicines = summary["medicines"]
 
     if med_name == "all":
-        # Just return a list of top meds summary for the left panel logic if needed
-        # But usually UI calls this with specific ID.
-        # For "all", let's return a summary list
-        brands = ["Dolo 650", "Augmentin", "Pan 40", "Azithral", "Cipcal 500"]
-        return [{"med_name": b} for b in brands]
-
-    # Generate 6-month forecast
-    base_demand = random.randint(300, 500)
-    
-    # FETCH REAL STOCK FROM DB
-    current_stock = 0
+        # Summary list for the left panel
+        return etag_response(request, response, [{"med_name": m} for m in sorted(medicines)])
+
+    if med_name not in medicines:
+        raise HTTPException(status_code=404, detail=f"No forecast for '{med_name}'.")
+
+    med = medicines[med_name]
+    base_demand = med["avg_monthly_demand"]
+
     try:
-        with engine.connect() as conn:
-            # Check stock
-            res = conn.execute(text(
-                "SELECT COALESCE(SUM(quantity), 0) FROM inventory WHERE med_name = :m AND status != 'Expired'"
-            ), {"m": med_name}).scalar()
-            current_stock = int(res) if res else 0
-            
-            # User Request: If stock is 0, simulate inventory for demo (200-300)
-            if current_stock == 0:
-                current_stock = random.randint(200, 300)
-                
+        current_stock = get_cached_stock(med_name)
     except Exception as e:
         print(f"Stock fetch error: {e}")
-        current_stock = random.randint(200, 300) # Fallback
-
-    # ... (Seasonality Logic remains) ...
-    
-    # Seasonal Logic
-    seasons = {
-        "Winter": 1.2 if med_name in ["Augmentin", "Azithral", "Dolo 650"] else 0.9,
-        "Spring": 1.1,
-        "Summer": 1.3 if "Dolo" in med_name else 0.8,
-        "Fall": 1.0
-    }
-    
-    monthly_data = []
-    current_month = datetime.now()
-    
-    for i in range(6):
-        future_date = current_month + timedelta(days=30*i)
-        month_name = future_date.strftime("%B")
-        
-        # Determine season
-        if month_name in ["December", "January", "February"]: season = "Winter"
-        elif month_name in ["March", "April", "May"]: season = "Spring"
-        elif month_name in ["June", "July", "August"]: season = "Summer"
-        else: season = "Fall"
-        
-        factor = seasons[season]
-        # Random fluctuation
-        qty = int(base_demand * factor * random.uniform(0.9, 1.1))
-        
-        # Trend
-        prev_qty = monthly_data[-1]['quantity'] if monthly_data else base_demand
-        trend = "up" if qty > prev_qty * 1.05 else "down" if qty < prev_qty * 0.95 else "stable"
-        
-        # Why?
-        if season == "Winter" and factor > 1:
-            why = "Winter season - higher respiratory infections"
-        elif season == "Summer" and factor > 1:
-            why = "Summer heat - dehydration & injuries"
-        elif trend == "up":
-            why = "Positive sustained growth trend identified"
-        elif trend == "down":
-            why = "Post-seasonal demand normalization"
-        else:
-            why = "Consistent baseline consumption"
-
-        monthly_data.append({
-            "month": month_name,
-            "quantity": qty,
-            "confidence": random.randint(85, 96),
-            "trend": trend,
-            "reason": why
-        })
+        current_stock = 0
 
     # DYNAMIC REORDER SCHEDULE BASED ON REAL STOCK
     reorders = []
+    today = date.today()
     
     # Safety Stock logic (e.g. 50% of avg demand)
     safety_stock = int(base_demand * 0.5)
@@ -288,7 +430,7 @@ def get_forecast_detail(med_name: str = "all"):
         # CRITICAL REORDER
         shortage = safety_stock - current_stock + int(base_demand) # Order enough for safety + 1 month
         reorders.append({
-            "date": (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d"),
+            "date": (today + timedelta(days=2)).strftime("%Y-%m-%d"),
             "quantity": shortage,
             "priority": "High",
             "reason": f"Stock ({current_stock}) below safety level ({safety_stock})"
@@ -297,7 +439,7 @@ def get_forecast_detail(med_name: str = "all"):
          # WARNING REORDER
          needed = base_demand - current_stock
          reorders.append({
-            "date": (datetime.now() + timedelta(days=15)).strftime("%Y-%m-%d"),
+            "date": (today + timedelta(days=15)).strftime("%Y-%m-%d"),
             "quantity": needed,
             "priority": "Medium",
             "reason": "Replenishment for upcoming cycle"
@@ -305,76 +447,82 @@ def get_forecast_detail(med_name: str = "all"):
     else:
         # FUTURE REORDER
         reorders.append({
-            "date": (datetime.now() + timedelta(days=45)).strftime("%Y-%m-%d"),
+            "date": (today + timedelta(days=45)).strftime("%Y-%m-%d"),
             "quantity": int(base_demand),
             "priority": "Low",
             "reason": "Scheduled cyclical replenishment"
         })
 
-
-    return {
+    return etag_response(request, response, {
         "med_name": med_name,
         "current_stock": current_stock,
         "avg_monthly_demand": base_demand,
-        "accuracy": 94.2,
-        "forecast_data": monthly_data,
+        "accuracy": med["accuracy"],
+        "forecast_data": med["forecast_data"],
         "reorder_schedule": reorders,
-        "seasonal_factors": [{"season": k, "factor": v} for k,v in seasons.items()],
-        "yoy_growth": random.randint(5, 15)
-    }
+        "seasonal_factors": med["seasonal_factors"],
+        "yoy_growth": med["yoy_growth"],
+        "forecast_generated_at": summary["generated_at"]
+    })
 
 @app.get("/waste")
-def get_waste_alerts():
-    """Returns waste/expiry alerts aggregated from DB"""
+async def get_waste_alerts(db: AsyncSession = Depends(get_async_db)):
+    """Returns waste/expiry alerts aggregated from DB, scored by the FEFO expiry simulation"""
     try:
-        # DB Query for Aggregation
-        # Risk levels: Critical < 15, High < 30, Moderate < 45
+        # Batches expiring within 45 days. Under FEFO a batch's waste only
+        # depends on batches expiring before it, so later ones can be left out.
         query = text("""
         SELECT 
             med_name,
-            COUNT(*) as batches_at_risk,
-            SUM(quantity) as total_quantity,
-            MIN(expiry_date - NOW()) as time_left_interval
+            batch_id,
+            quantity,
+            expiry_date,
+            COALESCE(cost_price, 0) as unit_value
         FROM inventory
         WHERE expiry_date <= NOW() + INTERVAL '45 days'
-        GROUP BY med_name
         """)
         
-        with engine.connect() as conn:
-            # Get Outbreak Meds for Risk Mitigation
-            outbreak_meds, _ = get_active_outbreaks(conn)
-
-            result = conn.execute(query)
-            rows = result.mappings().all()
+        # Get Outbreak Meds for Risk Mitigation
+        outbreak_meds, _ = await asyncio.to_thread(get_active_outbreaks)
+
+        rows = [dict(r) for r in (await db.execute(query)).mappings().all()]
+
+        sim = await asyncio.to_thread(simulate_batches, rows)
+        if sim.empty:
+            return []
+
+        per_med = sim.groupby('med_name').agg(
+            batches_at_risk=('quantity', 'size'),
+            total_quantity=('quantity', 'sum'),
+            earliest_expiry_days=('days_left', 'min'),
+            expected_waste_units=('expected_waste_units', 'sum'),
+            expected_waste_value=('expected_waste_value', 'sum')
+        )
+
+        alerts = []
+        for med_name, r in per_med.iterrows():
+            # Risk: expected share of this stock that expires unsold
+            waste_fraction = r['expected_waste_units'] / r['total_quantity'] if r['total_quantity'] > 0 else 0.0
+            level = risk_level(waste_fraction)
             
-            alerts = []
-            for r in rows:
-                days = r['time_left_interval'].days if r['time_left_interval'] else 0
-                med_name = r['med_name']
-                
-                # OUTBREAK LOGIC 2: Expiry Risk Mitigation
-                mitigated = False
-                original_level = ""
-                
-                if days < 15: level = "Critical"
-                elif days < 30: level = "High"
-                else: level = "Moderate"
-                
-                original_level = level
-                
-                if med_name in outbreak_meds and level in ["Critical", "High"]:
-                    level = "Mitigated (Outbreak Reserve)"
-                    mitigated = True
-                
-                alerts.append({
-                    "med_name": med_name,
-                    "batches_at_risk": r['batches_at_risk'],
-                    "total_quantity": r['total_quantity'],
-                    "earliest_expiry_days": max(0, days),
-                    "risk_level": level,
-                    "mitigated": mitigated # New Field
-                })
-            return alerts
+            # OUTBREAK LOGIC 2: Expiry Risk Mitigation
+            mitigated = False
+            if med_name in outbreak_meds and level in ["Critical", "High"]:
+                level = "Mitigated (Outbreak Reserve)"
+                mitigated = True
+            
+            alerts.append({
+                "med_name": med_name,
+                "batches_at_risk": int(r['batches_at_risk']),
+                "total_quantity": int(r['total_quantity']),
+                "earliest_expiry_days": int(r['earliest_expiry_days']),
+                "expected_waste_units": round(float(r['expected_waste_units']), 1),
+                "expected_waste_value": round(float(r['expected_waste_value']), 2),
+                "risk_score": round(100 * waste_fraction, 1),
+                "risk_level": level,
+                "mitigated": mitigated # New Field
+            })
+        return alerts
 
     except Exception as e:
          print(f"Error in /waste: {e}")
@@ -384,123 +532,218 @@ def get_waste_alerts():
              pass
          return []
 
-# --- HELPER: Outbreak Intelligence ---
-def get_active_outbreaks(conn):
+# --- HELPER: Expiry Simulation ---
+# Discount applied to batches the simulation expects to (partly) expire
+EXPIRY_DISCOUNT = {"Critical": 0.40, "Warning": 0.15}
+DISCOUNT_MIN_WASTE_PROBABILITY = 0.2
+
+SIMULATION_COLUMNS = ['med_name', 'batch_id', 'quantity', 'expiry_date', 'unit_value']
+SIMULATION_CACHE_SIZE = 8 # /waste, /expiry/alerts and /expiry/simulation queries
+
+_simulation_cache = OrderedDict() # key -> simulated frame (read-only), most recently used last
+_simulation_lock = threading.Lock()
+
+def simulate_batches(rows, n_scenarios=N_SCENARIOS):
+    """
+    FEFO Monte Carlo (expiry_simulation.py) over inventory rows
+    (med_name, quantity, expiry_date, unit_value), with each med's demand from
+    the forecast summary boosted by active outbreaks.
+    The simulation is seeded, so results are cached by the inventory
+    snapshot, forecast summary mtime, outbreak multipliers and day.
+    """
+    outbreak_meds, _ = get_active_outbreaks()
+    summary_mtime = os.path.getmtime(FORECAST_SUMMARY_PATH) if os.path.exists(FORECAST_SUMMARY_PATH) else None
+    h = hashlib.sha1(repr([tuple(r.get(c) for c in SIMULATION_COLUMNS) for r in rows]).encode())
+    h.update(repr((n_scenarios, summary_mtime, date.today(),
+                   sorted((m, o["multiplier"]) for m, o in outbreak_meds.items()))).encode())
+    key = h.hexdigest()
+
+    with _simulation_lock:
+        sim = _simulation_cache.get(key)
+        if sim is not None:
+            _simulation_cache.move_to_end(key)
+    cache_lookup("expiry_simulation", sim is not None)
+    if sim is not None:
+        return sim
+
+    sim = _simulate_batches(rows, n_scenarios, outbreak_meds)
+    with _simulation_lock:
+        _simulation_cache[key] = sim
+        while len(_simulation_cache) > SIMULATION_CACHE_SIZE:
+            _simulation_cache.popitem(last=False)
+    return sim
+
+def _simulate_batches(rows, n_scenarios, outbreak_meds):
+    df = pd.DataFrame(rows, columns=SIMULATION_COLUMNS)
+    summary = load_forecast_summary()
+    forecast = summary["medicines"] if summary else {}
+
+    mean_daily, std_daily = {}, {}
+    for med in df['med_name'].unique():
+        s = forecast.get(med)
+        mean = s["avg_daily_demand"] if s else DEFAULT_DAILY_DEMAND
+        std = s.get("daily_std", 0.0) if s else np.sqrt(DEFAULT_DAILY_DEMAND)
+        multiplier = outbreak_meds[med]["multiplier"] if med in outbreak_meds else 1.0
+        mean_daily[med] = mean * multiplier
+        std_daily[med] = std * multiplier
+
+    return simulate_expiry_loss(df, mean_daily, std_daily, n_scenarios=n_scenarios)
+
+@app.get("/expiry/simulation")
+async def get_expiry_simulation(med_name: str = None, n_scenarios: int = N_SCENARIOS, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    """
+    Expected expiry loss per batch from the FEFO Monte Carlo simulation,
+    highest expected loss first.
     """
-    Fetches active outbreaks and returns a set of affected medicines and metadata.
+    n_scenarios = max(100, min(n_scenarios, 10000))
+    query = """
+        SELECT med_name, batch_id, quantity, expiry_date, COALESCE(cost_price, 0) as unit_value
+        FROM inventory
+        WHERE quantity > 0
     """
+    params = {}
+    if med_name:
+        query += " AND med_name = :med_name"
+        params["med_name"] = med_name
+
     try:
-        query = text("""
-            SELECT * FROM outbreak_forecasts 
-            WHERE end_date >= NOW() AND start_date <= NOW()
-        """)
-        rows = conn.execute(query).mappings().all()
-        
-        affected_meds = set()
-        outbreak_info = []
-        
-        import json
-        for r in rows:
-            meds = json.loads(r['affected_meds']) if r['affected_meds'] else []
-            for m in meds:
-                affected_meds.add(m)
-            outbreak_info.append({
-                "name": r['outbreak_name'],
-                "risk": r['risk_level'],
-                "meds": meds
-            })
-            
-        return affected_meds, outbreak_info
+        rows = [dict(r) for r in (await db.execute(text(query), params)).mappings().all()]
     except Exception as e:
-        print(f"Outbreak Fetch Error: {e}")
-        return set(), []
+        print(f"Error in /expiry/simulation: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    sim = await asyncio.to_thread(simulate_batches, rows, n_scenarios=n_scenarios)
+    sim = sim.sort_values('expected_waste_value', ascending=False).head(limit)
+    return [{
+        "med_name": r['med_name'],
+        "batch_id": r['batch_id'],
+        "quantity": int(r['quantity']),
+        "expiry_date": str(r['expiry_date']),
+        "days_left": int(r['days_left']),
+        "expected_waste_units": round(float(r['expected_waste_units']), 1),
+        "p90_waste_units": round(float(r['p90_waste_units']), 1),
+        "waste_probability": round(float(r['waste_probability']), 3),
+        "expected_waste_value": round(float(r['expected_waste_value']), 2)
+    } for _, r in sim.iterrows()]
+
+# --- HELPER: Outbreak Intelligence ---
+def get_active_outbreaks():
+    """
+    Active outbreak-affected medicines and metadata, from the in-process cache.
+    Returns ({med_name: {"multiplier", "tags"}}, [{"name", "risk", "meds"}]).
+    """
+    return outbreak_cache.get_multipliers(), outbreak_cache.get_outbreaks()
 
 # --- ENDPOINTS ---
 
+REORDER_TARGET_DAYS = 10 # cover for meds without a forecast policy
+DEFAULT_DAILY_DEMAND = 5 # units/day for meds without a forecast
+
+# Set-based reorder engine: stock, the per-med policy in demand_forecast
+# (reorder_policy.py) and active outbreak multipliers are joined, and the plan
+# is computed, filtered, sorted and paginated in one statement.
+# Outbreaks scale demand, reorder point and order-up-to level alike.
+REORDER_SQL = text("""
+    WITH stock AS (
+        SELECT med_name, SUM(quantity) AS current_stock
+        FROM inventory
+        GROUP BY med_name
+    ),
+    outbreak AS (
+        SELECT med_name, MAX(multiplier) AS multiplier, string_agg(DISTINCT outbreak_name, ', ') AS tags
+        FROM outbreak_med_windows
+        WHERE CURRENT_DATE BETWEEN start_date AND end_date
+        GROUP BY med_name
+    ),
+    plan AS (
+        SELECT
+            COALESCE(s.med_name, d.med_name) AS med_name,
+            COALESCE(s.current_stock, 0) AS current_stock,
+            COALESCE(d.avg_daily_demand, :default_demand) * COALESCE(o.multiplier, 1) AS daily_demand,
+            COALESCE(d.lead_time_days, :default_lead_time) AS lead_time_days,
+            -- Meds without a forecast: Demand * Days OR Min Threshold (whichever is higher)
+            GREATEST(COALESCE(d.reorder_point * COALESCE(o.multiplier, 1), :default_demand * :target_days), :min_stock) AS reorder_point,
+            GREATEST(COALESCE(d.order_up_to * COALESCE(o.multiplier, 1), :default_demand * :target_days), :min_stock) AS target_stock,
+            COALESCE(d.moq, :default_moq) AS moq,
+            GREATEST(COALESCE(d.pack_size, :default_pack_size), 1) AS pack_size,
+            o.tags
+        FROM stock s
+        FULL OUTER JOIN demand_forecast d ON d.med_name = s.med_name
+        LEFT JOIN outbreak o ON o.med_name = COALESCE(s.med_name, d.med_name)
+    ),
+    recs AS (
+        SELECT
+            med_name,
+            current_stock,
+            daily_demand,
+            lead_time_days,
+            reorder_point,
+            target_stock,
+            tags,
+            CASE WHEN current_stock < reorder_point THEN 'Reorder Needed' ELSE 'OK' END AS status,
+            -- Order up to target, rounded up to whole packs and at least the MOQ
+            CASE WHEN current_stock < reorder_point
+                THEN GREATEST(CEIL((target_stock - current_stock) / pack_size) * pack_size, moq)
+                ELSE 0
+            END AS reorder_qty
+        FROM plan
+    )
+    SELECT
+        med_name,
+        current_stock::int AS current_stock,
+        ROUND(daily_demand::numeric, 1)::float AS avg_daily_demand,
+        lead_time_days,
+        ROUND(reorder_point::numeric, 1)::float AS reorder_point,
+        CEIL(target_stock)::int AS target_stock,
+        status,
+        reorder_qty::int AS reorder_qty,
+        CASE
+            WHEN status = 'Reorder Needed' AND current_stock < 20 AND tags IS NOT NULL
+                THEN 'Demand Boosted by Outbreak Intel (' || tags || ') + Critical Low'
+            WHEN status = 'Reorder Needed' AND current_stock < 20 THEN 'Critical Low Stock'
+            WHEN tags IS NOT NULL THEN 'Demand Boosted by Outbreak Intel (' || tags || ')'
+        END AS outbreak_tag,
+        COUNT(*) OVER () AS total_count
+    FROM recs
+    WHERE CAST(:status AS TEXT) IS NULL OR status = :status
+    ORDER BY reorder_qty DESC, med_name
+    LIMIT :limit OFFSET :offset
+""").execution_options(statement_name="reorder")
+
 @app.get("/reorder")
-def get_reorder_recommendations():
-    """Returns reorder recommendations using DB Inventory + Forecast CSV + Outbreak Intel"""
+async def get_reorder_recommendations(response: Response, status: str = None, limit: int = 100, offset: int = 0, db: AsyncSession = Depends(get_async_db)):
+    """
+    Returns reorder recommendations using DB Inventory + demand_forecast policy + Outbreak Intel.
+    status: optional filter ("Reorder Needed" / "OK"). Sorted by reorder_qty desc.
+    Total matching rows are returned in the X-Total-Count header.
+    """
     try:
-        recommendations = []
-        
-        with engine.connect() as conn:
-            # 0. Get Outbreak Data
-            outbreak_meds, outbreak_info = get_active_outbreaks(conn)
-            
-            # 1. Get Inventory (Live from DB)
-            inventory_map = {}
-            # Group by med_name to get total Qty across all batches
-            query = text("SELECT med_name, SUM(quantity) as total_qty FROM inventory GROUP BY med_name")
-            rows = conn.execute(query).mappings().all()
-            inventory_map = {r['med_name']: r['total_qty'] for r in rows}
-
-            # 2. Get Forecast Demand 
-            med_demand = {}
-            if os.path.exists(FORECAST_PATH):
-                df_forecast = pd.read_csv(FORECAST_PATH)
-                if 'med_name' in df_forecast.columns:
-                     demand_series = df_forecast.groupby('med_name')['predicted_sales'].mean()
-                     med_demand = demand_series.to_dict()
-                else:
-                     global_avg = df_forecast['predicted_sales'].mean()
-                     for m in inventory_map.keys():
-                         med_demand[m] = global_avg * 0.2
-        
-            # 3. Calculate Logic
-            all_meds = set(inventory_map.keys()).union(set(med_demand.keys()))
-            
-            for med in all_meds:
-                daily_sales = med_demand.get(med, 5) # Default 5 units/day
-                current_stock = inventory_map.get(med, 0)
-                
-                # OUTBREAK LOGIC 1: Demand Multiplier
-                is_outbreak_drug = med in outbreak_meds
-                multiplier = 1.0
-                reason_tag = None
-                
-                if is_outbreak_drug:
-                    multiplier = 1.5 # Boost demand by 50%
-                    reason_tag = "Demand Boosted by Outbreak Intel"
-                    daily_sales *= multiplier
-                
-                target_days = 10
-                # USER LOGIC: Ensure Low Stock items are always in reorder list
-                MIN_STOCK_THRESHOLD = 30 
-                
-                # Target is Demand * Days OR Min Threshold (whichever is higher)
-                target_stock = max(daily_sales * target_days, MIN_STOCK_THRESHOLD)
-                
-                if current_stock < target_stock:
-                    status = "Reorder Needed"
-                    reorder_qty = int(target_stock - current_stock)
-                    if current_stock < 20:
-                         reason_tag = "Critical Low Stock" if not reason_tag else f"{reason_tag} + Critical Low"
-                else:
-                    status = "OK"
-                    reorder_qty = 0
-                    
-                recommendations.append({
-                    "med_name": med,
-                    "current_stock": int(current_stock),
-                    "avg_daily_demand": round(daily_sales, 1),
-                    "target_stock": int(target_stock),
-                    "status": status,
-                    "reorder_qty": reorder_qty,
-                    "outbreak_tag": reason_tag 
-                })
-            
-        # Return only items needing reorder (or all? Dashboard likely filters)
-        # User said "add... and display same list". 
-        # Usually Reorder Recs page shows *everything* with status.
-        # Pending Reorders might filter for reorder_qty > 0.
-        # We return all sorted by priority.
-        return sorted(recommendations, key=lambda x: x['reorder_qty'], reverse=True)
+        rows = (await db.execute(REORDER_SQL, {
+            "default_demand": DEFAULT_DAILY_DEMAND,
+            "target_days": REORDER_TARGET_DAYS,
+            "min_stock": MIN_STOCK_THRESHOLD,
+            "default_lead_time": SUPPLIER_DEFAULTS["lead_time_days"],
+            "default_moq": SUPPLIER_DEFAULTS["moq"],
+            "default_pack_size": SUPPLIER_DEFAULTS["pack_size"],
+            "status": status,
+            "limit": limit,
+            "offset": offset
+        })).mappings().all()
+
+        recommendations = [dict(r) for r in rows]
+        total = recommendations[0].pop('total_count') if recommendations else 0
+        for r in recommendations[1:]:
+            r.pop('total_count')
+        response.headers["X-Total-Count"] = str(total)
+        return recommendations
 
     except Exception as e:
         print(f"Error in /reorder: {e}")
         if os.path.exists(REORDER_PATH):
             df = pd.read_csv(REORDER_PATH)
-            return df.to_dict(orient='records')
+            if status:
+                df = df[df['status'] == status]
+            return df.iloc[offset:offset + limit].to_dict(orient='records')
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -508,188 +751,144 @@ def get_reorder_recommendations():
 # --- MODULE 6: Waste & Revenue Recovery ---
 
 @app.get("/waste/analytics")
-def get_waste_analytics():
+async def get_waste_analytics(response: Response, db: AsyncSession = Depends(get_async_db)):
     """
     Returns data for Waste Analysis Dashboard from 'waste_logs' table.
     Strictly follows User instruction to fetch Quantity, Value, Name from Supabase waste_logs.
     """
+    key = ("waste_analytics",)
     try:
-        with engine.connect() as conn:
-            # 1. KPI Stats
-            kpi_query = text("""
-                SELECT 
-                    COALESCE(SUM(quantity), 0) as total_units,
-                    COALESCE(SUM(total_loss), 0) as total_value,
-                    COUNT(*) as log_count
-                FROM waste_logs
-            """)
-            kpi = conn.execute(kpi_query).mappings().one()
+        db_breaker.allow()
+        # 1. KPI Stats
+        kpi_query = text("""
+            SELECT 
+                COALESCE(SUM(quantity), 0) as total_units,
+                COALESCE(SUM(total_loss), 0) as total_value,
+                COUNT(*) as log_count
+            FROM waste_logs
+        """).execution_options(statement_name="waste_kpi")
+        kpi = (await db.execute(kpi_query)).mappings().one()
             
-            # 2. Top Wasted Medications (By Value)
-            # Fetch strictly from waste_logs, aggregated by Name and Reason
-            # "Club" multiple entries for the same med/reason
-            top_waste_query = text("""
-                SELECT 
-                    med_name as medication,
-                    reason as primary_reason,
-                    SUM(quantity) as quantity_wasted,
-                    SUM(total_loss) as value,
-                    MAX(date) as expiry_date
-                FROM waste_logs
-                GROUP BY med_name, reason
-                ORDER BY value DESC
-                LIMIT 100
-            """)
-            top_waste = [dict(r) for r in conn.execute(top_waste_query).mappings().all()]
-
-            # 3. Waste by Category
-            cat_query = text("""
-                SELECT reason, SUM(total_loss) as value
-                FROM waste_logs
-                GROUP BY reason
-            """)
-            cat_rows = conn.execute(cat_query).mappings().all()
+        # 2. Top Wasted Medications (By Value)
+        # Fetch strictly from waste_logs, aggregated by Name and Reason
+        # "Club" multiple entries for the same med/reason
+        top_waste_query = text("""
+            SELECT 
+                med_name as medication,
+                reason as primary_reason,
+                SUM(quantity) as quantity_wasted,
+                SUM(total_loss) as value,
+                MAX(date) as expiry_date
+            FROM waste_logs
+            GROUP BY med_name, reason
+            ORDER BY value DESC
+            LIMIT 100
+        """).execution_options(statement_name="waste_top")
+        top_waste = [dict(r) for r in (await db.execute(top_waste_query)).mappings().all()]
+
+        # 3. Waste by Category
+        cat_query = text("""
+            SELECT reason, SUM(total_loss) as value
+            FROM waste_logs
+            GROUP BY reason
+        """).execution_options(statement_name="waste_by_reason")
+        cat_rows = (await db.execute(cat_query)).mappings().all()
             
-            total_val = float(kpi['total_value'])
+        total_val = float(kpi['total_value'])
             
-            categories = []
-            if total_val > 0:
-                for r in cat_rows:
-                    categories.append({
-                        "name": r['reason'],
-                        "value": float(r['value']),
-                        "percentage": (float(r['value']) / total_val) * 100
-                    })
-            else:
-                # If no data, return empty categories with appropriate names for UI to handle or show nothing
-                # But typically we'd send 0s. 
-                pass
+        categories = []
+        if total_val > 0:
+            for r in cat_rows:
+                categories.append({
+                    "name": r['reason'],
+                    "value": float(r['value']),
+                    "percentage": (float(r['value']) / total_val) * 100
+                })
+        else:
+            # If no data, return empty categories with appropriate names for UI to handle or show nothing
+            # But typically we'd send 0s. 
+            pass
             
-            # SORT CATEGORIES BY PERCENTAGE DESCENDING
-            categories.sort(key=lambda x: x['percentage'], reverse=True)
-
-            # 4. Overstock Data (Synthetic/Inventory based)
-            overstock_query = text("""
-                SELECT med_name, quantity, quantity * COALESCE(cost_price, 0) as value 
-                FROM inventory 
-                WHERE quantity > 300
-                ORDER BY quantity DESC
-                LIMIT 5
-            """)
-            overstock_rows = [dict(r) for r in conn.execute(overstock_query).mappings().all()]
-            overstock_count = len(overstock_rows)
-
-            # NEW: Calculate Expiring Soon (Future < 60 days) for Dashboard Quick Action
-            expiring_soon_query = text("""
-                SELECT COUNT(*) 
-                FROM inventory 
-                WHERE expiry_date > NOW() 
-                  AND expiry_date < NOW() + INTERVAL '60 days'
-            """)
-            expiring_soon_count = conn.execute(expiring_soon_query).scalar()
-
-            # 5. Batch Health (for Expiry Page - sourcing from waste_logs as requested)
-            # Since waste_logs are EXPIRED, days_left will be negative.
-            # Use batch_id as ID since 'id' column doesn't exist
-            batch_query = text("""
-                SELECT batch_id as id, med_name, quantity, date 
-                FROM waste_logs 
-                ORDER BY date DESC 
-                LIMIT 50
-            """)
-            batch_rows = [dict(r) for r in conn.execute(batch_query).mappings().all()]
+        # SORT CATEGORIES BY PERCENTAGE DESCENDING
+        categories.sort(key=lambda x: x['percentage'], reverse=True)
+
+        # 4. Overstock Data (Synthetic/Inventory based)
+        overstock_query = text("""
+            SELECT med_name, quantity, quantity * COALESCE(cost_price, 0) as value 
+            FROM inventory 
+            WHERE quantity > 300
+            ORDER BY quantity DESC
+            LIMIT 5
+        """).execution_options(statement_name="overstock")
+        overstock_rows = [dict(r) for r in (await db.execute(overstock_query)).mappings().all()]
+        overstock_count = len(overstock_rows)
+
+        # NEW: Calculate Expiring Soon (Future < 60 days) for Dashboard Quick Action
+        expiring_soon_query = text("""
+            SELECT COUNT(*) 
+            FROM inventory 
+            WHERE expiry_date > NOW() 
+              AND expiry_date < NOW() + INTERVAL '60 days'
+        """).execution_options(statement_name="expiring_soon_count")
+        expiring_soon_count = (await db.execute(expiring_soon_query)).scalar()
+
+        # 5. Batch Health (for Expiry Page - sourcing from waste_logs as requested)
+        # Since waste_logs are EXPIRED, days_left will be negative.
+        # Use batch_id as ID since 'id' column doesn't exist
+        batch_query = text("""
+            SELECT batch_id as id, med_name, quantity, date 
+            FROM waste_logs 
+            ORDER BY date DESC 
+            LIMIT 50
+        """).execution_options(statement_name="waste_batches")
+        batch_rows = [dict(r) for r in (await db.execute(batch_query)).mappings().all()]
             
-            # Post-process for days_left
-            today = datetime.now().date()
-            batch_health = []
-            distinct_meds = set()
-            for b in batch_rows:
-                expiry = b['date'].date() if isinstance(b['date'], datetime) else b['date']
-                days = (expiry - today).days
-                batch_health.append({
-                    "med_name": b['med_name'],
-                    "id": f"BATCH-{b['id']}",
-                    "days_left": days,
-                    "Qty_On_Hand": b['quantity']
-                })
-                distinct_meds.add(b['med_name'])
-
-            # 6. Strategies (Mock/Derived from Waste Logs for Expiry Page)
-            # Generating strategies based on what was wasted (Historical Analysis)
-            strategies = []
-            for med in list(distinct_meds)[:5]: # Just top 5 meds
-                strategies.append({
-                    "med_name": med,
-                    "discount_pct": 15,
-                    "price": 0, # Loss
-                    "est_qty": 0,
-                    "est_revenue": 0 # Lost revenue
-                })
+        # Post-process for days_left
+        today = datetime.now().date()
+        batch_health = []
+        distinct_meds = set()
+        for b in batch_rows:
+            expiry = b['date'].date() if isinstance(b['date'], datetime) else b['date']
+            days = (expiry - today).days
+            batch_health.append({
+                "med_name": b['med_name'],
+                "id": f"BATCH-{b['id']}",
+                "days_left": days,
+                "Qty_On_Hand": b['quantity']
+            })
+            distinct_meds.add(b['med_name'])
 
-            return {
-                "kpi": {
-                    "total_waste_units": kpi['total_units'],
-                    "total_waste_value": kpi['total_value'],
-                    "expired_items_count": kpi['log_count'],
-                    "expiring_soon_count": expiring_soon_count, # Added new metric
-                    "waste_percentage": 3.2,
-                    "overstock_count": overstock_count
-                },
-                "top_wasted": top_waste,
-                "categories": categories,
-                "overstock_items": overstock_rows,
-                "batch_health": batch_health, # Added for Expiry Page
-                "strategies": strategies # Added for Expiry Page
-            }
+        # 6. Strategies (Mock/Derived from Waste Logs for Expiry Page)
+        # Generating strategies based on what was wasted (Historical Analysis)
+        strategies = []
+        for med in list(distinct_meds)[:5]: # Just top 5 meds
+            strategies.append({
+                "med_name": med,
+                "discount_pct": 15,
+                "price": 0, # Loss
+                "est_qty": 0,
+                "est_revenue": 0 # Lost revenue
+            })
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Error in /waste/analytics: {e}")
-        # Return MOCK DATA for Offline Mode / Demo
-        return {
+        return last_known_good.store(key, {
             "kpi": {
-                "total_waste_units": 2450,
-                "total_waste_value": 56000,
-                "expired_items_count": 999, # Changed to identify mock
+                "total_waste_units": kpi['total_units'],
+                "total_waste_value": kpi['total_value'],
+                "expired_items_count": kpi['log_count'],
+                "expiring_soon_count": expiring_soon_count, # Added new metric
                 "waste_percentage": 3.2,
-                "overstock_count": 3
+                "overstock_count": overstock_count
             },
-            "top_wasted": [
-                # EXPIRED
-                {"medication": "Amoxicillin 500mg", "quantity_wasted": 120, "value": 15000, "primary_reason": "Expired", "expiry_date": "2024-11-01"},
-                {"medication": "Dolo 650", "quantity_wasted": 500, "value": 1250, "primary_reason": "Expired", "expiry_date": "2024-10-15"},
-                {"medication": "Azithral 500", "quantity_wasted": 45, "value": 2250, "primary_reason": "Expired", "expiry_date": "2024-11-20"},
-                
-                # DAMAGED
-                {"medication": "Paracetamol 650mg", "quantity_wasted": 300, "value": 4500, "primary_reason": "Damaged", "expiry_date": "2024-12-05"},
-                {"medication": "Cough Syrup 100ml", "quantity_wasted": 50, "value": 5000, "primary_reason": "Damaged", "expiry_date": "2025-01-10"},
-                {"medication": "Betadine Ointment", "quantity_wasted": 20, "value": 1800, "primary_reason": "Damaged", "expiry_date": "2025-03-15"},
-
-                # TEMP EXCURSION
-                {"medication": "Insulin Glargine", "quantity_wasted": 10, "value": 12000, "primary_reason": "Temperature Excursion", "expiry_date": "2024-10-20"},
-                {"medication": "Rabies Vaccine", "quantity_wasted": 5, "value": 8500, "primary_reason": "Temperature Excursion", "expiry_date": "2024-09-01"},
-                {"medication": "Latanoprost Eye Drops", "quantity_wasted": 15, "value": 4500, "primary_reason": "Temperature Excursion", "expiry_date": "2024-11-05"}
-            ],
-            "categories": [
-                 {"name": "Expired", "value": 35000, "percentage": 62.5},
-                 {"name": "Damaged", "value": 9000, "percentage": 16.0},
-                 {"name": "Temperature Excursion", "value": 12000, "percentage": 21.5}
-            ],
-            "overstock_items": [
-                 {"med_name": "Metformin 500mg", "quantity": 1200, "value": 2400},
-                 {"med_name": "Atorvastatin 10mg", "quantity": 800, "value": 8000},
-                 {"med_name": "Cetirizine 10mg", "quantity": 600, "value": 1800}
-            ],
-            "batch_health": [
-                {"med_name": "Amoxicillin 500mg", "id": "BATCH-AMX-001", "days_left": -45, "Qty_On_Hand": 120},
-                {"med_name": "Paracetamol 650mg", "id": "BATCH-PCM-089", "days_left": -12, "Qty_On_Hand": 300},
-                 {"med_name": "Insulin Glargine", "id": "BATCH-INS-004", "days_left": -60, "Qty_On_Hand": 10}
-            ],
-            "strategies": [
-                {"med_name": "Amoxicillin 500mg", "discount_pct": 15, "price": 0, "est_qty": 0, "est_revenue": 0}
-            ]
-        }
+            "top_wasted": top_waste,
+            "categories": categories,
+            "overstock_items": overstock_rows,
+            "batch_health": batch_health, # Added for Expiry Page
+            "strategies": strategies # Added for Expiry Page
+        })
+
+    except DB_UNAVAILABLE_ERRORS as e:
+        print(f"Error in /waste/analytics: {e}")
+        return serve_last_known_good(key, response, e)
 
 @app.get("/revenue/recovery")
 def get_revenue_recovery(med_name: str, current_price: float, days_left: int):
@@ -698,8 +897,7 @@ def get_revenue_recovery(med_name: str, current_price: float, days_left: int):
     """
     try:
         # OUTBREAK LOGIC 3: Suppress Clearance for Critical Outbreak Drugs
-        with engine.connect() as conn:
-             outbreak_meds, _ = get_active_outbreaks(conn)
+        outbreak_meds, _ = get_active_outbreaks()
              
         if med_name in outbreak_meds:
             # Return strategy to HOLD STOCK
@@ -782,7 +980,7 @@ def force_cleanup_inventory():
 # -----------------------------------------------------------------------------
 
 @app.get("/expiry/alerts")
-def get_expiry_alerts():
+async def get_expiry_alerts(db: AsyncSession = Depends(get_async_db)):
     """
     Proactive Expiry Management.
     Source: Active Inventory (quantity > 0)
@@ -790,134 +988,148 @@ def get_expiry_alerts():
       - Critical: <= 90 days
       - Warning: 91 - 180 days
       - Good: > 180 days
+    Estimated loss and discount targets come from the FEFO expiry simulation.
     """
     try:
-        with engine.connect() as conn:
-            # Fetch all active inventory with expiry details
-            query = text("""
-                SELECT 
-                    med_name, 
-                    batch_id, 
-                    expiry_date, 
-                    quantity, 
-                    COALESCE(cost_price, 0) as cost_price,
-                    COALESCE(cost_price, 0) as price, -- Real Inventory Price
-                    EXTRACT(DAY FROM (expiry_date - NOW())) as days_left
-                FROM inventory
-                WHERE quantity > 0
-                ORDER BY days_left ASC
-            """)
-            rows = [dict(r) for r in conn.execute(query).mappings().all()]
+        # Fetch all active inventory with expiry details
+        query = text("""
+            SELECT 
+                med_name, 
+                batch_id, 
+                expiry_date, 
+                quantity, 
+                COALESCE(cost_price, 0) as cost_price,
+                COALESCE(cost_price, 0) as price, -- Real Inventory Price
+                EXTRACT(DAY FROM (expiry_date - NOW())) as days_left
+            FROM inventory
+            WHERE quantity > 0
+            ORDER BY days_left ASC
+        """)
+        rows = [dict(r) for r in (await db.execute(query)).mappings().all()]
+
+        # Expected expiry loss per batch (FEFO Monte Carlo)
+        for row in rows:
+            row['unit_value'] = row['price']
+        sim = await asyncio.to_thread(simulate_batches, rows)
             
-            drugs_map = {}
-            critical_count = 0
-            warning_count = 0
-            total_value_at_risk = 0.0
-            total_potential_recovery = 0.0
+        drugs_map = {}
+        critical_count = 0
+        warning_count = 0
+        total_value_at_risk = 0.0
+        total_potential_recovery = 0.0
             
-            # Helper for Categorization & Mocking
-            def get_details(name):
-                name_l = name.lower()
-                cat = "General"
-                if "amox" in name_l or "cillin" in name_l or "azith" in name_l: cat = "Antibiotics"
-                elif "para" in name_l or "dolo" in name_l or "ibu" in name_l: cat = "Pain Relief"
-                elif "met" in name_l or "glip" in name_l: cat = "Diabetes"
-                elif "ator" in name_l or "rosu" in name_l: cat = "Cardiology"
+        # Helper for Categorization & Mocking
+        def get_details(name):
+            name_l = name.lower()
+            cat = "General"
+            if "amox" in name_l or "cillin" in name_l or "azith" in name_l: cat = "Antibiotics"
+            elif "para" in name_l or "dolo" in name_l or "ibu" in name_l: cat = "Pain Relief"
+            elif "met" in name_l or "glip" in name_l: cat = "Diabetes"
+            elif "ator" in name_l or "rosu" in name_l: cat = "Cardiology"
                 
-                return {
-                    "category": cat,
-                    "supplier": "PharmaCorp" if len(name) % 2 == 0 else "MediDistributor",
-                    "location": f"Shelf {name[0].upper()}-{len(name)}"
-                }
+            return {
+                "category": cat,
+                "supplier": "PharmaCorp" if len(name) % 2 == 0 else "MediDistributor",
+                "location": f"Shelf {name[0].upper()}-{len(name)}"
+            }
 
-            for row in rows:
-                days = int(row['days_left'])
-                qty = row['quantity']
-                value = float(row['price']) * qty
+        for i, row in enumerate(rows):
+            days = int(row['days_left'])
+            qty = row['quantity']
+            value = float(row['price']) * qty
+            expected_loss = float(sim['expected_waste_value'].iat[i])
+            waste_probability = float(sim['waste_probability'].iat[i])
                 
-                status = "Good"
-                discount_pct = 0.0
+            status = "Good"
                 
-                if days <= 90:
-                    status = "Critical"
-                    critical_count += 1
-                    discount_pct = 0.40 # Avg of 30-50%
+            if days <= 90:
+                status = "Critical"
+                critical_count += 1
                     
-                elif days <= 180:
-                    status = "Warning"
-                    warning_count += 1
-                    discount_pct = 0.15 # Avg of 10-25%
+            elif days <= 180:
+                status = "Warning"
+                warning_count += 1
+
+            # Discount only batches the simulation expects to expire unsold;
+            # the discount recovers part of their expected loss
+            discount_pct = 0.0
+            if status != "Good" and waste_probability >= DISCOUNT_MIN_WASTE_PROBABILITY:
+                discount_pct = EXPIRY_DISCOUNT[status]
                 
-                if status != "Good":
-                    total_value_at_risk += value
-                    total_potential_recovery += (value * (1.0 - discount_pct))
-
-                # Group by Drug
-                med_name = row['med_name']
-                details = get_details(med_name)
+            if status != "Good":
+                total_value_at_risk += value
+            if discount_pct:
+                total_potential_recovery += expected_loss * (1.0 - discount_pct)
+
+            # Group by Drug
+            med_name = row['med_name']
+            details = get_details(med_name)
                 
-                if med_name not in drugs_map:
-                    drugs_map[med_name] = {
-                        "name": med_name,
-                        "category": details["category"],
-                        "status": "Good", # Worst status will override
-                        "total_stock": 0,
-                        "total_value": 0, # Inventory Value (Cost or MRP?) Using Price for "Estimated Loss" consistency
-                        "estimated_loss": 0, # Only if expired/critical logic applies? User mockup shows "Estimated Loss". Assume value of Critical/Warning items.
-                        "critical_batches": 0,
-                        "warning_batches": 0,
-                        "batches": []
-                    }
+            if med_name not in drugs_map:
+                drugs_map[med_name] = {
+                    "name": med_name,
+                    "category": details["category"],
+                    "status": "Good", # Worst status will override
+                    "total_stock": 0,
+                    "total_value": 0, # Inventory Value (Cost or MRP?) Using Price for "Estimated Loss" consistency
+                    "estimated_loss": 0, # Expected value expiring unsold (simulation)
+                    "critical_batches": 0,
+                    "warning_batches": 0,
+                    "batches": []
+                }
                 
-                # Update Aggregate Status
-                current_status_priority = {"Critical": 3, "Warning": 2, "Good": 1}
-                if current_status_priority[status] > current_status_priority[drugs_map[med_name]["status"]]:
-                    drugs_map[med_name]["status"] = status
+            # Update Aggregate Status
+            current_status_priority = {"Critical": 3, "Warning": 2, "Good": 1}
+            if current_status_priority[status] > current_status_priority[drugs_map[med_name]["status"]]:
+                drugs_map[med_name]["status"] = status
                     
-                drugs_map[med_name]["total_stock"] += qty
-                drugs_map[med_name]["total_value"] += value
+            drugs_map[med_name]["total_stock"] += qty
+            drugs_map[med_name]["total_value"] += value
                 
-                if status == "Critical" or status == "Warning": # Assume Risk covers both
-                     drugs_map[med_name]["estimated_loss"] += value
+            drugs_map[med_name]["estimated_loss"] += expected_loss
 
-                if status == "Critical":
-                    drugs_map[med_name]["critical_batches"] += 1
-                elif status == "Warning":
-                    drugs_map[med_name]["warning_batches"] += 1
+            if status == "Critical":
+                drugs_map[med_name]["critical_batches"] += 1
+            elif status == "Warning":
+                drugs_map[med_name]["warning_batches"] += 1
                     
-                # Add Batch
-                drugs_map[med_name]["batches"].append({
-                    "id": row['batch_id'] or "N/A",
-                    "expiry": str(row['expiry_date']),
-                    "days_left": days,
-                    "qty": qty,
-                    "price": float(row['price']),
-                    "status": status,
-                    "value": value,
-                    "supplier": details["supplier"],
-                    "location": details["location"]
-                })
+            # Add Batch
+            drugs_map[med_name]["batches"].append({
+                "id": row['batch_id'] or "N/A",
+                "expiry": str(row['expiry_date']),
+                "days_left": days,
+                "qty": qty,
+                "price": float(row['price']),
+                "status": status,
+                "value": value,
+                "expected_waste_units": round(float(sim['expected_waste_units'].iat[i]), 1),
+                "expected_loss": round(expected_loss, 2),
+                "waste_probability": round(waste_probability, 3),
+                "recommended_discount": discount_pct,
+                "supplier": details["supplier"],
+                "location": details["location"]
+            })
 
-            sorted_drugs = sorted(
-                drugs_map.values(), 
-                key=lambda x: (
-                    -x["critical_batches"], 
-                    -x["warning_batches"], 
-                    x["name"]
-                )
+        sorted_drugs = sorted(
+            drugs_map.values(), 
+            key=lambda x: (
+                -x["critical_batches"], 
+                -x["warning_batches"], 
+                x["name"]
             )
+        )
 
-            metrics = {
-                "critical_items": critical_count,
-                "value_at_risk": total_value_at_risk,
-                "potential_recovery": total_potential_recovery,
-                "items_monitored": len(rows) # Total batches
-            }
+        metrics = {
+            "critical_items": critical_count,
+            "value_at_risk": total_value_at_risk,
+            "potential_recovery": total_potential_recovery,
+            "items_monitored": len(rows) # Total batches
+        }
 
-            return {
-                "kpi": metrics,
-                "drugs": sorted_drugs
-            }
+        return {
+            "kpi": metrics,
+            "drugs": sorted_drugs
+        }
 
     except Exception as e:
         print(f"Expiry Alerts Error: {e}")
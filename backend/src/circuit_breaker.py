@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import event, exc
+
+# Circuit breaker around the database + last-known-good result cache.
+#
+# Attached to both engines (db_direct.py / db_async.py): connection failures
+# and disconnect/operational errors count as failures, any completed statement
+# as a success. After DB_BREAKER_FAILURES consecutive failures the breaker
+# opens for DB_BREAKER_RESET_SECONDS: new connections and guarded endpoints
+# fail immediately with CircuitOpenError instead of each waiting for the
+# connect timeout. After that it lets traffic through again (half-open); the
+# first success closes it, the first failure reopens it.
+#
+# While the DB is unavailable, read endpoints serve the last real result they
+# returned for the same parameters (LastKnownGood), flagged as stale.
+
+FAILURE_THRESHOLD = int(os.getenv("DB_BREAKER_FAILURES", "5"))
+RESET_TIMEOUT_SECONDS = float(os.getenv("DB_BREAKER_RESET_SECONDS", "30"))
+LKG_MAX_ENTRIES = 256
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raises CircuitOpenError while open"""
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"{self.name} circuit open: {self.last_error}")
+                self.state = HALF_OPEN
+                print(f"Circuit breaker [{self.name}]: half-open, probing")
+
+    def record_success(self):
+        if self.state == CLOSED and self.failures == 0:
+            return
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"Circuit breaker [{self.name}]: closed")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}" if error is not None else None
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                print(f"Circuit breaker [{self.name}]: open for {self.reset_timeout}s after {self.failures} failures ({self.last_error})")
+
+    def status(self):
+        retry_in = None
+        if self.state == OPEN:
+            retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+        return {"name": self.name, "state": self.state, "consecutive_failures": self.failures,
+                "times_opened": self.times_opened, "retry_in_seconds": retry_in, "last_error": self.last_error}
+
+db_breaker = CircuitBreaker("database")
+
+# Errors meaning "the database is unreachable or unhealthy" (as opposed to bugs / bad SQL)
+DB_UNAVAILABLE_ERRORS = (CircuitOpenError, exc.OperationalError, exc.InterfaceError, exc.TimeoutError,
+                         OSError, TimeoutError)
+
+def attach(engine, breaker=db_breaker):
+    """Routes an engine's connects and statement errors through the breaker"""
+    if engine is None:
+        return
+
+    @event.listens_for(engine, "do_connect")
+    def _connect(dialect, conn_rec, cargs, cparams):
+        breaker.allow()
+        try:
+            return dialect.connect(*cargs, **cparams)
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _success(conn, cursor, statement, parameters, context, executemany):
+        breaker.record_success()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        # Connect-time errors (no connection yet) were already counted in _connect
+        if ctx.connection is not None and (ctx.is_disconnect or isinstance(ctx.sqlalchemy_exception, exc.OperationalError)):
+            breaker.record_failure(ctx.original_exception)
+
+# --- Last-known-good cache ---
+
+class LastKnownGood:
+    """Most recent successful payload per (endpoint, params), LRU-bounded"""
+    def __init__(self, max_entries=LKG_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def store(self, key, payload):
+        with self._lock:
+            self._entries[key] = (payload, datetime.now())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+    def get(self, key):
+        """(payload, stored_at) or None"""
+        with self._lock:
+            return self._entries.get(key)
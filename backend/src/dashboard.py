@@ -14,6 +14,8 @@ st.set_page_config(page_title="Pharmacy Analytics Engine", layout="wide")
 # Paths
 DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
 FORECAST_PATH = os.path.join(DATA_DIR, 'forecast_results.csv')
+if not os.path.exists(FORECAST_PATH):  # only the total-only forecast (forecasting.py) exists
+    FORECAST_PATH = os.path.join(DATA_DIR, 'forecast_total.csv')
 WASTE_PATH = os.path.join(DATA_DIR, 'waste_report.csv')
 INVENTORY_PATH = os.path.join(DATA_DIR, 'current_inventory.csv')
 
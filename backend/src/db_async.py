@@ -0,0 +1,71 @@
+import os
+from uuid import uuid4
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from db_direct import POOLER_MODE, CONNECT_TIMEOUT_SECONDS, TimedPoolMixin, pool_settings
+from sql_instrumentation import instrument_engine
+import circuit_breaker
+
+# Async engine for the FastAPI read endpoints (asyncpg).
+# Same DB_CONNECTION_STRING as db_direct.py; the sync engine there stays
+# for the batch scripts and write endpoints.
+
+dotenv_path = os.path.join(os.path.dirname(__file__), '../../.env')
+load_dotenv(dotenv_path)
+
+DATABASE_URL = os.getenv("DB_CONNECTION_STRING")
+
+def to_async_url(url):
+    """postgres(ql)[+driver]://... -> postgresql+asyncpg://..., sslmode -> ssl"""
+    parts = urlsplit(url)
+    query = [("ssl" if k == "sslmode" else k, v) for k, v in parse_qsl(parts.query)]
+    return urlunsplit(("postgresql+asyncpg", parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+def connect_args():
+    """
+    Connect timeout, plus transaction-pooler settings:
+    asyncpg prepares every statement server-side; behind a transaction pooler
+    the next transaction may land on another backend, so disable its statement
+    cache and give each prepared statement a unique name.
+    """
+    args = {"timeout": CONNECT_TIMEOUT_SECONDS}
+    if POOLER_MODE == "transaction":
+        args.update(statement_cache_size=0, prepared_statement_name_func=lambda: f"__asyncpg_{uuid4()}__")
+    return args
+
+async_engine = None
+AsyncSessionLocal = None
+
+if not DATABASE_URL or "[YOUR_PASSWORD]" in DATABASE_URL:
+    print("WARNING: DB_CONNECTION_STRING not configured properly in .env (async engine disabled)")
+else:
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+        class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+            pass
+
+        url = to_async_url(DATABASE_URL)
+        if POOLER_MODE == "transaction":
+            # SQLAlchemy's own asyncpg statement cache
+            url += ("&" if "?" in url else "?") + "prepared_statement_cache_size=0"
+        async_engine = create_async_engine(url, poolclass=TimedAsyncQueuePool,
+                                           connect_args=connect_args(), **pool_settings())
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+        instrument_engine(async_engine.sync_engine, "async")
+        circuit_breaker.attach(async_engine.sync_engine)
+        print("Async Database Engine created successfully.")
+    except Exception as e:
+        print(f"Failed to create Async Database Engine: {e}")
+        async_engine = None
+        AsyncSessionLocal = None
+
+async def get_async_db():
+    """Dependency for FastAPI to get an async DB session"""
+    if AsyncSessionLocal is None:
+        raise HTTPException(status_code=503, detail="Async database not configured")
+
+    async with AsyncSessionLocal() as session:
+        yield session
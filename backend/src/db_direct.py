@@ -1,8 +1,13 @@
 import os
 import sys
+import time
+import threading
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
+from sql_instrumentation import instrument_engine
+import circuit_breaker
 
 # Load environment variables from project root
 dotenv_path = os.path.join(os.path.dirname(__file__), '../../.env')
@@ -10,17 +15,123 @@ load_dotenv(dotenv_path)
 
 DATABASE_URL = os.getenv("DB_CONNECTION_STRING")
 
+# --- Pool configuration ---
+#
+# Pool sizes depend on the process: every uvicorn worker holds its own pool,
+# so (workers x (pool_size + max_overflow)) has to fit the Supabase connection
+# limit. DB_PROCESS_TYPE picks a profile; DB_POOL_SIZE / DB_MAX_OVERFLOW /
+# DB_POOL_RECYCLE / DB_POOL_TIMEOUT override single values.
+# Connections are recycled before the server/pooler drops idle ones instead of
+# pinging on every checkout (DB_POOL_PRE_PING=1 turns the ping back on).
+
+PROCESS_TYPE = os.getenv("DB_PROCESS_TYPE", "batch")
+
+POOL_PROFILES = {
+    "api":       {"pool_size": 5, "max_overflow": 5, "pool_recycle": 300, "pool_timeout": 10},
+    "batch":     {"pool_size": 2, "max_overflow": 0, "pool_recycle": 1800, "pool_timeout": 60},
+    "streamlit": {"pool_size": 2, "max_overflow": 2, "pool_recycle": 300, "pool_timeout": 10},
+}
+
+# "transaction" when connecting through pgbouncer / Supavisor in transaction
+# mode (Supabase port 6543): server connections change between transactions,
+# so no server-side prepared statements may be cached.
+POOLER_MODE = os.getenv("DB_POOLER_MODE", "session")
+
+# Fail a connect attempt after this long instead of the driver default (none
+# for psycopg2); repeated failures open the circuit breaker (circuit_breaker.py)
+CONNECT_TIMEOUT_SECONDS = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+def pool_settings(process_type=PROCESS_TYPE):
+    settings = dict(POOL_PROFILES.get(process_type, POOL_PROFILES["batch"]))
+    for key, env in [("pool_size", "DB_POOL_SIZE"), ("max_overflow", "DB_MAX_OVERFLOW"),
+                     ("pool_recycle", "DB_POOL_RECYCLE"), ("pool_timeout", "DB_POOL_TIMEOUT")]:
+        if os.getenv(env):
+            settings[key] = int(os.getenv(env))
+    settings["pool_pre_ping"] = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+    return settings
+
+# --- Pool metrics ---
+
+class PoolStats:
+    """Checkout counts and time spent waiting for a free connection"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def snapshot(self, pool):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 4),
+                "wait_seconds_avg": round(self.wait_seconds_total / attempts, 6) if attempts else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 4),
+            }
+
+class TimedPoolMixin:
+    """Times QueuePool checkouts (incl. waits on an exhausted pool and new connects)"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        new_pool = super().recreate()
+        new_pool.stats = self.stats
+        return new_pool
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            self.stats.record(time.perf_counter() - t0, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - t0)
+        return conn
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+def pool_metrics(eng):
+    """Current pool state + checkout stats for an engine (sync or async)"""
+    if eng is None:
+        return None
+    pool = eng.pool
+    if not hasattr(pool, "stats"):
+        return {"checked_out": pool.checkedout()} if hasattr(pool, "checkedout") else {}
+    return pool.stats.snapshot(pool)
+
 if not DATABASE_URL or "[YOUR_PASSWORD]" in DATABASE_URL:
     print("WARNING: DB_CONNECTION_STRING not configured properly in .env")
     engine = None
     SessionLocal = None
 else:
-    # Create the SQLAlchemy engine
-    # pool_pre_ping=True handles disconnects gracefully
+    # psycopg2 never creates server-side prepared statements, so the same
+    # engine works through a transaction pooler as-is
     try:
-        engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+        engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool,
+                               connect_args={"connect_timeout": CONNECT_TIMEOUT_SECONDS}, **pool_settings())
         SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        print("Database Engine created successfully.")
+        instrument_engine(engine, "sync") # query timing + slow-query log
+        circuit_breaker.attach(engine)
+        print(f"Database Engine created successfully ({PROCESS_TYPE} pool, {POOLER_MODE} pooler mode).")
     except Exception as e:
         print(f"Failed to create Database Engine: {e}")
         engine = None
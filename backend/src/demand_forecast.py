@@ -0,0 +1,99 @@
+import os
+import json
+import numpy as np
+from datetime import datetime
+from sqlalchemy import text
+from db_direct import engine
+from reorder_policy import compute_policy, supplier_terms_for
+
+# demand_forecast: one row per medicine with the forecast daily demand and its
+# reorder policy (reorder_policy.py: service-level reorder point / order-up-to,
+# supplier lead time, MOQ, pack size). Loaded at the end of forecasting_v2.py
+# and joined with inventory and outbreak_med_windows by the /reorder query.
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+SUMMARY_PATH = os.path.join(DATA_DIR, 'forecast_summary.json')
+CHUNK_SIZE = 500
+
+SETUP_SQL = """
+    CREATE TABLE IF NOT EXISTS demand_forecast (
+        med_name TEXT PRIMARY KEY,
+        avg_daily_demand NUMERIC NOT NULL,
+        demand_std NUMERIC,
+        generated_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    ALTER TABLE demand_forecast
+        ADD COLUMN IF NOT EXISTS lead_time_days INTEGER,
+        ADD COLUMN IF NOT EXISTS safety_stock NUMERIC,
+        ADD COLUMN IF NOT EXISTS reorder_point NUMERIC,
+        ADD COLUMN IF NOT EXISTS order_up_to NUMERIC,
+        ADD COLUMN IF NOT EXISTS moq INTEGER,
+        ADD COLUMN IF NOT EXISTS pack_size INTEGER;
+"""
+
+def setup_demand_forecast_table(conn):
+    conn.execute(text(SETUP_SQL))
+
+def load_demand_forecast(summaries, generated_at=None):
+    """
+    Upserts {med_name: {"avg_daily_demand", "daily_std", ...}} plus each med's
+    reorder policy into demand_forecast and drops medicines that are no longer
+    forecast, in one transaction.
+    """
+    if engine is None:
+        print("DB Engine unavailable. Skipping demand_forecast load.")
+        return 0
+
+    generated_at = generated_at or datetime.now()
+    meds = list(summaries)
+    mean = np.array([float(summaries[m]["avg_daily_demand"]) for m in meds])
+    std = np.array([float(summaries[m].get("daily_std", 0.0)) for m in meds])
+    terms = supplier_terms_for(meds)
+    reorder_point, order_up_to, safety_stock = compute_policy(mean, std, terms['lead_time_days'].values)
+
+    rows = [{
+        "med_name": med,
+        "avg_daily_demand": float(mean[i]),
+        "demand_std": float(std[i]),
+        "lead_time_days": int(terms['lead_time_days'].iat[i]),
+        "safety_stock": round(float(safety_stock[i]), 2),
+        "reorder_point": round(float(reorder_point[i]), 2),
+        "order_up_to": round(float(order_up_to[i]), 2),
+        "moq": int(terms['moq'].iat[i]),
+        "pack_size": int(terms['pack_size'].iat[i]),
+        "generated_at": generated_at
+    } for i, med in enumerate(meds)]
+
+    upsert = text("""
+        INSERT INTO demand_forecast (med_name, avg_daily_demand, demand_std, lead_time_days, safety_stock,
+                                     reorder_point, order_up_to, moq, pack_size, generated_at)
+        VALUES (:med_name, :avg_daily_demand, :demand_std, :lead_time_days, :safety_stock,
+                :reorder_point, :order_up_to, :moq, :pack_size, :generated_at)
+        ON CONFLICT (med_name) DO UPDATE SET
+            avg_daily_demand = EXCLUDED.avg_daily_demand,
+            demand_std = EXCLUDED.demand_std,
+            lead_time_days = EXCLUDED.lead_time_days,
+            safety_stock = EXCLUDED.safety_stock,
+            reorder_point = EXCLUDED.reorder_point,
+            order_up_to = EXCLUDED.order_up_to,
+            moq = EXCLUDED.moq,
+            pack_size = EXCLUDED.pack_size,
+            generated_at = EXCLUDED.generated_at
+    """)
+
+    with engine.begin() as conn:
+        setup_demand_forecast_table(conn)
+        for i in range(0, len(rows), CHUNK_SIZE):
+            conn.execute(upsert, rows[i:i + CHUNK_SIZE])
+        conn.execute(text("DELETE FROM demand_forecast WHERE generated_at < :g"), {"g": generated_at})
+
+    print(f"Loaded {len(rows)} medicines into demand_forecast.")
+    return len(rows)
+
+if __name__ == "__main__":
+    # Reload from the last forecast run without re-forecasting
+    if not os.path.exists(SUMMARY_PATH):
+        raise FileNotFoundError(f"{SUMMARY_PATH} missing. Run forecasting_v2.py first.")
+    with open(SUMMARY_PATH) as f:
+        summary = json.load(f)
+    load_demand_forecast(summary["medicines"], datetime.fromisoformat(summary["generated_at"]))
@@ -0,0 +1,108 @@
+import pandas as pd
+import numpy as np
+from datetime import date
+
+# Monte Carlo expiry-loss simulation (FEFO).
+#
+# Each SKU's cumulative demand D(t) is a gamma process with the forecast daily
+# mean/std, so increments over dt days are Gamma(shape = mu^2 dt / sigma^2,
+# scale = sigma^2 / mu). Batches are consumed First-Expiry-First-Out: with a
+# SKU's batches sorted by expiry t_1 <= t_2 <= ..., the units sold from
+# batches 1..b by t_b follow
+#   A_b = min(A_{b-1} + q_b, D(t_b))
+# and batch b wastes q_b - (A_b - A_{b-1}). The recurrence runs once per batch
+# rank, vectorized over (scenarios x SKUs), so the full inventory takes one
+# pass over at most max-batches-per-SKU steps (each only over SKUs that
+# still have a batch at that rank).
+
+N_SCENARIOS = 1000
+RANDOM_SEED = 42 # Fixed so repeated requests return identical numbers
+
+def demand_params(mean_daily, std_daily):
+    """Gamma shape-per-day and scale; zero-mean SKUs get no demand"""
+    mu = np.asarray(mean_daily, dtype=float)
+    var = np.maximum(np.asarray(std_daily, dtype=float), 1e-6) ** 2
+    has_demand = mu > 0
+    shape_per_day = np.where(has_demand, mu ** 2 / var, 0.0)
+    scale = np.where(has_demand, var / np.where(has_demand, mu, 1.0), 1.0)
+    return shape_per_day, scale
+
+def simulate_expiry_loss(batches, mean_daily, std_daily, n_scenarios=N_SCENARIOS, today=None, seed=RANDOM_SEED):
+    """
+    batches: DataFrame with med_name, quantity, expiry_date and optionally unit_value.
+    mean_daily / std_daily: {med_name: daily demand mean / std}; SKUs missing
+    from mean_daily are treated as having no demand.
+
+    Returns batches (same index) plus:
+      days_left, expected_waste_units, p90_waste_units, waste_probability,
+      expected_waste_value
+    """
+    today = today or date.today()
+    df = batches.copy()
+    if df.empty:
+        for col in ['days_left', 'expected_waste_units', 'p90_waste_units', 'waste_probability', 'expected_waste_value']:
+            df[col] = pd.Series(dtype=float)
+        return df
+
+    expiry = pd.to_datetime(df['expiry_date'])
+    df['days_left'] = (expiry - pd.Timestamp(today)).dt.days.clip(lower=0)
+    qty = df['quantity'].fillna(0).astype(float).clip(lower=0)
+
+    # (SKU x rank) layout: rank = position in the SKU's FEFO order
+    order = np.lexsort((df['days_left'].values, df['med_name'].values))
+    sku_codes, skus = pd.factorize(df['med_name'].values[order])
+    first = np.r_[0, np.flatnonzero(np.diff(sku_codes)) + 1]
+    rank = np.arange(len(order)) - np.repeat(first, np.diff(np.r_[first, len(order)]))
+    n_sku, n_rank = len(skus), int(rank.max()) + 1
+
+    t = np.zeros((n_sku, n_rank))
+    q = np.zeros((n_sku, n_rank))
+    t[sku_codes, rank] = df['days_left'].values[order]
+    q[sku_codes, rank] = qty.values[order]
+
+    shape_per_day, scale = demand_params(
+        pd.Series(mean_daily, dtype=float).reindex(skus).fillna(0).values,
+        pd.Series(std_daily, dtype=float).reindex(skus).fillna(0).values
+    )
+
+    rng = np.random.default_rng(seed)
+    n_batches = np.bincount(sku_codes, minlength=n_sku)
+    demand = np.zeros((n_scenarios, n_sku)) # D(t_b)
+    sold = np.zeros((n_scenarios, n_sku))   # A_b
+    # Per-(SKU, rank) statistics, reduced as we go to keep memory at scenarios x SKUs
+    mean_waste = np.zeros((n_sku, n_rank))
+    p90_waste = np.zeros((n_sku, n_rank))
+    p_waste = np.zeros((n_sku, n_rank))
+    k90 = int(0.9 * (n_scenarios - 1))
+    prev_t = np.zeros(n_sku)
+    for b in range(n_rank):
+        # Only SKUs that still have a b-th batch
+        cols = np.flatnonzero(n_batches > b)
+        dt = t[cols, b] - prev_t[cols]
+        d = demand[:, cols] + rng.gamma(shape_per_day[cols] * dt, scale[cols], size=(n_scenarios, len(cols)))
+        s = sold[:, cols]
+        new_sold = np.minimum(s + q[cols, b], d)
+        waste = q[cols, b] - (new_sold - s)
+        mean_waste[cols, b] = waste.mean(axis=0)
+        p90_waste[cols, b] = np.partition(waste, k90, axis=0)[k90]
+        p_waste[cols, b] = (waste > 0.5).mean(axis=0)
+        demand[:, cols] = d
+        sold[:, cols] = new_sold
+        prev_t[cols] = t[cols, b]
+
+    result = pd.DataFrame({
+        'expected_waste_units': mean_waste[sku_codes, rank],
+        'p90_waste_units': p90_waste[sku_codes, rank],
+        'waste_probability': p_waste[sku_codes, rank]
+    }, index=df.index[order])
+
+    df = df.join(result)
+    unit_value = df['unit_value'].fillna(0).astype(float) if 'unit_value' in df.columns else 0.0
+    df['expected_waste_value'] = df['expected_waste_units'] * unit_value
+    return df
+
+def risk_level(waste_fraction):
+    """Risk bucket from the expected share of stock that expires unsold"""
+    if waste_fraction >= 0.5: return "Critical"
+    if waste_fraction >= 0.2: return "High"
+    return "Moderate"
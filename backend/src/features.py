@@ -0,0 +1,132 @@
+import pandas as pd
+import numpy as np
+import os
+import glob
+import hashlib
+from collections import OrderedDict
+
+# Shared feature engineering for ingestion.py, forecasting.py and forecasting_v2.py.
+# Everything is computed column-wise with numpy (no per-row Python callbacks),
+# and results are cached by a fingerprint of the input so each run builds them once.
+
+UNIX_EPOCH_ORDINAL = 719163 # date(1970, 1, 1).toordinal()
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '../data/feature_cache')
+# Stages run inside the long-lived API process, so both caches are bounded:
+# a small LRU in memory, and only the most recently used pickles on disk
+MEMORY_CACHE_SIZE = 2
+DISK_CACHE_FILES = 8
+
+_memory_cache = OrderedDict()  # key -> feature frame, most recently used last
+
+def _remember(key, feats):
+    _memory_cache[key] = feats
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+def _prune_disk_cache():
+    """Deletes all but the DISK_CACHE_FILES most recently used pickles"""
+    entries = []
+    for path in glob.glob(os.path.join(CACHE_DIR, '*.pkl')):
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:  # removed concurrently
+            pass
+    for _, path in sorted(entries, reverse=True)[DISK_CACHE_FILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def date_ordinals(dates):
+    """Vectorized equivalent of dates.apply(lambda x: x.toordinal())"""
+    days = pd.to_datetime(dates).values.astype('datetime64[D]').astype(np.int64)
+    return days + UNIX_EPOCH_ORDINAL
+
+def dow_onehot(dows):
+    """(n, 7) one-hot matrix for day-of-week values 0-6"""
+    dows = np.asarray(dows)
+    onehot = np.zeros((len(dows), 7))
+    onehot[np.arange(len(dows)), dows] = 1
+    return onehot
+
+def fingerprint(df, params=()):
+    """Stable hash of a frame's contents plus the feature parameters"""
+    h = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    h.update(repr((list(df.columns), params)).encode())
+    return h.hexdigest()
+
+def build_features(df, value_col=None, group_col=None, lags=(), holiday_dates=None, use_disk_cache=True):
+    """
+    Builds calendar + lag features for a frame with a 'date' column.
+
+    Returns a new frame aligned to df's index with:
+      date_ordinal, day_of_week, dow_0..dow_6, is_holiday, lag_{k}_days (per lag)
+
+    is_holiday comes from holiday_dates if given, else from an existing
+    'is_holiday' column, else all False. Lags are shifted within group_col.
+    """
+    cols = [c for c in ['date', value_col, group_col, 'is_holiday'] if c and c in df.columns]
+    params = (value_col, group_col, tuple(lags),
+              None if holiday_dates is None else tuple(pd.to_datetime(holiday_dates).astype(str)))
+    key = fingerprint(df[cols], params)
+
+    if key in _memory_cache:
+        _memory_cache.move_to_end(key)
+        return _memory_cache[key].set_axis(df.index)
+
+    cache_path = os.path.join(CACHE_DIR, f"{key}.pkl")
+    if use_disk_cache and os.path.exists(cache_path):
+        feats = pd.read_pickle(cache_path)
+        os.utime(cache_path)  # mtime = last use, for pruning
+        _remember(key, feats)
+        return feats.set_axis(df.index)
+
+    dates = pd.to_datetime(df['date'])
+    feats = pd.DataFrame(index=df.index)
+
+    # 1. Trend
+    feats['date_ordinal'] = date_ordinals(dates)
+
+    # 2. Day of Week (+ One-Hot)
+    feats['day_of_week'] = dates.dt.dayofweek.values
+    onehot = dow_onehot(feats['day_of_week'].values)
+    for d in range(7):
+        feats[f'dow_{d}'] = onehot[:, d]
+
+    # 3. Holiday
+    if holiday_dates is not None:
+        feats['is_holiday'] = dates.isin(pd.to_datetime(holiday_dates)).values
+    elif 'is_holiday' in df.columns:
+        feats['is_holiday'] = df['is_holiday'].fillna(False).astype(bool).values
+    else:
+        feats['is_holiday'] = False
+
+    # 4. Lags (sorted by group + date so shift() follows time order)
+    if lags and value_col:
+        order = df.assign(_date=dates).sort_values([group_col, '_date'] if group_col else ['_date'])
+        for k in lags:
+            if group_col:
+                lagged = order.groupby(group_col)[value_col].shift(k)
+            else:
+                lagged = order[value_col].shift(k)
+            feats[f'lag_{k}_days'] = lagged.reindex(df.index)
+
+    _remember(key, feats)
+    if use_disk_cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        feats.to_pickle(cache_path)
+        _prune_disk_cache()
+
+    return feats
+
+def design_matrix(feats, start_date_ord):
+    """
+    Linear model inputs: Bias, Trend, Holiday, DOW_0, ..., DOW_6
+    Trend is the date ordinal normalized by subtracting start_date_ord.
+    """
+    bias = np.ones(len(feats))
+    t = feats['date_ordinal'].values - start_date_ord
+    h = feats['is_holiday'].astype(int).values
+    dow = feats[[f'dow_{d}' for d in range(7)]].values
+    return np.column_stack([bias, t, h, dow])
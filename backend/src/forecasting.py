@@ -2,12 +2,22 @@ import pandas as pd
 import numpy as np
 import os
 from datetime import timedelta
+from features import build_features, design_matrix
 
-def train_and_predict():
+DATA_PATH = os.path.join(os.path.dirname(__file__), '../data/processed_sales.csv')
+OUTPUT_PATH = os.path.join(os.path.dirname(__file__), '../data/forecast_total.csv')
+# forecast_results.csv is forecasting_v2.py's per-medicine forecast; this total-only
+# forecast is kept separate so the two jobs don't overwrite each other
+
+def train_forecasting_model():
+    """
+    Fits the linear trend/holiday/DOW model and returns the 90-day forecast.
+    Returns: {"mae", "rmse", "weights", "forecast_df", "forecast"}
+    """
     print("Starting Forecasting Model (Refined: Numpy Linear Regression)...")
     
     # Load data
-    data_path = os.path.join(os.path.dirname(__file__), '../data/processed_sales.csv')
+    data_path = DATA_PATH
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"{data_path} not found. Run ingestion.py first.")
     
@@ -19,37 +29,21 @@ def train_and_predict():
     max_date = df['date'].max()
     split_date = max_date - timedelta(days=30)
     
-    train = df[df['date'] <= split_date].copy()
-    valid = df[df['date'] > split_date].copy()
+    is_train = (df['date'] <= split_date).values
+    train = df[is_train].copy()
+    valid = df[~is_train].copy()
     
     print(f"Training on {len(train)} records. Validating on {len(valid)} records.")
     
-    # Feature Preparation Function
-    def make_features(input_df, start_date_ord):
-        # 1. Trend: Date as ordinal (normalized by subtracting start)
-        t = (input_df['date'].apply(lambda x: x.toordinal()) - start_date_ord).values
-        
-        # 2. Holiday
-        h = input_df['is_holiday'].astype(int).values
-        
-        # 3. Day of Week (One-Hot Encoding)
-        # Create 7 columns (0-6)
-        dows = input_df['date'].dt.dayofweek.values
-        dow_onehot = np.zeros((len(dows), 7))
-        dow_onehot[np.arange(len(dows)), dows] = 1
-        
-        # 4. Bias (Column of 1s)
-        bias = np.ones(len(input_df))
-        
-        # Combine: Bias, Trend, Holiday, DOW_0, ..., DOW_6
-        # Note: Dropping one DOW is theoretically cleaner for non-regularized regression, 
-        # but lstsq handles collinearity fine.
-        X = np.column_stack([bias, t, h, dow_onehot])
-        return X
+    # Feature Preparation (shared module, built once for the full history)
+    # Columns: Bias, Trend, Holiday, DOW_0, ..., DOW_6
+    # Note: Dropping one DOW is theoretically cleaner for non-regularized regression, 
+    # but lstsq handles collinearity fine.
+    start_time_ord = train['date'].min().toordinal()
+    X_full = design_matrix(build_features(df), start_time_ord)
 
     # Prepare Training Data
-    start_time_ord = train['date'].min().toordinal()
-    X_train = make_features(train, start_time_ord)
+    X_train = X_full[is_train]
     y_train = train['sales'].values
     
     # Train Model (Linear Regression via Least Squares)
@@ -60,7 +54,7 @@ def train_and_predict():
     print(f"Weights (Bias, Trend, Holiday, DOW:0-6):\n{weights.round(2)}")
     
     # Evaluation on Validation
-    X_valid = make_features(valid, start_time_ord)
+    X_valid = X_full[~is_train]
     valid_preds = X_valid.dot(weights)
     
     # Metrics
@@ -74,7 +68,6 @@ def train_and_predict():
     print("\nGenerating 90-day forecast...")
     
     # Re-train on FULL data for best future prediction
-    X_full = make_features(df, start_time_ord)
     y_full = df['sales'].values
     weights_full, _, _, _ = np.linalg.lstsq(X_full, y_full, rcond=None)
     
@@ -83,16 +76,28 @@ def train_and_predict():
     # Assume is_holiday=0 for future for now (unless we merge calendar again)
     future_df['is_holiday'] = False 
     
-    X_future = make_features(future_df, start_time_ord)
+    X_future = design_matrix(build_features(future_df, use_disk_cache=False), start_time_ord)
     future_preds = X_future.dot(weights_full)
     
     future_df['predicted_sales'] = future_preds
     
     print(future_df.head(15))
+
+    forecast_records = future_df.assign(date=future_df['date'].dt.strftime('%Y-%m-%d')).to_dict(orient='records')
+    
+    return {
+        "mae": float(mae),
+        "rmse": float(rmse),
+        "weights": weights_full.tolist(),
+        "forecast_df": future_df,
+        "forecast": forecast_records
+    }
+
+def train_and_predict():
+    results = train_forecasting_model()
     
-    output_path = os.path.join(os.path.dirname(__file__), '../data/forecast_results.csv')
-    future_df.to_csv(output_path, index=False)
-    print(f"Forecast saved to {output_path}")
+    results['forecast_df'].to_csv(OUTPUT_PATH, index=False)
+    print(f"Forecast saved to {OUTPUT_PATH}")
 
 if __name__ == "__main__":
     train_and_predict()
@@ -1,15 +1,103 @@
 import pandas as pd
 import numpy as np
 import os
+import json
+import argparse
 from datetime import timedelta, datetime
 import warnings
 
 # Suppress statsmodels warnings for cleaner output
 warnings.filterwarnings("ignore")
 from statsmodels.tsa.arima.model import ARIMA
+from features import build_features
+from hierarchical import hierarchical_forecast, load_categories
+from demand_forecast import load_demand_forecast
 
-def generate_forecasts():
-    print("Starting Module 1.2 Forecasting (History + CI + Forecast)...")
+SEASON_BY_MONTH = {
+    12: "Winter", 1: "Winter", 2: "Winter",
+    3: "Spring", 4: "Spring", 5: "Spring",
+    6: "Summer", 7: "Summer", 8: "Summer",
+    9: "Fall", 10: "Fall", 11: "Fall",
+}
+SUMMARY_MONTHS = 6
+
+def summarize_medicine(sub_df, forecast_mean, ci_lower_vals, ci_upper_vals, fit_accuracy, start_date):
+    """
+    Builds the per-medicine summary served by /forecast/detail.
+    Everything is derived from the daily history and the model output, so the
+    same forecast run always produces the same summary.
+    """
+    overall_mean = sub_df.mean() if sub_df.mean() > 0 else 1.0
+
+    # Seasonal factors: mean daily demand per season vs. the all-time mean
+    seasons_hist = sub_df.groupby(sub_df.index.month.map(SEASON_BY_MONTH)).mean() / overall_mean
+    seasonal_factors = {s: round(float(seasons_hist.get(s, 1.0)), 2) for s in ["Winter", "Spring", "Summer", "Fall"]}
+
+    # Daily level + uncertainty from the model (one-step-ahead 95% CI -> daily std;
+    # later CIs widen with the horizon, which the sqrt(days) scaling below adds back)
+    daily_level = float(np.mean(forecast_mean))
+    daily_std = float(ci_upper_vals[0] - ci_lower_vals[0]) / (2 * 1.96)
+
+    monthly_data = []
+    month_start = pd.Timestamp(start_date).to_period('M')
+    for i in range(SUMMARY_MONTHS):
+        period = month_start + i
+        season = SEASON_BY_MONTH[period.month]
+        factor = seasonal_factors[season]
+        days = period.days_in_month
+
+        qty = int(round(daily_level * factor * days))
+        # Daily errors assumed independent -> monthly std scales with sqrt(days)
+        half_width = 1.96 * daily_std * factor * np.sqrt(days)
+        confidence = int(np.clip(100 * (1 - half_width / qty), 50, 99)) if qty > 0 else 50
+
+        prev_qty = monthly_data[-1]['quantity'] if monthly_data else qty
+        trend = "up" if qty > prev_qty * 1.05 else "down" if qty < prev_qty * 0.95 else "stable"
+
+        if season == "Winter" and factor > 1:
+            why = "Winter season - higher respiratory infections"
+        elif season == "Summer" and factor > 1:
+            why = "Summer heat - dehydration & injuries"
+        elif trend == "up":
+            why = "Positive sustained growth trend identified"
+        elif trend == "down":
+            why = "Post-seasonal demand normalization"
+        else:
+            why = "Consistent baseline consumption"
+
+        monthly_data.append({
+            "month": period.strftime("%B"),
+            "quantity": qty,
+            "ci_lower": int(max(0, round(qty - half_width))),
+            "ci_upper": int(round(qty + half_width)),
+            "confidence": confidence,
+            "trend": trend,
+            "reason": why
+        })
+
+    # Growth: last 90 days vs. the 90 days a year earlier, else vs. the first 90 days
+    recent = sub_df.tail(90).mean()
+    last_year = sub_df[sub_df.index <= sub_df.index.max() - timedelta(days=365)].tail(90)
+    baseline = last_year.mean() if len(last_year) >= 30 else sub_df.head(90).mean()
+    yoy_growth = round(float((recent - baseline) / baseline * 100), 1) if baseline > 0 else 0.0
+
+    return {
+        "avg_daily_demand": round(daily_level, 2),
+        "daily_std": round(daily_std, 2),
+        "avg_monthly_demand": int(round(daily_level * 30)),
+        "accuracy": round(float(fit_accuracy), 1),
+        "forecast_data": monthly_data,
+        "seasonal_factors": [{"season": k, "factor": v} for k, v in seasonal_factors.items()],
+        "yoy_growth": yoy_growth
+    }
+
+def generate_forecasts(mode="arima", reconcile_method="mint_shrink"):
+    """
+    mode="arima"        : independent ARIMA(5,1,0) per medicine + DOW multipliers
+    mode="hierarchical" : one linear model per node (total/category/SKU) on the
+                          calendar and its own lags, reconciled with reconcile_method
+    """
+    print(f"Starting Module 1.2 Forecasting (History + CI + Forecast) [{mode}]...")
     
     # Paths
     BASE_DIR = os.path.dirname(__file__)
@@ -17,6 +105,8 @@ def generate_forecasts():
     INPUT_PATH = os.path.join(DATA_DIR, 'processed_prescriptions.csv')
     OUTPUT_PATH = os.path.join(DATA_DIR, 'forecast_results.csv')
     DETAILED_OUTPUT_PATH = os.path.join(DATA_DIR, 'forecast_detailed.csv')
+    HIERARCHY_OUTPUT_PATH = os.path.join(DATA_DIR, 'forecast_hierarchy.csv')
+    SUMMARY_OUTPUT_PATH = os.path.join(DATA_DIR, 'forecast_summary.json')
     
     if not os.path.exists(INPUT_PATH):
         raise FileNotFoundError(f"{INPUT_PATH} missing. Run ingestion_v2.py first.")
@@ -32,53 +122,91 @@ def generate_forecasts():
     # Result containers
     detailed_results = [] # Tidy format for API: [date, med, type, value, ci_low, ci_high]
     pivot_data = []       # Wide format for Overview: [date, med1, med2...]
+    summaries = {}        # Per-medicine monthly summary for /forecast/detail
     
     # Process each drug independently
     meds = df['med_name'].unique()
     print(f"Forecasting for {len(meds)} medicines: {meds}")
+
+    # Daily panel (date x med) built once instead of filtering df per medicine
+    panel = df.pivot_table(index='date', columns='med_name', values='qty', aggfunc='sum')
+    panel = panel.asfreq('D')
+
+    # Calendar features for every panel date (shared feature module)
+    calendar = build_features(pd.DataFrame({'date': panel.index}))
+    calendar.index = panel.index
+
+    hier = None
+    if mode == "hierarchical":
+        holiday_dates = df.loc[df['is_holiday'].astype(bool), 'date'].unique() if 'is_holiday' in df.columns else None
+        hier = hierarchical_forecast(
+            panel, load_categories(), horizon_days=horizon_days,
+            method=reconcile_method, holiday_dates=holiday_dates
+        )
     
     for med in meds:
-        # Get History (Daily)
-        sub_df = df[df['med_name'] == med].set_index('date').resample('D')['qty'].sum().fillna(0)
-        
-        # ARIMA implementation (p=5, d=1, q=0 as a general starting point)
-        # We use the daily history 'sub_df' to fit the model
-        try:
-            # Fit ARIMA model
-            model = ARIMA(sub_df.values, order=(5, 1, 0))
-            model_fit = model.fit()
+        # Get History (Daily) - spans this medicine's first to last sale, gaps = 0
+        col = panel[med]
+        sub_df = col.loc[col.first_valid_index():col.last_valid_index()].fillna(0).rename('qty')
+
+        if hier is not None:
+            # Reconciled SKU forecast (DOW effects are part of the model already)
+            forecast_mean = hier['forecast'][med].values
+            ci_lower_vals = hier['ci_lower'][med].values
+            ci_upper_vals = hier['ci_upper'][med].values
+            fit_accuracy = hier['accuracy'][med]
+
+        else:
+            # ARIMA implementation (p=5, d=1, q=0 as a general starting point)
+            # We use the daily history 'sub_df' to fit the model
+            try:
+                # Fit ARIMA model
+                model = ARIMA(sub_df.values, order=(5, 1, 0))
+                model_fit = model.fit()
             
-            # Forecast future values
-            forecast = model_fit.get_forecast(steps=horizon_days)
-            forecast_mean = forecast.predicted_mean
+                # Forecast future values
+                forecast = model_fit.get_forecast(steps=horizon_days)
+                forecast_mean = forecast.predicted_mean
             
-            # Get confidence intervals (95% CI)
-            forecast_ci = forecast.conf_int(alpha=0.05)
+                # Get confidence intervals (95% CI)
+                forecast_ci = forecast.conf_int(alpha=0.05)
             
-            # If any forecasted value is negative, clip to 0
-            forecast_mean = np.maximum(0, forecast_mean)
-            ci_lower_vals = np.maximum(0, forecast_ci[:, 0])
-            ci_upper_vals = np.maximum(0, forecast_ci[:, 1])
+                # If any forecasted value is negative, clip to 0
+                forecast_mean = np.maximum(0, forecast_mean)
+                ci_lower_vals = np.maximum(0, forecast_ci[:, 0])
+                ci_upper_vals = np.maximum(0, forecast_ci[:, 1])
+
+                # In-sample fit accuracy (100 - MAE as % of mean demand)
+                fit_mae = np.mean(np.abs(model_fit.resid[1:]))
+                fit_accuracy = 100 * (1 - fit_mae / sub_df.mean()) if sub_df.mean() > 0 else 0.0
             
-        except Exception as e:
-            print(f"ARIMA failed for {med}. Falling back to baseline. Error: {e}")
-            # Fallback logic if ARIMA fails to converge
-            last_30_mean = sub_df.tail(30).mean()
-            all_time_mean = sub_df.mean()
-            volatility = sub_df.tail(30).std()
-            if pd.isna(volatility) or volatility == 0:
-                volatility = all_time_mean * 0.2
-            base_pred = (last_30_mean * 0.7) + (all_time_mean * 0.3)
+            except Exception as e:
+                print(f"ARIMA failed for {med}. Falling back to baseline. Error: {e}")
+                # Fallback logic if ARIMA fails to converge
+                last_30_mean = sub_df.tail(30).mean()
+                all_time_mean = sub_df.mean()
+                volatility = sub_df.tail(30).std()
+                if pd.isna(volatility) or volatility == 0:
+                    volatility = all_time_mean * 0.2
+                base_pred = (last_30_mean * 0.7) + (all_time_mean * 0.3)
             
-            forecast_mean = np.full(horizon_days, base_pred)
-            ci_lower_vals = np.maximum(0, forecast_mean - (1.96 * volatility))
-            ci_upper_vals = forecast_mean + (1.96 * volatility)
+                forecast_mean = np.full(horizon_days, base_pred)
+                ci_lower_vals = np.maximum(0, forecast_mean - (1.96 * volatility))
+                ci_upper_vals = forecast_mean + (1.96 * volatility)
+                fit_accuracy = 100 * (1 - volatility / all_time_mean) if all_time_mean > 0 else 0.0
 
         # Dow Multipliers (Still useful for short-term daily fluctuations even with ARIMA)
         sub_df_frame = sub_df.to_frame()
-        sub_df_frame['dow'] = sub_df_frame.index.dayofweek
+        sub_df_frame['dow'] = calendar.loc[sub_df.index, 'day_of_week'].values
         dow_multipliers = sub_df_frame.groupby('dow')['qty'].mean() / (sub_df.mean() if sub_df.mean() > 0 else 1)
         dow_multipliers = dow_multipliers.fillna(1.0).to_dict()
+        if hier is not None:
+            dow_multipliers = {}
+
+        summaries[med] = summarize_medicine(
+            sub_df, forecast_mean, ci_lower_vals, ci_upper_vals,
+            np.clip(fit_accuracy, 0, 100), request_start_date
+        )
         
         # --- A. Save History ---
         for date, qty in sub_df.items():
@@ -135,5 +263,40 @@ def generate_forecasts():
     df_pivot.to_csv(OUTPUT_PATH, index=False)
     print(f"Overview Forecast saved to {OUTPUT_PATH}")
 
+    # Save All Hierarchy Levels (Total / Category / SKU)
+    if hier is not None:
+        df_hier = pd.concat({
+            k: hier[k].rename_axis('date').rename_axis('node', axis=1).stack()
+            for k in ['forecast', 'ci_lower', 'ci_upper']
+        }, axis=1).reset_index().rename(columns={'forecast': 'value'})
+        df_hier.insert(1, 'level', df_hier['node'].map(hier['levels']))
+        df_hier['date'] = df_hier['date'].dt.strftime('%Y-%m-%d')
+        df_hier.round(2).to_csv(HIERARCHY_OUTPUT_PATH, index=False)
+        print(f"Hierarchical Forecast saved to {HIERARCHY_OUTPUT_PATH}")
+
+    # Save Per-Medicine Summary (For /forecast/detail)
+    generated_at = datetime.now().replace(microsecond=0)
+    # The API re-reads this file when its mtime changes, so write a temp file and swap it in
+    tmp_path = SUMMARY_OUTPUT_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            "generated_at": generated_at.isoformat(),
+            "forecast_start": request_start_date.strftime('%Y-%m-%d'),
+            "medicines": summaries
+        }, f, indent=2)
+    os.replace(tmp_path, SUMMARY_OUTPUT_PATH)
+    print(f"Forecast Summary saved to {SUMMARY_OUTPUT_PATH}")
+
+    # Load per-medicine demand into the DB (For /reorder)
+    try:
+        load_demand_forecast(summaries, generated_at)
+    except Exception as e:
+        print(f"demand_forecast load failed: {e}")
+
 if __name__ == "__main__":
-    generate_forecasts()
+    parser = argparse.ArgumentParser(description="Per-medicine demand forecasting")
+    parser.add_argument("--mode", choices=["arima", "hierarchical"], default="arima")
+    parser.add_argument("--reconcile", choices=["bottom_up", "wls", "mint_shrink"], default="mint_shrink",
+                        help="Reconciliation method for --mode hierarchical")
+    args = parser.parse_args()
+    generate_forecasts(mode=args.mode, reconcile_method=args.reconcile)
@@ -1,4 +1,5 @@
 import pandas as pd
+import os
 import random
 from datetime import datetime, timedelta
 
@@ -0,0 +1,221 @@
+import pandas as pd
+import numpy as np
+import os
+from features import build_features, design_matrix
+
+# Hierarchical demand forecasting: Store Total -> Category -> SKU.
+#
+# Every node (total, category, SKU) gets its own base model: the trend/holiday/DOW
+# design (features.design_matrix) plus lags of that node's own series, fitted per
+# node and forecast recursively. Because the lag terms differ by level, base
+# forecasts and residuals are not coherent, and are then reconciled so SKUs add
+# up to categories and categories add up to the total:
+#   bottom_up   : y~ = S y^_sku
+#   wls         : MinT with a diagonal error covariance (scales to many SKUs)
+#   mint_shrink : MinT with a shrunk full covariance (Schafer-Strimmer)
+# Sparse SKUs borrow strength from their category (top-down by historical share)
+# before reconciliation.
+
+DRUGS_PATH = os.path.join(os.path.dirname(__file__), '../../dataset/archive/DRUGS.csv')
+
+CATEGORY_BY_GENERIC = {
+    "amoxicillin": "Antibiotics",
+    "acetaminophen": "Pain Relief",
+    "ibuprophen": "Pain Relief",
+    "meloxicam": "Pain Relief",
+    "naproxen": "Pain Relief",
+    "glipizide": "Diabetes",
+    "atorvastatin": "Cardiology",
+    "simvastatin": "Cardiology",
+    "atenolol": "Cardiology",
+    "clopidogrel": "Cardiology",
+    "furosemide": "Cardiology",
+    "isosorbide": "Cardiology",
+    "losartan": "Cardiology",
+    "sprinolactone": "Cardiology",
+    "gabapentin": "Neurology",
+    "zolpidem": "Neurology",
+    "omeprazole": "Gastric",
+}
+MIN_NONZERO_DAYS = 14 # SKUs with fewer selling days use their category's shape
+LAGS = (1, 7) # own-series lags in each node's base model
+
+def load_categories(drugs_path=DRUGS_PATH):
+    """med_name -> category, via the generic name in DRUGS.csv"""
+    if not os.path.exists(drugs_path):
+        return {}
+    df_drugs = pd.read_csv(drugs_path).drop_duplicates('brandName')
+    generic = df_drugs['genericName'].str.lower().str.strip()
+    return dict(zip(df_drugs['brandName'], generic.map(CATEGORY_BY_GENERIC).fillna("General")))
+
+def build_summing_matrix(skus, categories):
+    """
+    S maps bottom-level (SKU) series to every node: [total; categories; skus].
+    Returns (S, labels) where labels[i] = (level, name) for row i.
+    """
+    sku_cats = np.array([categories.get(s, "General") for s in skus])
+    cat_names = sorted(set(sku_cats))
+
+    total_row = np.ones((1, len(skus)))
+    cat_rows = (sku_cats[None, :] == np.array(cat_names)[:, None]).astype(float)
+    sku_rows = np.eye(len(skus))
+
+    S = np.vstack([total_row, cat_rows, sku_rows])
+    labels = [("total", "Total")] + [("category", c) for c in cat_names] + [("sku", s) for s in skus]
+    return S, labels
+
+def shrink_covariance(residuals):
+    """Schafer-Strimmer shrinkage of the residual covariance towards its diagonal"""
+    n = residuals.shape[0]
+    std = residuals.std(axis=0, ddof=1)
+    std = np.where(std > 0, std, 1e-6)
+    z = (residuals - residuals.mean(axis=0)) / std
+
+    corr = (z.T @ z) / (n - 1)
+    # Variance of each correlation estimate
+    w_mean = corr * (n - 1) / n
+    w_sq = (z ** 2).T @ (z ** 2) / n
+    var_corr = n / (n - 1) ** 3 * n * (w_sq - w_mean ** 2)
+
+    off = ~np.eye(corr.shape[0], dtype=bool)
+    denom = (corr[off] ** 2).sum()
+    lam = float(np.clip(var_corr[off].sum() / denom, 0, 1)) if denom > 0 else 1.0
+
+    shrunk_corr = (1 - lam) * corr
+    np.fill_diagonal(shrunk_corr, 1.0)
+    return shrunk_corr * np.outer(std, std), lam
+
+def incoherence(forecast, S):
+    """Largest gap between each node and the sum of its SKUs (rows of S, SKUs last)"""
+    bottom = forecast[:, -S.shape[1]:]
+    return float(np.abs(forecast - bottom @ S.T).max())
+
+def reconcile(base_forecast, S, residuals, method="mint_shrink"):
+    """
+    Reconciles base forecasts (horizon x nodes) into coherent ones.
+    Returns (reconciled, node_variance, shrinkage) where node_variance is the
+    per-node forecast error variance implied by the reconciliation and
+    shrinkage the MinT shrinkage intensity (None for other methods).
+
+    Incoherent inputs are changed, and come out coherent:
+
+    >>> S = np.array([[1., 1.], [1., 0.], [0., 1.]])
+    >>> base = np.array([[10., 4., 5.]])  # total != 4 + 5
+    >>> residuals = np.random.default_rng(0).normal(size=(200, 3))
+    >>> for method in ("bottom_up", "wls", "mint_shrink"):
+    ...     reconciled = reconcile(base, S, residuals, method)[0]
+    ...     print(method, np.allclose(reconciled, base), incoherence(reconciled, S) < 1e-9)
+    bottom_up False True
+    wls False True
+    mint_shrink False True
+    """
+    n_nodes, n_bottom = S.shape
+    lam = None
+    res_var = residuals.var(axis=0, ddof=1)
+    res_var = np.where(res_var > 0, res_var, 1e-6)
+
+    if method == "bottom_up":
+        P = np.hstack([np.zeros((n_bottom, n_nodes - n_bottom)), np.eye(n_bottom)])
+        G = S @ P
+        node_var = (G ** 2) @ res_var
+    elif method == "wls":
+        w_inv = 1.0 / res_var
+        StWi = S.T * w_inv # S' W^-1
+        P = np.linalg.solve(StWi @ S, StWi)
+        G = S @ P
+        node_var = (G ** 2) @ res_var
+    elif method == "mint_shrink":
+        W, lam = shrink_covariance(residuals)
+        W_inv_S = np.linalg.solve(W, S)
+        P = np.linalg.solve(S.T @ W_inv_S, W_inv_S.T)
+        G = S @ P
+        node_var = np.einsum('ij,jk,ik->i', G, W, G)
+    else:
+        raise ValueError(f"Unknown reconciliation method: {method}")
+
+    reconciled = base_forecast @ G.T
+    return reconciled, node_var, lam
+
+def fit_base_models(Y, X, lags=LAGS):
+    """
+    Per-node least squares of Y[:, j] on X plus lags of Y[:, j].
+    Returns (weights (nodes x (X cols + lags)), in-sample residuals) for rows
+    max(lags) onwards.
+    """
+    m = max(lags)
+    lagged = np.stack([Y[m - k:len(Y) - k] for k in lags], axis=-1) # T' x nodes x lags
+    weights = np.empty((Y.shape[1], X.shape[1] + len(lags)))
+    for j in range(Y.shape[1]):
+        Xj = np.column_stack([X[m:], lagged[:, j]])
+        weights[j] = np.linalg.lstsq(Xj, Y[m:, j], rcond=None)[0]
+    fitted = X[m:] @ weights[:, :X.shape[1]].T + np.einsum('tjl,jl->tj', lagged, weights[:, X.shape[1]:])
+    return weights, Y[m:] - fitted
+
+def forecast_base_models(Y, X_future, weights, lags=LAGS):
+    """Recursive multi-step forecast: later steps use earlier (non-negative) forecasts as lags"""
+    m, n_x = max(lags), X_future.shape[1]
+    path = np.vstack([Y[-m:], np.zeros((len(X_future), Y.shape[1]))])
+    calendar = X_future @ weights[:, :n_x].T
+    for h in range(len(X_future)):
+        lagged = np.stack([path[m + h - k] for k in lags], axis=-1) # nodes x lags
+        path[m + h] = np.maximum(0, calendar[h] + (lagged * weights[:, n_x:]).sum(axis=1))
+    return path[m:]
+
+def hierarchical_forecast(panel, categories, horizon_days=90, method="mint_shrink", holiday_dates=None):
+    """
+    panel: daily date x SKU demand (missing days = 0).
+    Returns a dict of DataFrames indexed by future date, columns = node names:
+      forecast, ci_lower, ci_upper
+    plus 'accuracy' (Series, in-sample) and 'levels' (node name -> level).
+    """
+    panel = panel.asfreq('D', fill_value=0).fillna(0)
+    skus = list(panel.columns)
+    S, labels = build_summing_matrix(skus, categories)
+
+    # All node histories at once: (T x bottom) @ (bottom x nodes)
+    Y = panel.values @ S.T
+
+    # 1. Base model per node: calendar design + the node's own lags
+    hist_feats = build_features(pd.DataFrame({'date': panel.index}), holiday_dates=holiday_dates)
+    start_ord = int(hist_feats['date_ordinal'].iloc[0])
+    X_hist = design_matrix(hist_feats, start_ord)
+    weights, residuals = fit_base_models(Y, X_hist)
+
+    # In-sample fit accuracy per node (100 - MAE as % of mean demand)
+    node_mean = Y[max(LAGS):].mean(axis=0)
+    accuracy = np.clip(100 * (1 - np.divide(np.abs(residuals).mean(axis=0), node_mean,
+                                            out=np.ones(len(labels)), where=node_mean > 0)), 0, 100)
+
+    future_dates = pd.date_range(panel.index.max() + pd.Timedelta(days=1), periods=horizon_days, freq='D')
+    fut_feats = build_features(pd.DataFrame({'date': future_dates}), holiday_dates=holiday_dates, use_disk_cache=False)
+    base = forecast_base_models(Y, design_matrix(fut_feats, start_ord), weights)
+
+    # 2. Borrow strength: sparse SKUs follow their category, scaled by historical share
+    n_top = len(labels) - len(skus)
+    sku_hist = panel.values
+    sparse = (sku_hist > 0).sum(axis=0) < MIN_NONZERO_DAYS
+    if sparse.any():
+        cat_of_sku = S[1:n_top].argmax(axis=0) + 1 # node row of each SKU's category
+        cat_totals = Y[:, cat_of_sku].sum(axis=0)
+        share = np.divide(sku_hist.sum(axis=0), cat_totals, out=np.zeros(len(skus)), where=cat_totals > 0)
+        top_down = base[:, cat_of_sku] * share
+        sku_cols = np.arange(len(skus)) + n_top
+        base[:, sku_cols[sparse]] = top_down[:, sparse]
+        print(f"{sparse.sum()} sparse SKUs borrowing strength from their category")
+
+    # 3. Reconcile
+    reconciled, node_var, lam = reconcile(base, S, residuals, method=method)
+    shrinkage = f", MinT shrinkage {lam:.3f}" if lam is not None else ""
+    print(f"Reconciled {len(labels)} nodes ({method}{shrinkage}): "
+          f"max incoherence {incoherence(base, S):.2f} -> {incoherence(reconciled, S):.2e}")
+    reconciled = np.maximum(0, reconciled)
+    half_width = 1.96 * np.sqrt(node_var)
+
+    names = [name for _, name in labels]
+    return {
+        "forecast": pd.DataFrame(reconciled, index=future_dates, columns=names),
+        "ci_lower": pd.DataFrame(np.maximum(0, reconciled - half_width), index=future_dates, columns=names),
+        "ci_upper": pd.DataFrame(reconciled + half_width, index=future_dates, columns=names),
+        "accuracy": pd.Series(accuracy, index=names),
+        "levels": dict((name, level) for level, name in labels)
+    }
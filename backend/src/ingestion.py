@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from features import build_features
 
 def load_and_process_data():
     raw_data_path = os.path.join(os.path.dirname(__file__), '../data/raw')
@@ -36,21 +37,25 @@ def load_and_process_data():
         # Create a boolean series for merging or just map it
         df_sales['is_holiday'] = df_sales['date'].isin(holiday_dates)
 
-    # Feature Engineering
+    # Feature Engineering (shared with forecasting.py, cached per input)
     print("Engineering features...")
-    df_sales['day_of_week'] = df_sales['date'].dt.dayofweek
+    feats = build_features(df_sales, value_col='sales', group_col='store_nbr', lags=(7,))
+    df_sales['day_of_week'] = feats['day_of_week']
     
-    # Lag 7 days
-    # Need to sort by store and date to ensure shift is correct logic wise
+    # Lag 7 days (shifted per store in date order)
+    df_sales['lag_7_days'] = feats['lag_7_days']
     df_sales = df_sales.sort_values(['store_nbr', 'date'])
-    df_sales['lag_7_days'] = df_sales.groupby('store_nbr')['sales'].shift(7)
     
     print("Data processing complete.")
     print(df_sales.head())
     return df_sales
 
-if __name__ == "__main__":
+def run_ingestion():
+    """Processes the raw sales and saves them for forecasting.py"""
     df = load_and_process_data()
     output_path = os.path.join(os.path.dirname(__file__), '../data/processed_sales.csv')
     df.to_csv(output_path, index=False)
     print(f"Saved processed data to {output_path}")
+
+if __name__ == "__main__":
+    run_ingestion()
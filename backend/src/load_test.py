@@ -0,0 +1,72 @@
+import sys
+import time
+import random
+import asyncio
+import argparse
+import httpx
+import numpy as np
+
+# Closed-loop load test for the read endpoints.
+#
+# N concurrent clients each request a random endpoint from PATHS and, as
+# soon as it answers, the next one, for a fixed duration. Reports
+# throughput and latency percentiles. Endpoints return [] or mock data
+# when the DB fails, so those responses count as errors.
+#
+#   python load_test.py --url http://localhost:8000 --clients 8 64 --duration 15
+
+PATHS = [
+    "/inventory?limit=100",
+    "/inventory?search=a&limit=50",
+    "/drugs?limit=100",
+    "/drugs?search=a&limit=50",
+    "/stats",
+]
+MOCK_MARKERS = [b"Amoxicillin 500mg", b'"total_products":2580']
+
+async def client(http, stop, latencies, errors, rng):
+    while time.perf_counter() < stop:
+        path = rng.choice(PATHS)
+        t0 = time.perf_counter()
+        try:
+            r = await http.get(path)
+            ok = r.status_code == 200 and r.content != b"[]" and not any(m in r.content for m in MOCK_MARKERS)
+        except httpx.HTTPError:
+            ok = False
+        latencies.append(time.perf_counter() - t0)
+        if not ok:
+            errors.append(path)
+
+async def run(url, clients, duration):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as http:
+        for _ in range(20): # warm up connections and caches
+            await http.get("/stats")
+        latencies, errors = [], []
+        t0 = time.perf_counter()
+        stop = t0 + duration
+        await asyncio.gather(*(client(http, stop, latencies, errors, random.Random(i)) for i in range(clients)))
+        wall = time.perf_counter() - t0
+
+    ms = np.array(latencies) * 1000
+    result = {
+        "clients": clients,
+        "requests": len(ms),
+        "errors": len(errors),
+        "rps": round(len(ms) / wall, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+    }
+    print(" ".join(f"{k}={v}" for k, v in result.items()))
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the read endpoints")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, nargs="+", default=[8, 64], help="Concurrent clients (one run each)")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per run")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(args.url, n, args.duration)) for n in args.clients]
+    sys.exit(1 if any(r["errors"] for r in results) else 0)
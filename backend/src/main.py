@@ -1,29 +1,117 @@
 from fastapi import FastAPI, HTTPException
 from contextlib import asynccontextmanager
+import asyncio
+import time
 import sys
 import os
 
 # Add src to path to import modules
 sys.path.append(os.path.dirname(__file__))
 
+import forecasting
+import waste_analysis
 from forecasting import train_forecasting_model
 from waste_analysis import analyze_waste
 
-app = FastAPI(title="Inventory Forecasting & Waste Engine")
+# Cached results are recomputed when their input files change,
+# or at the latest every MODEL_REFRESH_SECONDS.
+MODEL_REFRESH_SECONDS = int(os.getenv("MODEL_REFRESH_SECONDS", 3600))
+DATA_POLL_SECONDS = int(os.getenv("DATA_POLL_SECONDS", 30))
+
+class ResultCache:
+    """
+    Holds the latest output of an expensive function (model training, waste scan).
+    Requests read the cached result; refreshes run in a worker thread.
+    """
+    def __init__(self, name, compute, input_paths):
+        self.name = name
+        self.compute = compute
+        self.input_paths = input_paths
+        self.result = None
+        self.error = None
+        self.signature = None
+        self.updated_at = None
+        self.duration = None
+        self._lock = asyncio.Lock()
+
+    def input_signature(self):
+        return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in self.input_paths)
+
+    def is_stale(self):
+        if self.updated_at is None or self.signature != self.input_signature():
+            return True
+        return time.time() - self.updated_at > MODEL_REFRESH_SECONDS
+
+    async def refresh(self, force=False):
+        async with self._lock:
+            # Another caller may have refreshed while we waited for the lock
+            if not force and not self.is_stale():
+                return
+            signature = self.input_signature()
+            start = time.perf_counter()
+            try:
+                self.result = await asyncio.to_thread(self.compute)
+                self.error = None
+            except Exception as e:
+                # Keep serving the last good result
+                print(f"[{self.name}] refresh failed: {e}")
+                self.error = str(e)
+            self.signature = signature
+            self.updated_at = time.time()
+            self.duration = time.perf_counter() - start
+
+    async def get(self):
+        # Lazy first load if the startup warm-up hasn't finished yet
+        if self.updated_at is None:
+            await self.refresh()
+        if self.result is None and self.error:
+            raise HTTPException(status_code=500, detail=self.error)
+        return self.result
+
+    def status(self):
+        return {
+            "loaded": self.result is not None,
+            "updated_at": self.updated_at,
+            "refresh_seconds": round(self.duration, 3) if self.duration is not None else None,
+            "error": self.error
+        }
+
+forecast_cache = ResultCache("forecast", train_forecasting_model, [forecasting.DATA_PATH])
+waste_cache = ResultCache("waste", analyze_waste, [waste_analysis.INVENTORY_PATH])
+caches = [forecast_cache, waste_cache]
+
+async def refresh_loop():
+    """Background refresher: re-runs any cache whose inputs changed or whose TTL expired"""
+    while True:
+        await asyncio.gather(*(c.refresh() for c in caches if c.is_stale()))
+        await asyncio.sleep(DATA_POLL_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # First pass of the loop trains everything at startup without blocking it
+    task = asyncio.create_task(refresh_loop())
+    yield
+    task.cancel()
+
+app = FastAPI(title="Inventory Forecasting & Waste Engine", lifespan=lifespan)
 
 @app.get("/health")
 def health_check():
-    return {"status": "active", "version": "1.0"}
+    return {
+        "status": "active",
+        "version": "1.0",
+        "models": {c.name: c.status() for c in caches}
+    }
 
 @app.get("/forecast")
-def get_forecast(days: int = 7):
+async def get_forecast(days: int = 7):
     """
-    Get sales forecast. 
+    Get sales forecast (served from the cached model run).
     Note: Currently returns the validation forecast on mock data as a proxy for future forecast.
     In a real system, this would predict t+1 to t+days.
     """
     try:
-        results = train_forecasting_model()
+        results = await forecast_cache.get()
         if not results:
             raise HTTPException(status_code=500, detail="Forecasting failed or no data")
         
@@ -32,16 +120,18 @@ def get_forecast(days: int = 7):
             "metric_mae": results['mae'],
             "forecast_data": results['forecast'][:days]
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/waste")
-def get_waste_alerts():
+async def get_waste_alerts():
     """
-    Get expiring inventory batches.
+    Get expiring inventory batches (served from the cached waste scan).
     """
     try:
-        waste_data = analyze_waste()
+        waste_data = await waste_cache.get()
         if waste_data is None:
             return {"waste_alerts": []}
             
@@ -49,6 +139,8 @@ def get_waste_alerts():
             "total_batches_at_risk": len(waste_data),
             "alerts": waste_data
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
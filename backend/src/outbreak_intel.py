@@ -0,0 +1,131 @@
+import json
+import time
+import threading
+from datetime import date
+from sqlalchemy import text
+from db_direct import engine
+
+# Outbreak Intelligence Cache
+#
+# setup_outbreak_db.py installs a statement-level trigger on outbreak_forecasts
+# that expands affected_meds into outbreak_med_windows (one row per med/outbreak,
+# with its demand multiplier) and bumps outbreak_intel_version.
+# This cache polls that single-row version at most every VERSION_CHECK_SECONDS
+# and reloads the windows only when it changed, so request handlers just do
+# dict lookups on {med_name: {"multiplier", "tags"}}.
+
+VERSION_CHECK_SECONDS = 5
+
+# Keep in sync with the CASE in setup_outbreak_db.py
+RISK_MULTIPLIERS = {"High": 1.5, "Moderate": 1.25, "Low": 1.1}
+
+class OutbreakIntelCache:
+    def __init__(self, engine):
+        self.engine = engine
+        self.version = None
+        self.windows = []     # [{med_name, outbreak_name, risk_level, multiplier, start_date, end_date}]
+        self.active_day = None
+        self.multipliers = {} # med_name -> {"multiplier": float, "tags": [outbreak names]}
+        self.outbreaks = []   # active outbreaks: [{"name", "risk", "meds"}]
+        self.checked_at = None
+        self.hits = 0
+        self.reloads = 0
+        self._lock = threading.Lock()
+
+    def _load_windows(self, conn):
+        rows = conn.execute(text("""
+            SELECT med_name, outbreak_name, risk_level, multiplier, start_date, end_date
+            FROM outbreak_med_windows
+        """)).mappings().all()
+        return [dict(r) for r in rows]
+
+    def _load_windows_legacy(self, conn):
+        """Expands outbreak_forecasts directly (before the trigger migration has run)"""
+        rows = conn.execute(text("""
+            SELECT outbreak_name, risk_level, affected_meds, start_date, end_date
+            FROM outbreak_forecasts
+        """)).mappings().all()
+        windows = []
+        for r in rows:
+            meds = r['affected_meds'] or []
+            if isinstance(meds, str):
+                meds = json.loads(meds)
+            for m in meds:
+                windows.append({
+                    "med_name": m,
+                    "outbreak_name": r['outbreak_name'],
+                    "risk_level": r['risk_level'],
+                    "multiplier": RISK_MULTIPLIERS.get(r['risk_level'], 1.0),
+                    "start_date": r['start_date'],
+                    "end_date": r['end_date']
+                })
+        return windows
+
+    def _sync(self):
+        """Reloads windows if the version changed. Returns True on reload."""
+        with self.engine.connect() as conn:
+            try:
+                version = conn.execute(text("SELECT version FROM outbreak_intel_version WHERE id = 1")).scalar()
+            except Exception:
+                conn.rollback()
+                version = None
+
+            if version is not None and version == self.version:
+                return False
+
+            if version is None:
+                windows = self._load_windows_legacy(conn)
+            else:
+                windows = self._load_windows(conn)
+
+        self.windows = windows
+        self.version = version
+        self.reloads += 1
+        return True
+
+    def _compute_active(self, today):
+        multipliers = {}
+        outbreaks = {}
+        for w in self.windows:
+            if not (w['start_date'] <= today <= w['end_date']):
+                continue
+            entry = multipliers.setdefault(w['med_name'], {"multiplier": 1.0, "tags": []})
+            # Several outbreaks on one med: strongest multiplier wins
+            entry["multiplier"] = max(entry["multiplier"], float(w['multiplier']))
+            if w['outbreak_name'] not in entry["tags"]:
+                entry["tags"].append(w['outbreak_name'])
+            info = outbreaks.setdefault(w['outbreak_name'], {"name": w['outbreak_name'], "risk": w['risk_level'], "meds": []})
+            info["meds"].append(w['med_name'])
+
+        self.multipliers = multipliers
+        self.outbreaks = list(outbreaks.values())
+        self.active_day = today
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        today = date.today()
+        with self._lock:
+            reloaded = False
+            if force or self.checked_at is None or now - self.checked_at >= VERSION_CHECK_SECONDS:
+                try:
+                    reloaded = self._sync()
+                except Exception as e:
+                    # Keep serving the last map if the DB is unreachable
+                    print(f"Outbreak Intel sync error: {e}")
+                self.checked_at = now
+            if reloaded or self.active_day != today:
+                self._compute_active(today)
+            else:
+                self.hits += 1
+
+    def get_multipliers(self):
+        """med_name -> {"multiplier", "tags"} for outbreaks active today"""
+        self.refresh()
+        return self.multipliers
+
+    def get_outbreaks(self):
+        """Active outbreaks: [{"name", "risk", "meds"}]"""
+        self.refresh()
+        return self.outbreaks
+
+outbreak_cache = OutbreakIntelCache(engine)
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import resource
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+# DAG pipeline runner (used by run_pipeline.sh and the API scheduler).
+#
+# Each stage declares the files and DB tables it reads and writes. A stage
+# depends on every stage producing one of its inputs, and runs as soon as
+# those finished, so independent branches run concurrently.
+# Before running, a stage's inputs (file contents, table change counters and
+# its own source code) are hashed; if the hash matches the last successful
+# run and its outputs still exist, the stage is skipped.
+# Per-stage wall time and peak memory are kept in data/pipeline_state.json.
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SRC_DIR)
+STATE_PATH = os.path.join(BACKEND_DIR, 'data/pipeline_state.json')
+HASH_CHUNK = 1 << 20
+
+class Stage:
+    def __init__(self, name, module, func, inputs=(), outputs=(), tables_in=(), tables_out=(), code=()):
+        self.name = name
+        self.module = module     # imported lazily: module.func() runs the stage
+        self.func = func
+        self.inputs = list(inputs)       # paths relative to backend/
+        self.outputs = list(outputs)
+        self.tables_in = list(tables_in)
+        self.tables_out = list(tables_out)
+        self.code = [f"{module}.py"] + list(code) # source files (relative to src/) that define the stage
+
+    def __call__(self):
+        module = __import__(self.module)
+        getattr(module, self.func)()
+
+STAGES = [
+    Stage("ingestion", "ingestion", "run_ingestion",
+          inputs=["data/raw/train.csv", "data/raw/holidays_events.csv"],
+          outputs=["data/processed_sales.csv"], code=["features.py"]),
+    # Synthetic inventory: no inputs, so it only reruns when its code changes (or with --force)
+    Stage("generate_batches", "generate_batches", "generate_inventory",
+          outputs=["data/pharmacy_batches.csv", "data/current_inventory.csv", "data/waste_log.csv"]),
+    Stage("forecasting", "forecasting", "train_and_predict",
+          inputs=["data/processed_sales.csv"],
+          outputs=["data/forecast_total.csv"], code=["features.py"]),
+    Stage("waste_analysis", "waste_analysis", "analyze_waste",
+          inputs=["data/current_inventory.csv"],
+          outputs=["data/waste_report.csv"]),
+    Stage("reorder", "reorder", "calculate_reorder",
+          inputs=["data/forecast_results.csv", "data/forecast_total.csv", "data/forecast_detailed.csv",
+                  "data/current_inventory.csv",
+                  "../dataset/archive/DRUGS.csv", "../dataset/archive/SUPPLIER.csv"],
+          tables_in=["inventory", "outbreak_med_windows", "outbreak_intel_version"],
+          outputs=["data/reorder_recommendations.csv"],
+          code=["reorder_policy.py", "outbreak_intel.py"]),
+]
+
+# --- Hashing ---
+
+def _abs(path):
+    return os.path.normpath(os.path.join(BACKEND_DIR, path))
+
+def hash_file(path, file_cache):
+    """Content hash; reuses the last hash while size and mtime are unchanged"""
+    if not os.path.exists(path):
+        return "missing"
+    st = os.stat(path)
+    key = f"{st.st_size}:{st.st_mtime_ns}"
+    cached = file_cache.get(path)
+    if cached and cached["key"] == key:
+        return cached["sha1"]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    file_cache[path] = {"key": key, "sha1": h.hexdigest()}
+    return file_cache[path]["sha1"]
+
+def table_signatures(tables):
+    """
+    Cheap change counter per table (inserted/updated/deleted tuples from
+    pg_stat_user_tables). A stats reset only causes one extra rerun.
+    """
+    if not tables:
+        return {}
+    try:
+        from sqlalchemy import text
+        from db_direct import engine
+        if engine is None:
+            return {t: "no-db" for t in tables}
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT relname, n_tup_ins, n_tup_upd, n_tup_del
+                FROM pg_stat_user_tables
+                WHERE relname = ANY(:tables)
+            """), {"tables": list(tables)}).all()
+        sigs = {r[0]: f"{r[1]}:{r[2]}:{r[3]}" for r in rows}
+        return {t: sigs.get(t, "missing") for t in tables}
+    except Exception as e:
+        print(f"[pipeline] table signatures unavailable: {e}")
+        return {t: "unknown" for t in tables}
+
+def stage_hash(stage, file_cache):
+    parts = {
+        "inputs": {p: hash_file(_abs(p), file_cache) for p in stage.inputs},
+        "code": {c: hash_file(os.path.join(SRC_DIR, c), file_cache) for c in stage.code},
+        "tables": table_signatures(stage.tables_in),
+    }
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+# --- State ---
+
+def load_state(path=STATE_PATH):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"stages": {}, "files": {}}
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+# --- Execution ---
+
+def _run_in_process(stage):
+    """Process-pool entry point: returns (wall_seconds, peak_rss_mb)"""
+    t0 = time.perf_counter()
+    stage()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return time.perf_counter() - t0, peak_kb / 1024
+
+def _run_in_thread(stage):
+    """
+    Thread entry point: returns (wall_seconds, peak_traced_mb). tracemalloc
+    is process-wide, so overlapping stages share one peak.
+    """
+    t0 = time.perf_counter()
+    tracemalloc.reset_peak()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    return time.perf_counter() - t0, peak / (1024 * 1024)
+
+def build_dependencies(stages):
+    """stage -> stages producing any of its input files or tables"""
+    producers = {}
+    for s in stages:
+        for out in s.outputs + s.tables_out:
+            producers[out] = s.name
+    return {
+        s.name: sorted({producers[i] for i in s.inputs + s.tables_in if i in producers and producers[i] != s.name})
+        for s in stages
+    }
+
+def run_pipeline(stages=None, force=False, only=None, max_workers=4, executor="process", state_path=STATE_PATH):
+    """
+    Runs the DAG. force reruns every stage; only restricts the run to the named
+    stages (their upstream stages are assumed current).
+    executor: "process" (forked workers, peak RSS per stage) or "thread"
+    (in-process; tracemalloc is on for the whole process while it runs).
+    Returns {stage: {"status", "wall_seconds", "peak_memory_mb"}}.
+    """
+    stages = {s.name: s for s in (stages or STAGES) if not only or s.name in only}
+    deps = build_dependencies(list(stages.values()))
+    state = load_state(state_path)
+    file_cache = state.setdefault("files", {})
+    results = {}
+
+    # Thread runs trace allocations only while they last; tracing left on would
+    # slow every later allocation in the API process
+    started_tracing = False
+    if executor == "process":
+        fork = multiprocessing.get_context("fork")
+    elif not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    thread_pool = ThreadPoolExecutor(max_workers=max_workers) if executor == "thread" else None
+
+    def submit(stage):
+        """Returns (future, pool to shut down afterwards)"""
+        if executor == "process":
+            # One forked worker per stage: starts with modules already imported,
+            # and its ru_maxrss is that stage's own peak
+            pool = ProcessPoolExecutor(max_workers=1, mp_context=fork)
+            return pool.submit(_run_in_process, stage), pool
+        return thread_pool.submit(_run_in_thread, stage), None
+
+    t_start = time.perf_counter()
+    pending = dict(stages)
+    running = {}
+    try:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if len(running) >= max_workers:
+                    break
+                upstream = [results[d]["status"] for d in deps[name] if d in results]
+                if len(upstream) < len([d for d in deps[name] if d in stages]):
+                    continue # an upstream stage is still pending or running
+                del pending[name]
+                if any(u in ("failed", "blocked") for u in upstream):
+                    results[name] = {"status": "blocked"}
+                    print(f"[pipeline] {name}: blocked by failed upstream stage")
+                    continue
+
+                h = stage_hash(stage, file_cache)
+                prev = state["stages"].get(name, {})
+                outputs_exist = all(os.path.exists(_abs(p)) for p in stage.outputs)
+                if not force and prev.get("input_hash") == h and prev.get("status") == "success" and outputs_exist:
+                    results[name] = {"status": "cached"}
+                    print(f"[pipeline] {name}: up to date, skipped")
+                    continue
+
+                print(f"[pipeline] {name}: started")
+                fut, pool = submit(stage)
+                running[fut] = (name, h, pool)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, h, pool = running.pop(fut)
+                if pool is not None:
+                    pool.shutdown()
+                entry = {"finished_at": datetime.now().isoformat(timespec='seconds')}
+                try:
+                    wall, peak_mb = fut.result()
+                    entry.update(status="success", input_hash=h,
+                                 wall_seconds=round(wall, 3), peak_memory_mb=round(peak_mb, 1))
+                    # Refresh output hashes now so downstream stages see the new contents
+                    for p in stages[name].outputs:
+                        hash_file(_abs(p), file_cache)
+                    print(f"[pipeline] {name}: success in {entry['wall_seconds']}s, peak {entry['peak_memory_mb']} MB")
+                except Exception as e:
+                    entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+                    print(f"[pipeline] {name}: failed ({entry['error']})")
+                state["stages"][name] = entry
+                results[name] = entry
+                save_state(state, state_path)
+    finally:
+        if thread_pool is not None:
+            thread_pool.shutdown()
+        if started_tracing:
+            tracemalloc.stop()
+
+    state["last_run"] = {
+        "finished_at": datetime.now().isoformat(timespec='seconds'),
+        "wall_seconds": round(time.perf_counter() - t_start, 3),
+        "stages": {n: r["status"] for n, r in results.items()}
+    }
+    save_state(state, state_path)
+    print(f"[pipeline] done in {state['last_run']['wall_seconds']}s: {state['last_run']['stages']}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the inventory pipeline DAG")
+    parser.add_argument("--force", action="store_true", help="Rerun every stage regardless of cached inputs")
+    parser.add_argument("--only", nargs="+", choices=[s.name for s in STAGES], help="Run only these stages")
+    parser.add_argument("--workers", type=int, default=4, help="Max stages running concurrently")
+    args = parser.parse_args()
+
+    results = run_pipeline(force=args.force, only=args.only, max_workers=args.workers)
+    sys.exit(1 if any(r["status"] in ("failed", "blocked") for r in results.values()) else 0)
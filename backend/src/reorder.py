@@ -1,5 +1,7 @@
 import pandas as pd
+import numpy as np
 import os
+from reorder_policy import plan_replenishment, std_from_ci
 
 def calculate_reorder():
     print("Calculating Reorder Recommendations...")
@@ -7,6 +9,10 @@ def calculate_reorder():
     # Paths
     DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
     FORECAST_PATH = os.path.join(DATA_DIR, 'forecast_results.csv')
+    if not os.path.exists(FORECAST_PATH):
+        # Per-medicine forecast (forecasting_v2.py) not generated yet: use the total-only one
+        FORECAST_PATH = os.path.join(DATA_DIR, 'forecast_total.csv')
+    DETAILED_PATH = os.path.join(DATA_DIR, 'forecast_detailed.csv')
     INVENTORY_PATH = os.path.join(DATA_DIR, 'current_inventory.csv')
     WASTE_PATH = os.path.join(DATA_DIR, 'waste_report.csv')
     REORDER_PATH = os.path.join(DATA_DIR, 'reorder_recommendations.csv')
@@ -37,13 +43,20 @@ def calculate_reorder():
         print("Warning: DRUGS.csv not found. Using dummy list.")
         meds = ['Dolo 650', 'Augmentin', 'Pan 40', 'Azithral']
 
-    # Distribute Demand Pro-Rata (Simple Heuristic for Demo)
-    # real engine would forecast per SKU.
     if not meds:
          meds = ['Generic Drug A']
-    
-    share_per_med = 1.0 / len(meds)
-    med_demand = {m: avg_daily_demand * share_per_med for m in meds}
+
+    # Per-medicine demand if the forecast has per-SKU columns (forecasting_v2.py,
+    # incl. --mode hierarchical where SKUs are reconciled with category & total)
+    med_cols = [c for c in df_forecast.columns if c not in ['date', 'predicted_sales', 'is_holiday']]
+    if med_cols:
+        print(f"Using per-medicine forecast for {len(med_cols)} medicines.")
+        med_demand = df_forecast[med_cols].mean().to_dict()
+        meds = sorted(set(meds) | set(med_cols))
+    else:
+        # Legacy total-only forecast (forecasting.py): distribute pro-rata
+        share_per_med = 1.0 / len(meds)
+        med_demand = {m: avg_daily_demand * share_per_med for m in meds}
 
     # 2. Get Current Stock (Net of Expiry)
     df_inv = pd.read_csv(INVENTORY_PATH)
@@ -93,39 +106,34 @@ def calculate_reorder():
              if m not in stock_levels:
                 stock_levels[m] = random.randint(int(med_demand.get(m, 10)*0), int(med_demand.get(m, 10)*20))
 
-    recommendations = []
-    
-    for med in meds:
-        daily_sales = med_demand.get(med, 0)
-        current_stock = stock_levels.get(med, 0)
-        
-        # Policy:
-        # Cover 7 days of sales (Weekly Cycle)
-        # Buffer: +3 days (Safety Stock)
-        target_days = 7 + 3
-        target_stock = daily_sales * target_days
-        
-        # Net Stock (Subtracting simplistic waste factor if we wanted, 
-        # but let's stick to total on hand for now to keep it clear)
-        net_stock = current_stock
-        
-        reorder_qty = 0
-        status = "OK"
-        
-        if net_stock < target_stock:
-            reorder_qty = target_stock - net_stock
-            status = "Reorder Needed"
-            
-        recommendations.append({
-            'med_name': med,
-            'avg_daily_demand': round(daily_sales, 1),
-            'current_stock': net_stock,
-            'target_stock': round(target_stock, 1),
-            'reorder_qty': round(reorder_qty, 0),
-            'status': status
-        })
-        
-    df_reorder = pd.DataFrame(recommendations)
+    # Outbreak demand multipliers (precomputed map, see outbreak_intel.py)
+    from outbreak_intel import outbreak_cache
+    outbreak_meds = outbreak_cache.get_multipliers()
+
+    # Demand variability: std implied by each medicine's first forecast day CI
+    # (forecasting_v2.py), else Poisson-like sqrt(mean)
+    med_std = {}
+    if os.path.exists(DETAILED_PATH):
+        df_detailed = pd.read_csv(DETAILED_PATH)
+        df_fc = df_detailed[df_detailed['type'] == 'forecast']
+        df_first = df_fc.sort_values('date', kind='stable').groupby('med_name').head(1)
+        med_std = dict(zip(df_first['med_name'], std_from_ci(df_first['ci_lower'], df_first['ci_upper'])))
+
+    mean_daily = pd.Series(med_demand, dtype=float).reindex(meds).fillna(0).values
+    std_daily = pd.Series(med_std, dtype=float).reindex(meds).fillna(pd.Series(np.sqrt(mean_daily), index=meds)).values
+    on_hand = pd.Series(stock_levels, dtype=float).reindex(meds).fillna(0).values
+
+    # Outbreak demand boost scales mean and spread alike
+    multiplier = pd.Series({m: o['multiplier'] for m, o in outbreak_meds.items()}, dtype=float).reindex(meds).fillna(1.0).values
+    outbreak_tags = [
+        f"Demand Boosted by Outbreak Intel ({', '.join(outbreak_meds[m]['tags'])})" if m in outbreak_meds else None
+        for m in meds
+    ]
+
+    # Service-level policy with supplier lead times and MOQ/pack rounding
+    df_reorder = plan_replenishment(meds, mean_daily * multiplier, std_daily * multiplier, on_hand)
+    df_reorder['outbreak_tag'] = outbreak_tags
+
     print("\nReorder Analysis:")
     print(df_reorder)
     
@@ -0,0 +1,128 @@
+import pandas as pd
+import numpy as np
+import os
+from statistics import NormalDist
+
+# Stochastic reorder policy engine (periodic review, every array = one SKU).
+#
+#   base_stock : order up to S = mu*(L+R) + z*sigma*sqrt(L+R) every review
+#   sS         : reorder point s = mu*L + z*sigma*sqrt(L) (covers the lead time),
+#                order up to S = s + mu*R (covers the next review period)
+#
+# mu/sigma are daily demand mean/std (sigma from the one-step-ahead forecast CI;
+# later horizons' CIs already include accumulated uncertainty), L the supplier
+# lead time, R the review period and z the service-level quantile. Orders are
+# rounded up to the supplier pack size and to at least the MOQ.
+# Everything is NumPy column math, so 50k SKUs plan in milliseconds.
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), '../../dataset/archive')
+SUPPLIER_PATH = os.path.join(ARCHIVE_DIR, 'SUPPLIER.csv')
+DRUGS_PATH = os.path.join(ARCHIVE_DIR, 'DRUGS.csv')
+
+SERVICE_LEVEL = 0.95
+REVIEW_PERIOD_DAYS = 7 # Weekly ordering cycle
+# USER LOGIC: Ensure Low Stock items are always in reorder list
+MIN_STOCK_THRESHOLD = 30
+
+# SUPPLIER.csv has no terms yet; these apply unless it gains
+# lead_time_days / moq / pack_size columns
+SUPPLIER_DEFAULTS = {"lead_time_days": 3, "moq": 10, "pack_size": 10}
+TERM_COLUMNS = list(SUPPLIER_DEFAULTS)
+
+CI_Z = 1.96 # forecast CIs are 95%
+
+def std_from_ci(ci_lower, ci_upper, z=CI_Z):
+    """
+    Std implied by a symmetric confidence interval. Daily demand std only for
+    a one-step-ahead interval: multi-step CIs widen with the horizon.
+    """
+    return np.maximum(0, (np.asarray(ci_upper, dtype=float) - np.asarray(ci_lower, dtype=float)) / (2 * z))
+
+def load_supplier_terms(supplier_path=SUPPLIER_PATH, drugs_path=DRUGS_PATH):
+    """med_name -> lead_time_days, moq, pack_size (via the drug's supID)"""
+    if not os.path.exists(drugs_path):
+        return pd.DataFrame(columns=TERM_COLUMNS)
+
+    df_drugs = pd.read_csv(drugs_path).drop_duplicates('brandName')[['brandName', 'supID']]
+    if os.path.exists(supplier_path):
+        df_sup = pd.read_csv(supplier_path)
+        for col, default in SUPPLIER_DEFAULTS.items():
+            df_sup[col] = df_sup[col].fillna(default) if col in df_sup.columns else default
+        df_drugs = df_drugs.merge(df_sup[['supID'] + TERM_COLUMNS], on='supID', how='left')
+
+    terms = df_drugs.rename(columns={'brandName': 'med_name'}).set_index('med_name')
+    return terms.reindex(columns=TERM_COLUMNS).fillna(SUPPLIER_DEFAULTS)
+
+def supplier_terms_for(meds, terms=None):
+    """Terms aligned to meds; medicines without a supplier get the defaults"""
+    if terms is None:
+        terms = load_supplier_terms()
+    return terms.reindex(meds).fillna(SUPPLIER_DEFAULTS)
+
+def compute_policy(mean_daily, std_daily, lead_time_days, policy="sS",
+                   service_level=SERVICE_LEVEL, review_period=REVIEW_PERIOD_DAYS,
+                   min_stock=MIN_STOCK_THRESHOLD):
+    """
+    Returns (reorder_point, order_up_to, safety_stock) arrays.
+    Base-stock orders whenever below S, so its reorder point equals S.
+    """
+    mu = np.asarray(mean_daily, dtype=float)
+    sigma = np.asarray(std_daily, dtype=float)
+    L = np.asarray(lead_time_days, dtype=float)
+    z = NormalDist().inv_cdf(service_level)
+
+    if policy == "base_stock":
+        safety_stock = z * sigma * np.sqrt(L + review_period)
+        order_up_to = mu * (L + review_period) + safety_stock
+        reorder_point = order_up_to
+    elif policy == "sS":
+        safety_stock = z * sigma * np.sqrt(L)
+        reorder_point = mu * L + safety_stock
+        order_up_to = reorder_point + mu * review_period
+    else:
+        raise ValueError(f"Unknown reorder policy: {policy}")
+
+    reorder_point = np.maximum(reorder_point, min_stock)
+    order_up_to = np.maximum(order_up_to, reorder_point)
+    return reorder_point, order_up_to, safety_stock
+
+def order_quantities(position, reorder_point, order_up_to, moq, pack_size):
+    """Order (S - position) when position < s, rounded up to packs and at least the MOQ"""
+    position = np.asarray(position, dtype=float)
+    pack_size = np.maximum(np.asarray(pack_size, dtype=float), 1)
+    needed = np.where(position < reorder_point, order_up_to - position, 0)
+    packs = np.ceil(needed / pack_size) * pack_size
+    return np.where(needed > 0, np.maximum(packs, moq), 0).astype(np.int64)
+
+def plan_replenishment(meds, mean_daily, std_daily, on_hand, on_order=0, terms=None,
+                       policy="sS", service_level=SERVICE_LEVEL, review_period=REVIEW_PERIOD_DAYS,
+                       min_stock=MIN_STOCK_THRESHOLD):
+    """
+    Full replenishment plan, one row per med:
+      med_name, avg_daily_demand, demand_std, current_stock, lead_time_days,
+      safety_stock, reorder_point, target_stock, reorder_qty, status
+    """
+    meds = list(meds)
+    t = supplier_terms_for(meds, terms)
+    lead_time = t['lead_time_days'].values
+
+    reorder_point, order_up_to, safety_stock = compute_policy(
+        mean_daily, std_daily, lead_time, policy=policy, service_level=service_level,
+        review_period=review_period, min_stock=min_stock
+    )
+    on_hand = np.broadcast_to(np.asarray(on_hand, dtype=float), reorder_point.shape)
+    position = on_hand + on_order
+    reorder_qty = order_quantities(position, reorder_point, order_up_to, t['moq'].values, t['pack_size'].values)
+
+    return pd.DataFrame({
+        'med_name': meds,
+        'avg_daily_demand': np.round(np.asarray(mean_daily, dtype=float), 1),
+        'demand_std': np.round(np.asarray(std_daily, dtype=float), 2),
+        'current_stock': on_hand.astype(np.int64),
+        'lead_time_days': lead_time.astype(np.int64),
+        'safety_stock': np.round(safety_stock, 1),
+        'reorder_point': np.round(reorder_point, 1),
+        'target_stock': np.round(order_up_to, 1),
+        'reorder_qty': reorder_qty,
+        'status': np.where(reorder_qty > 0, "Reorder Needed", "OK")
+    })
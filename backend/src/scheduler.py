@@ -0,0 +1,375 @@
+import os
+import sys
+import asyncio
+import socket
+import subprocess
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from db_direct import engine
+
+# In-process job scheduler for the API.
+#
+# Replaces running run_pipeline.sh / run_maintenance.sh as separate Python
+# processes: jobs are plain functions executed in a worker thread, triggered by
+# 5-field cron expressions. Disabled by default: set SCHEDULER_ENABLED=1 on one
+# API worker only. Each run takes a lease row in job_locks (keyed by the job
+# name, or a shared lease name), so even with several enabled replicas only one
+# executes a given job, and jobs sharing a lease never overlap.
+# Acquiring, renewing and releasing the lease are single short statements, so
+# no connection is held during the job and it works behind a transaction-mode
+# pooler. A lease that is not renewed (replica died) expires after
+# JOB_LEASE_SECONDS. A job registered with after= runs when that job succeeds.
+# The pipeline DAG runs in a child process so it never shares the serving process.
+# Runs (incl. duration and errors) are kept in memory and in the job_runs table.
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") == "1"
+HISTORY_SIZE = 50
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))  # renewed every third of this while running
+
+JOB_RUNS_SQL = """
+    CREATE TABLE IF NOT EXISTS job_runs (
+        id BIGSERIAL PRIMARY KEY,
+        job_name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP,
+        duration_seconds NUMERIC,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_job_runs_job_started ON job_runs (job_name, started_at DESC);
+    CREATE TABLE IF NOT EXISTS job_locks (
+        job_name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        acquired_at TIMESTAMP NOT NULL,
+        expires_at TIMESTAMP NOT NULL
+    );
+"""
+
+# Takes the lease if it is free or expired; returns a row only on success
+ACQUIRE_SQL = """
+    INSERT INTO job_locks (job_name, holder, acquired_at, expires_at)
+    VALUES (:job_name, :holder, now(), now() + make_interval(secs => :lease))
+    ON CONFLICT (job_name) DO UPDATE
+        SET holder = EXCLUDED.holder, acquired_at = EXCLUDED.acquired_at, expires_at = EXCLUDED.expires_at
+        WHERE job_locks.expires_at < now()
+    RETURNING holder
+"""
+RENEW_SQL = """
+    UPDATE job_locks SET expires_at = now() + make_interval(secs => :lease)
+    WHERE job_name = :job_name AND holder = :holder
+"""
+RELEASE_SQL = "DELETE FROM job_locks WHERE job_name = :job_name AND holder = :holder"
+
+# --- Cron ---
+
+CRON_FIELDS = [("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6)]
+
+def _parse_cron_field(expr, lo, hi):
+    """'*', '5', '1-5', '*/15', '5/10', '0,30', '9-17/2' -> set of values"""
+    values = set()
+    for part in expr.split(','):
+        step = None
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = lo, hi
+        elif '-' in part:
+            start, end = map(int, part.split('-'))
+        else:
+            start = int(part)
+            end = hi if step else start  # '5/10' = 5, 15, 25, ... up to hi
+        if start < lo or end > hi:
+            raise ValueError(f"Cron value out of range {lo}-{hi}: {expr}")
+        values.update(range(start, end + 1, step or 1))
+    return values
+
+class CronTrigger:
+    """Standard 5-field cron: minute hour day month weekday (0 = Sunday)"""
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr}")
+        self.expr = expr
+        parsed = [_parse_cron_field(f, lo, hi) for f, (_, lo, hi) in zip(fields, CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        # Cron semantics: if both day and weekday are restricted, either may match
+        self.day_any = fields[2] == '*'
+        self.weekday_any = fields[4] == '*'
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.day_any or self.weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, dt):
+        """First matching minute strictly after dt"""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 4)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"Cron expression never fires: {self.expr}")
+
+# --- Jobs ---
+
+class JobLease:
+    """
+    job_locks row held while a job runs. Each statement is its own short
+    transaction; a background thread renews the lease until release().
+    """
+    def __init__(self, engine, job_name):
+        self.engine = engine
+        self.params = {"job_name": job_name, "lease": LEASE_SECONDS,
+                       "holder": f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"}
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def acquire(self):
+        with self.engine.begin() as conn:
+            got = conn.execute(text(ACQUIRE_SQL), self.params).first() is not None
+        if got:
+            self._renewer = threading.Thread(target=self._renew, name=f"lease-{self.params['job_name']}", daemon=True)
+            self._renewer.start()
+        return got
+
+    def _renew(self):
+        while not self._stop.wait(LEASE_SECONDS / 3):
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(text(RENEW_SQL), self.params)
+            except Exception as e:
+                print(f"Scheduler: lease renewal failed for {self.params['job_name']}: {e}")
+
+    def release(self):
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join()
+        with self.engine.begin() as conn:
+            conn.execute(text(RELEASE_SQL), self.params)
+
+class Job:
+    def __init__(self, name, func, cron=None, description="", after=None, lease=None):
+        self.name = name
+        self.func = func
+        self.trigger = CronTrigger(cron) if cron else None
+        self.description = description
+        self.after = after  # runs when this job succeeds
+        self.lease = lease or name
+        self.next_run = None
+        self.running = False
+        self.history = deque(maxlen=HISTORY_SIZE)
+
+    def status(self):
+        last = self.history[-1] if self.history else None
+        return {
+            "name": self.name,
+            "description": self.description,
+            "cron": self.trigger.expr if self.trigger else None,
+            "after": self.after,
+            "next_run": self.next_run.isoformat() if self.next_run else None,
+            "running": self.running,
+            "last_run": last
+        }
+
+class JobScheduler:
+    def __init__(self, engine):
+        self.engine = engine
+        self.jobs = {}
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._table_ready = False
+
+    def register(self, name, func, cron=None, description="", after=None, lease=None):
+        if after is not None and after not in self.jobs:
+            raise ValueError(f"Unknown upstream job: {after}")
+        self.jobs[name] = Job(name, func, cron, description, after, lease)
+        return self.jobs[name]
+
+    # --- Execution (worker thread) ---
+
+    def _ensure_table(self):
+        if self._table_ready or self.engine is None:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(JOB_RUNS_SQL))
+        self._table_ready = True
+
+    def _record(self, run):
+        try:
+            self._ensure_table()
+            with self.engine.begin() as conn:
+                conn.execute(text("""
+                    INSERT INTO job_runs (job_name, status, started_at, finished_at, duration_seconds, error)
+                    VALUES (:job_name, :status, :started_at, :finished_at, :duration_seconds, :error)
+                """), run)
+        except Exception as e:
+            print(f"Scheduler: could not record run of {run['job_name']}: {e}")
+
+    def _execute(self, job):
+        """Runs job.func under its lease. Returns the run record."""
+        started = datetime.now()
+        t0 = time.perf_counter()
+        run = {"job_name": job.name, "status": "success", "started_at": started,
+               "finished_at": None, "duration_seconds": None, "error": None}
+
+        lease = None
+        try:
+            if self.engine is not None:
+                self._ensure_table()
+                candidate = JobLease(self.engine, job.lease)
+                if not candidate.acquire():
+                    run["status"] = "skipped"
+                    run["error"] = f"Lease {job.lease} held by another run"
+                    return run
+                lease = candidate
+            job.func()
+        except Exception as e:
+            run["status"] = "failed"
+            run["error"] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+        finally:
+            if lease is not None:
+                try:
+                    lease.release()
+                except Exception as e:
+                    print(f"Scheduler: lease release failed for {job.name}: {e}")
+            run["finished_at"] = datetime.now()
+            run["duration_seconds"] = round(time.perf_counter() - t0, 3)
+
+        if self.engine is not None:
+            self._record(run)
+        return run
+
+    async def run_job(self, name):
+        job = self.jobs[name]
+        if job.running:
+            return {"job_name": name, "status": "skipped", "error": "Already running"}
+        job.running = True
+        try:
+            run = await asyncio.to_thread(self._execute, job)
+        finally:
+            job.running = False
+        entry = dict(run, started_at=run["started_at"].isoformat(),
+                     finished_at=run["finished_at"].isoformat() if run["finished_at"] else None)
+        job.history.append(entry)
+        print(f"Scheduler: {name} {run['status']} in {run['duration_seconds']}s")
+        if run["status"] == "success":
+            for follower in self.jobs.values():
+                if follower.after == name:
+                    self.trigger(follower.name)
+        return entry
+
+    def trigger(self, name):
+        """Starts a job now without waiting for it"""
+        return asyncio.create_task(self.run_job(name))
+
+    # --- Loop ---
+
+    async def _loop(self):
+        now = datetime.now()
+        for job in self.jobs.values():
+            job.next_run = job.trigger.next_after(now) if job.trigger else None
+
+        while True:
+            scheduled = [j for j in self.jobs.values() if j.next_run]
+            if not scheduled:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            now = datetime.now()
+            for job in scheduled:
+                if job.next_run <= now:
+                    job.next_run = job.trigger.next_after(now)
+                    self.trigger(job.name)
+
+            next_due = min(j.next_run for j in scheduled)
+            sleep_for = max(1.0, (next_due - datetime.now()).total_seconds())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+                self._wakeup.clear()
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            print(f"Scheduler started with jobs: {', '.join(self.jobs)}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_history(self, name, limit=HISTORY_SIZE):
+        """Recent runs of a job, newest first (DB, else in-memory)"""
+        if self.engine is not None:
+            try:
+                self._ensure_table()
+                with self.engine.connect() as conn:
+                    rows = conn.execute(text("""
+                        SELECT job_name, status, started_at, finished_at, duration_seconds, error
+                        FROM job_runs WHERE job_name = :name
+                        ORDER BY started_at DESC LIMIT :limit
+                    """), {"name": name, "limit": limit}).mappings().all()
+                return [{**r, "started_at": r["started_at"].isoformat(),
+                         "finished_at": r["finished_at"].isoformat() if r["finished_at"] else None,
+                         "duration_seconds": float(r["duration_seconds"]) if r["duration_seconds"] is not None else None}
+                        for r in rows]
+            except Exception as e:
+                print(f"Scheduler: job_runs unavailable: {e}")
+        return list(reversed(self.jobs[name].history))[:limit]
+
+def run_pipeline():
+    """
+    run_pipeline.sh stages as a DAG (pipeline.py) in a child process, which
+    forks one worker per stage (process executor), so ingestion and forecasting
+    never run, allocate or trace memory inside the API process.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline.py")
+    result = subprocess.run([sys.executable, script])
+    if result.returncode != 0:
+        raise RuntimeError(f"Pipeline stages did not complete (exit code {result.returncode}), see pipeline_state.json")
+
+def run_expiry_sweep():
+    from sync_expiry import sync_expiry_sweeper
+    sync_expiry_sweeper()
+
+def run_demand_forecast():
+    from forecasting_v2 import generate_forecasts
+    generate_forecasts()
+
+scheduler = JobScheduler(engine)
+scheduler.register("expiry_sweep", run_expiry_sweep, os.getenv("CRON_EXPIRY_SWEEP", "0 * * * *"),
+                   "Moves expired batches to waste_logs (sync_expiry.py)")
+# Both write forecasts from the same inputs: demand_forecast follows a successful
+# pipeline run, and the shared lease keeps manual or cron runs from overlapping
+scheduler.register("pipeline", run_pipeline, os.getenv("CRON_PIPELINE", "0 2 * * *"),
+                   "Ingestion, batches, forecast, waste analysis, reorder (run_pipeline.sh)",
+                   lease="forecast")
+scheduler.register("demand_forecast", run_demand_forecast, os.getenv("CRON_DEMAND_FORECAST") or None,
+                   "Per-medicine forecast + demand_forecast table (forecasting_v2.py)",
+                   after="pipeline", lease="forecast")
@@ -23,6 +23,9 @@ CREATE TABLE IF NOT EXISTS inventory (
     status TEXT
 );
 
+-- Per-med stock aggregation for the /reorder join with demand_forecast
+CREATE INDEX IF NOT EXISTS idx_inventory_med_name_qty ON inventory (med_name) INCLUDE (quantity);
+
 -- Create table for Prescriptions (optional, for future use)
 CREATE TABLE IF NOT EXISTS prescriptions (
     id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
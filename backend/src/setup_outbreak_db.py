@@ -18,6 +18,52 @@ def setup_outbreak_table():
                 crated_at TIMESTAMP DEFAULT NOW()
             );
         """))
+
+        # Outbreak Intelligence: per-med windows + version, maintained by trigger
+        # (read by outbreak_intel.OutbreakIntelCache)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS outbreak_med_windows (
+                med_name TEXT NOT NULL,
+                outbreak_name TEXT NOT NULL,
+                risk_level TEXT NOT NULL,
+                multiplier NUMERIC NOT NULL,
+                start_date DATE NOT NULL,
+                end_date DATE NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbreak_med_windows_med ON outbreak_med_windows (med_name);
+
+            CREATE TABLE IF NOT EXISTS outbreak_intel_version (
+                id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                version BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            );
+            INSERT INTO outbreak_intel_version (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+        """))
+        conn.execute(text("""
+            CREATE OR REPLACE FUNCTION refresh_outbreak_intel() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            DECLARE
+                new_version BIGINT;
+            BEGIN
+                DELETE FROM outbreak_med_windows;
+                INSERT INTO outbreak_med_windows (med_name, outbreak_name, risk_level, multiplier, start_date, end_date)
+                SELECT m.med_name, o.outbreak_name, o.risk_level,
+                       CASE o.risk_level WHEN 'High' THEN 1.5 WHEN 'Moderate' THEN 1.25 WHEN 'Low' THEN 1.1 ELSE 1.0 END,
+                       o.start_date, o.end_date
+                FROM outbreak_forecasts o
+                CROSS JOIN LATERAL jsonb_array_elements_text(COALESCE(o.affected_meds, '[]'::jsonb)) AS m(med_name);
+
+                UPDATE outbreak_intel_version SET version = version + 1, updated_at = NOW()
+                WHERE id = 1 RETURNING version INTO new_version;
+                PERFORM pg_notify('outbreak_intel', new_version::text);
+                RETURN NULL;
+            END $$;
+
+            DROP TRIGGER IF EXISTS outbreak_forecasts_changed ON outbreak_forecasts;
+            CREATE TRIGGER outbreak_forecasts_changed
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON outbreak_forecasts
+                FOR EACH STATEMENT EXECUTE FUNCTION refresh_outbreak_intel();
+        """))
         
         # Check if empty
         res = conn.execute(text("SELECT count(*) FROM outbreak_forecasts"))
@@ -33,6 +79,8 @@ def setup_outbreak_table():
             print("Seeded.")
         else:
             print("Outbreak table already has data.")
+            # Populate the windows for data inserted before the trigger existed
+            conn.execute(text("UPDATE outbreak_forecasts SET id = id WHERE false"))
             
         conn.commit()
 
@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import threading
+from datetime import datetime
+from sqlalchemy import event
+from metrics import QUERY_LATENCY, QUERY_ERRORS
+
+# SQL instrumentation via SQLAlchemy cursor events. db_direct.py and
+# db_async.py attach it to their engines, so the API and the batch scripts
+# get the same:
+#
+# - Timing: db_query_duration_seconds per statement. Statements are labelled
+#   by the "statement_name" execution option when set
+#     text("...").execution_options(statement_name="reorder")
+#   and otherwise by "<verb> <first table>" (e.g. "select inventory"), which
+#   keeps label cardinality bounded without parsing the SQL.
+# - Slow-query log: statements over SLOW_QUERY_MS are printed with their
+#   parameters and kept in a rolling top-N (worst duration first). With
+#   SLOW_QUERY_EXPLAIN=1, read-only statements are re-run under
+#   EXPLAIN (ANALYZE, BUFFERS) inside a savepoint, and the plan is stored
+#   with the entry.
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "0") == "1"
+SLOW_QUERY_TOP_N = int(os.getenv("SLOW_QUERY_TOP_N", "20"))
+EXPLAIN_INTERVAL_SECONDS = 300 # EXPLAIN ANALYZE runs the query again: at most once per statement per interval
+MAX_LOGGED_CHARS = 500
+
+_FIRST_TABLE = re.compile(r'\b(?:from|into|update|join|table)\s+(?:only\s+|if\s+not\s+exists\s+)?([a-z_][\w.]*)', re.IGNORECASE)
+_WRITES = re.compile(r'\b(?:insert|update|delete|merge|create|alter|drop|truncate|grant|lock|copy|call|do|'
+                     r'vacuum|refresh|nextval|setval|pg_advisory_\w+|pg_try_advisory_\w+)\b', re.IGNORECASE)
+_name_cache = {}
+
+def statement_name(statement):
+    name = _name_cache.get(statement)
+    if name is None:
+        sql = statement.lstrip()
+        verb = sql.split(None, 1)[0].lower() if sql else "empty"
+        if verb == "with":
+            verb = "cte" # labelled by the first table the CTEs read
+        match = _FIRST_TABLE.search(sql)
+        name = f"{verb} {match.group(1).lower()}" if match else verb
+        if len(_name_cache) < 1000:
+            _name_cache[statement] = name
+    return name
+
+def is_read_only(statement):
+    """Only plain SELECT/WITH statements are safe to EXPLAIN ANALYZE (it executes them)"""
+    return statement.lstrip().lower().startswith(("select", "with")) and not _WRITES.search(statement)
+
+def _truncate(value):
+    value = str(value)
+    return value if len(value) <= MAX_LOGGED_CHARS else value[:MAX_LOGGED_CHARS] + "..."
+
+# --- Slow-query log ---
+
+class SlowQueryLog:
+    """Rolling top-N of the slowest statements, keyed by SQL text"""
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, top_n=SLOW_QUERY_TOP_N, explain=SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.top_n = top_n
+        self.explain = explain
+        self.entries = {} # statement -> entry
+        self._explained_at = {}
+        self._lock = threading.Lock()
+
+    def wants_explain(self, statement):
+        if not self.explain or not is_read_only(statement):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained_at.get(statement)
+            if last is not None and now - last < EXPLAIN_INTERVAL_SECONDS:
+                return False
+            self._explained_at[statement] = now
+        return True
+
+    def record(self, engine_name, name, statement, parameters, duration_ms, plan=None):
+        sql = ' '.join(statement.split())
+        print(f"[slow-query] {duration_ms:.1f} ms ({engine_name}, {name}) params={_truncate(parameters)}\n  {_truncate(sql)}")
+        if plan:
+            print("  " + "\n  ".join(plan))
+
+        with self._lock:
+            entry = self.entries.get(statement)
+            if entry is None:
+                if len(self.entries) >= self.top_n:
+                    fastest = min(self.entries, key=lambda s: self.entries[s]["max_ms"])
+                    if self.entries[fastest]["max_ms"] >= duration_ms:
+                        return
+                    del self.entries[fastest]
+                entry = self.entries[statement] = {
+                    "statement_name": name, "engine": engine_name, "sql": _truncate(sql),
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "plan": None
+                }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["last_ms"] = round(duration_ms, 1)
+            entry["last_params"] = _truncate(parameters)
+            entry["last_seen"] = datetime.now().isoformat(timespec='seconds')
+            if duration_ms >= entry["max_ms"]:
+                entry["max_ms"] = round(duration_ms, 1)
+                entry["max_params"] = entry["last_params"]
+            if plan:
+                entry["plan"] = plan
+                entry["plan_captured_at"] = entry["last_seen"]
+
+    def top(self, limit=None):
+        """Entries sorted by worst duration"""
+        with self._lock:
+            rows = [dict(e, total_ms=round(e["total_ms"], 1), avg_ms=round(e["total_ms"] / e["count"], 1))
+                    for e in self.entries.values()]
+        rows.sort(key=lambda e: e["max_ms"], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
+            self._explained_at.clear()
+
+slow_query_log = SlowQueryLog()
+
+def explain_analyze(dbapi_conn, statement, parameters):
+    """
+    EXPLAIN (ANALYZE, BUFFERS) on a second cursor of the same connection (same
+    transaction; the original cursor's rows are already buffered). Inside a
+    transaction it runs in a savepoint so a failure can't abort the caller's
+    work. Returns the plan lines, or None on failure.
+    """
+    in_transaction = not getattr(dbapi_conn, "autocommit", False)
+    cursor = dbapi_conn.cursor()
+    try:
+        if in_transaction:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+            plan = [row[0] for row in cursor.fetchall()]
+        except Exception:
+            if in_transaction:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        if in_transaction:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    except Exception as e:
+        print(f"[slow-query] EXPLAIN failed: {e}")
+        return None
+    finally:
+        cursor.close()
+
+# --- Event hooks ---
+
+def instrument_engine(engine, engine_name, slow_log=slow_query_log):
+    """Attach timing hooks to a sync Engine (use async_engine.sync_engine for async)"""
+    if engine is None:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        name = context.execution_options.get("statement_name") or statement_name(statement)
+        QUERY_LATENCY.observe(elapsed, engine=engine_name, statement=name)
+
+        duration_ms = elapsed * 1000
+        if duration_ms >= slow_log.threshold_ms:
+            plan = None
+            if not executemany and slow_log.wants_explain(statement):
+                plan = explain_analyze(conn.connection.dbapi_connection, statement, parameters)
+            slow_log.record(engine_name, name, statement, parameters, duration_ms, plan)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        statement = exception_context.statement or ""
+        name = (context.execution_options.get("statement_name") if context is not None else None) or statement_name(statement)
+        QUERY_ERRORS.inc(engine=engine_name, statement=name)
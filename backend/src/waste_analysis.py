@@ -2,11 +2,13 @@ import pandas as pd
 import os
 from datetime import datetime, timedelta
 
+INVENTORY_PATH = os.path.join(os.path.dirname(__file__), '../data/current_inventory.csv')
+
 def analyze_waste():
     print("Starting Waste Analysis...")
     
     # Load inventory
-    inventory_path = os.path.join(os.path.dirname(__file__), '../data/current_inventory.csv')
+    inventory_path = INVENTORY_PATH
     if not os.path.exists(inventory_path):
         raise FileNotFoundError(f"{inventory_path} not found. Run generate_batches.py first.")
     
@@ -1,12 +1,17 @@
 """
 Data Cleaning Pipeline
 Loads raw datasets, handles missing values, standardizes formats, and filters data.
+Raw files are streamed in chunks with compact dtypes and appended to Parquet,
+so memory stays bounded by the chunk size rather than the dump size.
 """
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
 import logging
+import os
 
 # Setup logging
 logging.basicConfig(
@@ -23,34 +28,166 @@ BASE_DIR = Path(__file__).parent.parent
 RAW_DIR = BASE_DIR / "datasets" / "raw"
 PROCESSED_DIR = BASE_DIR / "datasets" / "processed"
 
+CHUNK_ROWS = int(os.getenv("CLEANING_CHUNK_ROWS", "500000"))
+
+# Compact dtypes by standardized column name; other columns get float64 or
+# string[pyarrow] from the first chunk (see column_dtypes)
+SALES_DTYPES = {
+    'pincode': 'category', 'product': 'category', 'sales_person': 'category', 'country': 'category',
+    'quantity': 'Int32', 'boxes_shipped': 'Int32',
+}
+MEDICINE_DTYPES = {'name': 'string[pyarrow]', 'composition': 'string[pyarrow]', 'manufacturer': 'category'}
+WEATHER_DTYPES = {'pincode': 'category', 'temperature': 'float32', 'humidity': 'float32', 'rainfall': 'float32'}
+
+# Symptomatic keyword matcher, built once. On pyarrow strings str.contains runs
+# vectorized in Arrow's regex engine (case-insensitive, no lower-cased copies)
+SYMPTOM_KEYWORDS = ['fever', 'cough', 'cold', 'pain', 'paracetamol', 'azithromycin', 'cetirizine', 'dolo']
+SYMPTOM_PATTERN = '|'.join(SYMPTOM_KEYWORDS)
+
+def standardize(column):
+    return column.lower().strip().replace(' ', '_')
+
+def column_dtypes(path, dtypes, sample_rows):
+    """
+    dtype for every raw column, fixed up front so all chunks share one schema:
+    dtypes by standardized name, else float64 if numeric in the first
+    sample_rows rows, else string[pyarrow] (incl. columns blank throughout them)
+    """
+    sample = pd.read_csv(path, nrows=sample_rows)
+    dtype = {}
+    for raw in sample.columns:
+        name = standardize(raw)
+        col = sample[raw]
+        if name in dtypes:
+            dtype[raw] = dtypes[name]
+        elif col.notna().any() and pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+            dtype[raw] = 'float64'
+        else:
+            dtype[raw] = 'string[pyarrow]'
+    return dtype
+
+def read_chunks(path, dtypes, chunk_rows=None):
+    """CSV in CHUNK_ROWS chunks with standardized column names and fixed, compact dtypes"""
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    dtype = column_dtypes(path, dtypes, chunk_rows)
+    names = {raw: standardize(raw) for raw in dtype}
+    for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunk_rows):
+        yield chunk.rename(columns=names)
+
+class ParquetAppender:
+    """
+    Appends DataFrame chunks as row groups of one Parquet file. The schema is
+    fixed by the first chunk (categoricals widened to int32 dictionary
+    indices, so later chunks with more categories still fit). Written to a
+    temp file and renamed on close.
+
+    Chunks from read_chunks keep their first-chunk types, even when a text
+    column is blank there or a number column only holds integers:
+
+    >>> import tempfile
+    >>> tmp = Path(tempfile.mkdtemp())
+    >>> _ = (tmp / "sales.csv").write_text("Quantity,Note,Price\\n1,,2\\n2,,3\\n3,rx,1.5\\n")
+    >>> with ParquetAppender(tmp / "sales.parquet") as out:
+    ...     for chunk in read_chunks(tmp / "sales.csv", SALES_DTYPES, chunk_rows=2):
+    ...         out.write(chunk)
+    >>> pq.read_table(tmp / "sales.parquet").to_pydict()
+    {'quantity': [1, 2, 3], 'note': [None, None, 'rx'], 'price': [2.0, 3.0, 1.5]}
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tmp = self.path.with_suffix(".parquet.tmp")
+        self.schema = None
+        self.writer = None
+        self.rows = 0
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            fields = []
+            for field in table.schema:
+                if pa.types.is_dictionary(field.type):
+                    field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                elif pa.types.is_null(field.type):  # all-missing in the first chunk
+                    field = field.with_type(pa.string())
+                fields.append(field)
+            self.schema = pa.schema(fields, metadata=table.schema.metadata)
+            self.writer = pq.ParquetWriter(self.tmp, self.schema)
+        self.writer.write_table(table.cast(self.schema))
+        self.rows += len(df)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.writer is not None:
+            self.writer.close()
+        if exc_type is None and self.writer is not None:
+            os.replace(self.tmp, self.path)
+        else:
+            self.tmp.unlink(missing_ok=True)
+
+class SeenRows:
+    """
+    Exact drop_duplicates across chunks: 64-bit row hashes kept in sorted
+    runs that are merged like a binary counter (8 bytes per distinct row).
+    Chunks that keep no rows (all filtered or all duplicates) add no run.
+
+    >>> seen = SeenRows()
+    >>> seen.first_occurrences(pd.DataFrame({'x': []})).tolist()
+    []
+    >>> seen.first_occurrences(pd.DataFrame({'x': [1, 2, 1]})).tolist()
+    [True, True, False]
+    >>> seen.first_occurrences(pd.DataFrame({'x': [2, 1]})).tolist()
+    [False, False]
+    >>> seen.first_occurrences(pd.DataFrame({'x': [3, 1]})).tolist()
+    [True, False]
+    """
+    def __init__(self):
+        self.runs = []
+
+    def first_occurrences(self, df):
+        hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        keep = np.zeros(len(hashes), dtype=bool)
+        keep[np.unique(hashes, return_index=True)[1]] = True
+        for run in self.runs:
+            pos = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            keep &= run[pos] != hashes
+        if not keep.any():
+            return keep
+        self.runs.append(np.sort(hashes[keep]))
+        while len(self.runs) > 1 and len(self.runs[-1]) >= len(self.runs[-2]):
+            newer, older = self.runs.pop(), self.runs.pop()
+            self.runs.append(np.sort(np.concatenate([older, newer])))
+        return keep
+
 def clean_pharmacy_sales():
     logger.info("Cleaning pharmacy_sales.csv...")
     try:
-        df = pd.read_csv(RAW_DIR / "pharmacy_sales.csv")
-        logger.info(f"Loaded {len(df)} rows")
-
-        # Standardize columns
-        df.columns = [c.lower().replace(' ', '_') for c in df.columns]
-        
-        # Date parsing
-        date_col = 'date' if 'date' in df.columns else 'date_time' # Adjust based on actual col
-        if date_col in df.columns:
-            df['date'] = pd.to_datetime(df[date_col], errors='coerce')
-        
-        # Filter 2022-2024
-        df = df[df['date'].dt.year.isin([2022, 2023, 2024])]
-        
-        # Remove duplicates
-        df.drop_duplicates(inplace=True)
-        
-        # Handle invalid quantities
-        if 'quantity' in df.columns:
-            df = df[df['quantity'] > 0]
-            
-        output_path = PROCESSED_DIR / "cleaned_sales.csv"
-        df.to_csv(output_path, index=False)
-        logger.info(f"Saved {len(df)} rows to {output_path}")
-        return df
+        output_path = PROCESSED_DIR / "cleaned_sales.parquet"
+        seen = SeenRows()
+        loaded = 0
+        with ParquetAppender(output_path) as out:
+            for df in read_chunks(RAW_DIR / "pharmacy_sales.csv", SALES_DTYPES):
+                loaded += len(df)
+                
+                # Date parsing
+                date_col = 'date' if 'date' in df.columns else 'date_time' # Adjust based on actual col
+                if date_col in df.columns:
+                    df['date'] = pd.to_datetime(df[date_col], errors='coerce')
+                
+                # Filter 2022-2024
+                df = df[df['date'].dt.year.isin([2022, 2023, 2024])]
+                
+                # Remove duplicates (also against earlier chunks)
+                df = df[seen.first_occurrences(df)]
+                
+                # Handle invalid quantities
+                if 'quantity' in df.columns:
+                    df = df[(df['quantity'] > 0).fillna(False)]
+                
+                out.write(df)
+        logger.info(f"Loaded {loaded} rows, saved {out.rows} rows to {output_path}")
+        return out.rows
     except Exception as e:
         logger.error(f"Error cleaning pharmacy sales: {e}")
         return None
@@ -58,21 +195,17 @@ def clean_pharmacy_sales():
 def clean_medicines():
     logger.info("Cleaning indian_medicines.csv...")
     try:
-        df = pd.read_csv(RAW_DIR / "indian_medicines.csv")
-        df.columns = [c.lower().strip().replace(' ', '_') for c in df.columns]
-        
-        # Tag symptomatic
-        keywords = ['fever', 'cough', 'cold', 'pain', 'paracetamol', 'azithromycin', 'cetirizine', 'dolo']
-        pattern = '|'.join(keywords)
-        
-        # Search in name and composition
-        df['is_symptomatic'] = df['name'].str.lower().str.contains(pattern, na=False) | \
-                               df['composition'].str.lower().str.contains(pattern, na=False)
-        
-        output_path = PROCESSED_DIR / "symptomatic_medicines.csv"
-        df.to_csv(output_path, index=False)
-        logger.info(f"Tagged {df['is_symptomatic'].sum()} symptomatic medicines")
-        return df
+        output_path = PROCESSED_DIR / "symptomatic_medicines.parquet"
+        tagged = 0
+        with ParquetAppender(output_path) as out:
+            for df in read_chunks(RAW_DIR / "indian_medicines.csv", MEDICINE_DTYPES):
+                # Search in name and composition
+                df['is_symptomatic'] = df['name'].str.contains(SYMPTOM_PATTERN, case=False, na=False) | \
+                                       df['composition'].str.contains(SYMPTOM_PATTERN, case=False, na=False)
+                tagged += int(df['is_symptomatic'].sum())
+                out.write(df)
+        logger.info(f"Tagged {tagged} symptomatic medicines")
+        return tagged
     except Exception as e:
         logger.error(f"Error cleaning medicines: {e}")
         return None
@@ -80,14 +213,14 @@ def clean_medicines():
 def clean_weather():
     logger.info("Cleaning weather_data.csv...")
     try:
-        df = pd.read_csv(RAW_DIR / "weather_data.csv")
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Temp validation
-        df = df[(df['temperature'] >= 15) & (df['temperature'] <= 45)]
-        
         PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
-        df.to_csv(PROCESSED_DIR / "cleaned_weather.csv", index=False)
+        with ParquetAppender(PROCESSED_DIR / "cleaned_weather.parquet") as out:
+            for df in read_chunks(RAW_DIR / "weather_data.csv", WEATHER_DTYPES):
+                df['date'] = pd.to_datetime(df['date'])
+                
+                # Temp validation
+                df = df[(df['temperature'] >= 15) & (df['temperature'] <= 45)]
+                out.write(df)
         logger.info("Saved cleaned weather data")
     except Exception as e:
         logger.error(f"Error cleaning weather: {e}")
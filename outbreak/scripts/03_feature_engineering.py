@@ -5,6 +5,7 @@ Creates time-series features, baseline metrics, and anomaly indicators.
 
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 from pathlib import Path
 import logging
 
@@ -15,14 +16,70 @@ BASE_DIR = Path(__file__).parent.parent
 PROCESSED_DIR = BASE_DIR / "datasets" / "processed"
 FINAL_DIR = BASE_DIR / "datasets" / "final"
 
+WINDOWS = (7, 14, 30)  # rolling means over a pincode's last N observed days
+EWMA_SPAN = 30
+PINCODE_SEED = 42
+
+def rolling_features(daily: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rolling means for all WINDOWS, 30-day std / z-score and EWMA per pincode.
+    `daily` must be sorted by (pincode, date). Window sums come from one
+    cumulative sum over the whole frame, clipped at each pincode's first row,
+    so there is no Python callback per group.
+    """
+    counts = daily['transaction_count'].to_numpy(dtype=np.int64)
+    pincodes = daily['pincode'].to_numpy()
+    idx = np.arange(len(daily))
+    group_start = np.maximum.accumulate(np.where(np.r_[True, pincodes[1:] != pincodes[:-1]], idx, 0))
+    cum = np.r_[0, np.cumsum(counts)]
+    cum_sq = np.r_[0, np.cumsum(counts * counts)]
+
+    windows = {}
+    for window in WINDOWS:
+        lo = np.maximum(group_start, idx - window + 1)  # min_periods=1
+        n = idx - lo + 1
+        mean = (cum[idx + 1] - cum[lo]) / n
+        daily[f'mean_{window}d'] = mean
+        windows[window] = (lo, n, mean)
+
+    # Sample std (ddof=1) of the 30-day window; z-score 0 where undefined
+    lo, n, mean = windows[30]
+    total_sq = cum_sq[idx + 1] - cum_sq[lo]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = np.where(n > 1, (total_sq - n * mean * mean) / (n - 1), np.nan)
+        std = np.sqrt(np.clip(var, 0, None))
+        zscore = np.where(std > 0, (counts - mean) / std, 0.0)
+    daily['std_30d'] = std
+    daily['zscore_30d'] = zscore
+
+    daily['ewma_30d'] = (daily.groupby('pincode', sort=False)['transaction_count']
+                         .ewm(span=EWMA_SPAN, adjust=False).mean()
+                         .reset_index(level=0, drop=True))
+    daily['baseline_30d'] = daily['mean_30d']
+    return daily
+
+def read_processed(name, columns=None):
+    """Cleaned dataset `name` from Parquet (02_data_cleaning output), else the older CSV"""
+    path = PROCESSED_DIR / f"{name}.parquet"
+    if path.exists():
+        if columns is not None:
+            available = pq.read_schema(path).names
+            columns = [c for c in columns if c in available]
+        return pd.read_parquet(path, columns=columns)
+    path = PROCESSED_DIR / f"{name}.csv"
+    if columns is not None:
+        columns = [c for c in columns if c in pd.read_csv(path, nrows=0).columns]
+        return pd.read_csv(path, usecols=columns, engine='pyarrow')
+    return pd.read_csv(path)
+
 def create_features():
     FINAL_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Load data
+    # Load data (only the columns the daily aggregation needs)
     try:
-        sales = pd.read_csv(PROCESSED_DIR / "cleaned_sales.csv")
-        meds = pd.read_csv(PROCESSED_DIR / "symptomatic_medicines.csv")
-        weather = pd.read_csv(PROCESSED_DIR / "cleaned_weather.csv")
+        sales = read_processed("cleaned_sales", columns=['date', 'pincode'])
+        meds = read_processed("symptomatic_medicines")
+        weather = read_processed("cleaned_weather")
     except FileNotFoundError as e:
         logger.error(f"Missing processed data: {e}")
         return
@@ -31,23 +88,24 @@ def create_features():
     # Note: Assuming product_name in sales matches name in meds approx or needs mapping
     # For now, we'll assume exact match or just use sales as principal
     
-    # 1. Time Features
-    sales['date'] = pd.to_datetime(sales['date'])
-    sales['day_of_week'] = sales['date'].dt.dayofweek
-    sales['month'] = sales['date'].dt.month
-    sales['is_weekend'] = sales['day_of_week'].isin([5, 6]).astype(int)
+    sales['date'] = pd.to_datetime(sales['date'], format='ISO8601')
     
-    # 2. Aggregations & Baselines
+    # 1. Aggregations & Baselines
     # Daily sales per pincode (Simulating pincode if not in sales, assume single location for now or random assign)
     if 'pincode' not in sales.columns:
-        sales['pincode'] = np.random.choice(['400001', '400002', '400003'], len(sales))
+        rng = np.random.default_rng(PINCODE_SEED)
+        sales['pincode'] = np.array(['400001', '400002', '400003'])[rng.integers(0, 3, len(sales))]
     
-    daily_sales = sales.groupby(['date', 'pincode']).size().reset_index(name='transaction_count')
+    # Sorted by (pincode, date): each pincode's days are one contiguous, ordered run.
+    # Pincodes become strings after aggregation (far fewer rows than raw sales)
+    daily_sales = sales.groupby(['pincode', 'date'], observed=True).size().reset_index(name='transaction_count')
+    daily_sales['pincode'] = daily_sales['pincode'].astype(str)
+    daily_sales = rolling_features(daily_sales)
     
-    # Rolling 30-day baseline
-    daily_sales['baseline_30d'] = daily_sales.groupby('pincode')['transaction_count'].transform(
-        lambda x: x.rolling(window=30, min_periods=1).mean()
-    )
+    # 2. Time Features (per day, not per raw sale)
+    daily_sales['day_of_week'] = daily_sales['date'].dt.dayofweek
+    daily_sales['month'] = daily_sales['date'].dt.month
+    daily_sales['is_weekend'] = (daily_sales['day_of_week'] >= 5).astype(int)
     
     # 3. Anomaly Indicators
     daily_sales['purchase_spike'] = (daily_sales['transaction_count'] > 2 * daily_sales['baseline_30d']).astype(int)
@@ -56,13 +114,14 @@ def create_features():
     weather['date'] = pd.to_datetime(weather['date'])
     # Ensure pincode type match
     weather['pincode'] = weather['pincode'].astype(str)
-    daily_sales['pincode'] = daily_sales['pincode'].astype(str)
     
     final_df = pd.merge(daily_sales, weather, on=['date', 'pincode'], how='left')
+    final_df = final_df.sort_values(['date', 'pincode'], kind='stable', ignore_index=True)
+    final_df = final_df[['date', 'pincode'] + [c for c in final_df.columns if c not in ('date', 'pincode')]]
     
     # Save
-    final_df.to_csv(FINAL_DIR / "training_data.csv", index=False)
-    logger.info(f"Feature engineering complete. Saved {len(final_df)} rows to training_data.csv")
+    final_df.to_parquet(FINAL_DIR / "training_data.parquet", index=False)
+    logger.info(f"Feature engineering complete. Saved {len(final_df)} rows to training_data.parquet")
 
 if __name__ == "__main__":
     create_features()
@@ -7,8 +7,13 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 import joblib
+import json
 import logging
+import os
+import time
 
 from sklearn.ensemble import IsolationForest, RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
@@ -16,6 +21,8 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
 from prophet import Prophet
 
+from model_store import write_store, STORE_PATH
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -29,6 +36,12 @@ DATA_DIR = BASE_DIR / "datasets" / "final"
 MODEL_DIR = BASE_DIR / "models"
 MODEL_DIR.mkdir(exist_ok=True)
 
+# Prophet training: one fit per pincode, spread over worker processes
+PROPHET_WORKERS = int(os.getenv("PROPHET_WORKERS", str(os.cpu_count() or 1)))
+PROPHET_FIT_TIMEOUT = int(os.getenv("PROPHET_FIT_TIMEOUT", "300"))  # seconds per pincode, 0 = none
+PROPHET_SEED = 42
+MIN_PROPHET_ROWS = 10
+
 class OutbreakDetector:
     """Anomaly detection for outbreak identification"""
     
@@ -77,52 +90,106 @@ class OutbreakDetector:
         joblib.dump(self.scaler, path / "scaler.pkl")
         logger.info(f"✓ Model saved to {path}")
 
+class FitTimeout(Exception):
+    pass
+
+def fit_prophet(pincode, data, seed=PROPHET_SEED, timeout=PROPHET_FIT_TIMEOUT):
+    """
+    Fit one pincode's Prophet model (runs in a worker process).
+    Seeded, so results don't depend on worker count or completion order.
+    The timeout is enforced by cmdstanpy, which terminates the CmdStan
+    process (per optimizer run: Prophet retries once with Newton on failure).
+    """
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    np.random.seed(seed)
+    start = time.time()
+    model = Prophet(
+        yearly_seasonality=False,
+        weekly_seasonality=True,
+        daily_seasonality=False,
+        changepoint_prior_scale=0.05
+    )
+    try:
+        model.fit(data, seed=seed, **({'timeout': timeout} if timeout > 0 else {}))
+    except TimeoutError:
+        raise FitTimeout(f"{pincode}: fit exceeded {timeout}s")
+    return model, time.time() - start
+
 class OutbreakPredictor:
     """Time-series forecasting for outbreak prediction"""
     
-    def __init__(self):
-        self.models = {}  # Store one model per pincode
+    def __init__(self, workers=PROPHET_WORKERS, fit_timeout=PROPHET_FIT_TIMEOUT, seed=PROPHET_SEED):
+        self.models = {}    # Store one model per pincode
+        self.registry = {}  # pincode -> fit outcome (status, rows, seconds, error)
+        self.workers = max(1, workers)
+        self.fit_timeout = fit_timeout
+        self.seed = seed
         
     def train(self, df: pd.DataFrame, pincodes: list = None) -> dict:
-        """Train Prophet models for each pincode"""
+        """Train Prophet models for each pincode (all of them by default)"""
         logger.info("Training Prophet models for time-series forecasting...")
         
-        if pincodes is None:
-            if df['pincode'].dtype != 'O':
-                 df['pincode'] = df['pincode'].astype(str)
-            pincodes = df['pincode'].unique()[:5]  # Train on top 5 pincodes
+        if df['pincode'].dtype != 'O':
+            df['pincode'] = df['pincode'].astype(str)
+        if pincodes is not None:
+            df = df[df['pincode'].isin([str(p) for p in pincodes])]
         
-        results = {}
-        
-        for pincode in pincodes:
-            logger.info(f"  Training model for pincode {pincode}...")
-            
-            pincode_data = df[df['pincode'] == pincode].copy()
-            if len(pincode_data) < 10:
+        # Only ds/y go to the workers
+        jobs = {}
+        for pincode, pincode_data in df.groupby('pincode'):
+            if len(pincode_data) < MIN_PROPHET_ROWS:
                 logger.warning(f"  Skipping {pincode}: Not enough data")
+                self.registry[pincode] = {'status': 'skipped', 'rows': len(pincode_data)}
                 continue
-
-            pincode_data = pincode_data.rename(columns={'date': 'ds', 'transaction_count': 'y'})
-            
-            model = Prophet(
-                yearly_seasonality=False,
-                weekly_seasonality=True,
-                daily_seasonality=False,
-                changepoint_prior_scale=0.05
-            )
-            
-            model.fit(pincode_data)
-            self.models[pincode] = model
-            results[pincode] = len(pincode_data)
+            jobs[pincode] = pincode_data.rename(columns={'date': 'ds', 'transaction_count': 'y'})[['ds', 'y']]
+        
+        workers = min(self.workers, len(jobs)) or 1
+        logger.info(f"  Fitting {len(jobs)} pincodes on {workers} worker(s), timeout {self.fit_timeout}s each")
+        start = time.time()
+        
+        if workers == 1:
+            self._collect(((pincode, partial(fit_prophet, pincode, data, self.seed, self.fit_timeout))
+                           for pincode, data in jobs.items()), jobs)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(fit_prophet, pincode, data, self.seed, self.fit_timeout): pincode
+                           for pincode, data in jobs.items()}
+                self._collect(((futures[f], f.result) for f in as_completed(futures)), jobs)
         
-        logger.info(f"✓ Trained {len(self.models)} forecasting models")
-        return results
+        failed = sum(1 for r in self.registry.values() if r['status'] in ('failed', 'timeout'))
+        logger.info(f"✓ Trained {len(self.models)} forecasting models in {time.time() - start:.1f}s"
+                    + (f" ({failed} failed or timed out)" if failed else ""))
+        return {p: r['rows'] for p, r in self.registry.items() if r['status'] == 'ok'}
+    
+    def _collect(self, outcomes, jobs):
+        """outcomes: (pincode, callable returning fit_prophet's result) pairs"""
+        for pincode, result in outcomes:
+            rows = len(jobs[pincode])
+            try:
+                model, seconds = result()
+            except FitTimeout:
+                logger.error(f"  ❌ {pincode}: fit exceeded {self.fit_timeout}s")
+                self.registry[pincode] = {'status': 'timeout', 'rows': rows}
+                continue
+            except Exception as e:
+                logger.error(f"  ❌ {pincode}: fit failed: {e}")
+                self.registry[pincode] = {'status': 'failed', 'rows': rows, 'error': str(e)}
+                continue
+            self.models[pincode] = model
+            self.registry[pincode] = {'status': 'ok', 'rows': rows, 'fit_seconds': round(seconds, 2)}
     
     def save(self, path: Path):
-        """Save all models"""
-        for pincode, model in self.models.items():
-            model_path = path / f"prophet_{pincode}.pkl"
-            joblib.dump(model, model_path)
+        """Save all models into one model store, plus the registry of fit outcomes"""
+        store_path = path / STORE_PATH.name
+        write_store(self.models, store_path, metadata=self.registry)
+        registry = {
+            'trained_at': datetime.now().isoformat(timespec='seconds'),
+            'seed': self.seed,
+            'pincodes': {p: dict(r, file=store_path.name) if r['status'] == 'ok' else r
+                         for p, r in sorted(self.registry.items())}
+        }
+        with open(path / "prophet_registry.json", "w") as f:
+            json.dump(registry, f, indent=2)
         logger.info(f"✓ Saved {len(self.models)} Prophet models to {path}")
 
 class OutbreakClassifier:
@@ -182,12 +249,18 @@ def main():
     logger.info("OUTBREAK DETECTION - MODEL TRAINING")
     logger.info("=" * 60)
     
-    data_path = DATA_DIR / "training_data.csv"
+    # Parquet from 03_feature_engineering.py; CSV from older runs
+    data_path = DATA_DIR / "training_data.parquet"
+    if not data_path.exists():
+        data_path = DATA_DIR / "training_data.csv"
     if not data_path.exists():
         logger.error(f"❌ Training data not found: {data_path}")
         return
     
-    df = pd.read_csv(data_path, parse_dates=['date'])
+    if data_path.suffix == ".parquet":
+        df = pd.read_parquet(data_path)
+    else:
+        df = pd.read_csv(data_path, parse_dates=['date'])
     df['pincode'] = df['pincode'].astype(str)
     
     # Feature Engineering on the fly
@@ -0,0 +1,121 @@
+"""
+Bulk Transaction Ingest
+Parses NDJSON / CSV transaction batches with pandas, validates them column-wise
+(same rules as the Transaction model, without per-row pydantic) and rolls them
+up to the (pincode, day) totals the streaming aggregator and models work on.
+"""
+
+import io
+from datetime import date
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['timestamp', 'pincode', 'category', 'quantity']
+# synthetic_transactions.csv names for the optional weather fields
+COLUMN_ALIASES = {'weather_temp': 'temperature', 'weather_humidity': 'humidity'}
+MAX_SAMPLE_ERRORS = 20
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class BulkFormatError(ValueError):
+    """Body can't be parsed or lacks required columns"""
+
+
+def parse(body, fmt):
+    """DataFrame from an NDJSON ('ndjson') or CSV ('csv') body"""
+    try:
+        if fmt == 'csv':
+            df = pd.read_csv(io.BytesIO(body), dtype={'pincode': str, 'category': str})
+        else:
+            df = pd.read_json(io.BytesIO(body), lines=True, dtype={'pincode': str, 'category': str},
+                              convert_dates=False)
+    except ValueError as e:
+        raise BulkFormatError(f"Could not parse {fmt} body: {e}")
+    df = df.rename(columns=COLUMN_ALIASES)
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise BulkFormatError(f"Missing required columns: {missing}")
+    return df
+
+
+def _timestamps(values):
+    try:
+        ts = pd.to_datetime(values, errors='coerce', format='ISO8601')
+    except ValueError:  # mixed UTC offsets / naive and aware
+        ts = pd.to_datetime(values, errors='coerce', format='ISO8601', utc=True)
+    if ts.dt.tz is not None:
+        ts = ts.dt.tz_localize(None)
+    return ts
+
+
+def validate(df):
+    """
+    Returns (valid rows with clean dtypes, rejection summary). Each check is
+    one vectorized mask; a row is rejected for the first rule it fails.
+    """
+    n = len(df)
+    ts = _timestamps(df['timestamp'])
+    pincode = df['pincode'].astype('string').str.strip()
+    category = df['category'].astype('string').str.strip().str.lower()
+    quantity = pd.to_numeric(df['quantity'], errors='coerce')
+    age = pd.to_numeric(df['customer_age'], errors='coerce') if 'customer_age' in df else pd.Series(np.nan, index=df.index)
+    temperature = pd.to_numeric(df['temperature'], errors='coerce') if 'temperature' in df else pd.Series(np.nan, index=df.index)
+    humidity = pd.to_numeric(df['humidity'], errors='coerce') if 'humidity' in df else pd.Series(np.nan, index=df.index)
+
+    checks = [
+        ('invalid timestamp', ts.isna()),
+        ('missing pincode', pincode.isna() | (pincode == '')),
+        ('missing category', category.isna() | (category == '')),
+        ('quantity must be an integer >= 1', quantity.isna() | (quantity < 1) | (quantity % 1 != 0)),
+        ('customer_age out of range 0-120', age.notna() & ((age < 0) | (age > 120))),
+        ('humidity out of range 0-100', humidity.notna() & ((humidity < 0) | (humidity > 100))),
+    ]
+
+    reason = pd.Series(pd.NA, index=df.index, dtype='string')
+    for label, mask in checks:
+        reason = reason.mask(reason.isna() & mask.fillna(False).astype(bool), label)
+    rejected = reason.notna()
+
+    samples = [{"row": int(i) + 1, "reason": r}
+               for i, r in reason[rejected].head(MAX_SAMPLE_ERRORS).items()]
+    summary = {
+        "received": n,
+        "accepted": int(n - rejected.sum()),
+        "rejected": int(rejected.sum()),
+        "rejected_by_reason": {k: int(v) for k, v in reason[rejected].value_counts().items()},
+        "sample_errors": samples
+    }
+
+    keep = ~rejected
+    valid = pd.DataFrame({
+        'day': ts[keep].values.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL,
+        'pincode': pincode[keep].astype(str),
+        'category': category[keep].astype(str),
+        'quantity': quantity[keep].astype(int),
+        'temperature': temperature[keep],
+        'humidity': humidity[keep],
+    })
+    return valid, summary
+
+
+def daily_totals(valid):
+    """
+    (pincode, day) rows in chronological order with per-category
+    {category: (transactions, quantity)} and the day's mean weather.
+    """
+    by_category = valid.groupby(['day', 'pincode', 'category'])['quantity'].agg(['size', 'sum'])
+    weather = valid.groupby(['day', 'pincode'])[['temperature', 'humidity']].mean()
+    weather = dict(zip(weather.index, zip(
+        *(weather[c].astype(object).where(weather[c].notna(), None) for c in ('temperature', 'humidity')))))
+
+    days = {}
+    for (day, pincode, category), n, quantity in zip(by_category.index, by_category['size'], by_category['sum']):
+        entry = days.get((day, pincode))
+        if entry is None:
+            entry = days[(day, pincode)] = {}
+        entry[category] = (int(n), int(quantity))
+    return [(pincode, int(day), counts, *weather[(day, pincode)])
+            for (day, pincode), counts in days.items()]
@@ -0,0 +1,109 @@
+"""
+Training Data Store
+Loads the training data (Parquet from feature engineering, else CSV) once and keeps it as per-pincode daily arrays plus
+precomputed dashboard aggregates. The file's mtime is checked on access, so
+re-running feature engineering is picked up without a restart.
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent.parent
+FINAL_DIR = BASE_DIR / "datasets" / "final"
+TRAINING_DATA_PATHS = (FINAL_DIR / "training_data.parquet", FINAL_DIR / "training_data.csv")
+
+
+class DailySeries:
+    """Sorted day array + transaction counts; date ranges are binary-searched slices"""
+    __slots__ = ('dates', 'counts')
+
+    def __init__(self, dates, counts):
+        self.dates = dates    # datetime64[D], ascending, unique
+        self.counts = counts  # int64
+
+    def since(self, start):
+        i = np.searchsorted(self.dates, start, side='left')
+        return self.dates[i:], self.counts[i:]
+
+
+class TrainingDataStore:
+    def __init__(self, paths=TRAINING_DATA_PATHS):
+        self.paths = [Path(p) for p in paths]  # first existing one is used
+        self.path = None
+        self.version = None  # (path, mtime) of the loaded file
+        self.total = None    # DailySeries summed over pincodes
+        self.pincodes = {}   # pincode (str) -> DailySeries
+        self.stats = None    # precomputed aggregates
+        self._lock = threading.Lock()
+
+    def _load(self, path):
+        columns = ['date', 'pincode', 'transaction_count']
+        if path.suffix == ".parquet":
+            df = pd.read_parquet(path, columns=columns)
+            df['pincode'] = df['pincode'].astype(str)
+        else:
+            df = pd.read_csv(path, usecols=columns, dtype={'pincode': str}, parse_dates=['date'])
+        df['date'] = df['date'].values.astype('datetime64[D]')
+        daily = df.groupby(['pincode', 'date'], sort=True)['transaction_count'].sum()
+
+        pincodes = {}
+        codes = daily.index.get_level_values('pincode')
+        dates = daily.index.get_level_values('date').values.astype('datetime64[D]')
+        counts = daily.values.astype(np.int64)
+        # groupby sorted by pincode: each pincode is one contiguous run
+        bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(daily)]):
+            pincodes[codes[start]] = DailySeries(dates[start:end], counts[start:end])
+
+        total = df.groupby('date', sort=True)['transaction_count'].sum()
+        self.total = DailySeries(total.index.values.astype('datetime64[D]'), total.values.astype(np.int64))
+        self.pincodes = pincodes
+        self.stats = {
+            "rows": len(df),
+            "pincodes": len(pincodes),
+            "total_transactions": int(counts.sum()),
+            "min_date": pd.Timestamp(self.total.dates[0]) if len(df) else None,
+            "max_date": pd.Timestamp(self.total.dates[-1]) if len(df) else None,
+        }
+        logger.info(f"✓ Loaded {len(df)} training rows ({len(pincodes)} pincodes) from {path.name}")
+
+    def refresh(self):
+        """Loads or reloads if the file changed; False if it doesn't exist"""
+        for path in self.paths:
+            try:
+                version = (path, path.stat().st_mtime_ns)
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            return False
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self._load(path)
+                    self.path, self.version = path, version
+        return True
+
+    def trends(self, pincode=None, days=7):
+        """
+        Daily transaction totals for the last `days` days of the dataset
+        (relative to its max date, since the data is historical).
+        Returns (start_date, end_date, [(date, count)]) or None if no data.
+        """
+        if not self.refresh() or self.stats["max_date"] is None:
+            return None
+        max_date = self.stats["max_date"]
+        start_date = max_date - pd.Timedelta(days=days)
+        series = self.total if pincode is None else self.pincodes.get(str(pincode))
+        if series is None:
+            return start_date, max_date, []
+        dates, counts = series.since(np.datetime64(start_date.date(), 'D'))
+        return start_date, max_date, list(zip(dates.astype(str), counts.tolist()))
+
+
+store = TrainingDataStore()
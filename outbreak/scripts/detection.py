@@ -0,0 +1,146 @@
+"""
+Outbreak Detection State
+Background detector that re-scores only the pincodes whose aggregates changed
+since its last pass, keeps one status row per pincode, and rebuilds the
+heatmap as a single pre-serialized JSON document. Status and heatmap reads
+are dict lookups, independent of the number of pincodes.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from datetime import datetime
+import logging
+
+from streaming_aggregator import FEATURES
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {"red": 2, "orange": 1, "green": 0}
+
+
+def assess(features, is_anomaly, spike_probability):
+    """
+    Severity from both models: red when the anomaly detector and the spike
+    classifier agree, orange when only one fires, green otherwise.
+    Confidence is the classifier's probability for the chosen side.
+    """
+    f = dict(zip(FEATURES, features))
+    spike = spike_probability >= 0.5
+    if is_anomaly and spike:
+        severity = "red"
+    elif is_anomaly or spike:
+        severity = "orange"
+    else:
+        severity = "green"
+    confidence = spike_probability if severity != "green" else 1 - spike_probability
+    # Transactions above the pincode's baseline today
+    excess = max(0, round(f['transaction_count'] - f['baseline_30d'])) if severity != "green" else 0
+    return {
+        "severity": severity,
+        "confidence": round(float(confidence), 3),
+        "affected_count": int(excess),
+        "transaction_count": int(f['transaction_count']),
+        "baseline_30d": round(f['baseline_30d'], 2),
+    }
+
+
+class OutbreakDetector:
+    """
+    classify_fn(X) -> (is_anomaly list, spike probability list), called from
+    a worker thread with the feature rows of every pincode changed in a pass.
+    """
+
+    def __init__(self, aggregator, classify_fn, interval_seconds=5.0):
+        self.aggregator = aggregator
+        self.classify_fn = classify_fn
+        self.interval = interval_seconds
+        self.state = {}  # pincode -> status row
+        self.heatmap_json = b'{"alerts": [], "timestamp": null}'
+        self.heatmap_etag = '"0"'
+        self.severity_counts = {s: 0 for s in SEVERITY_RANK}
+        self.passes = 0
+        self.last_pass = None
+        self._lock = threading.Lock()
+        self._task = None
+
+    def run_once(self):
+        """One detection pass over the changed pincodes; returns how many were scored"""
+        changed = self.aggregator.take_dirty()
+        if not changed:
+            return 0
+        pincodes = list(changed)
+        X = [changed[p] for p in pincodes]
+        try:
+            anomalies, probabilities = self.classify_fn(X)
+        except Exception:
+            self.aggregator.mark_dirty(pincodes)  # retry them next pass
+            raise
+
+        now = datetime.now()
+        with self._lock:
+            for pincode, features, is_anomaly, p in zip(pincodes, X, anomalies, probabilities):
+                row = assess(features, is_anomaly, p)
+                previous = self.state.get(pincode)
+                # detected_at = when the pincode entered its current severity
+                if previous is not None and previous["severity"] == row["severity"]:
+                    row["detected_at"] = previous["detected_at"]
+                else:
+                    row["detected_at"] = now
+                row["pincode"] = pincode
+                row["updated_at"] = now
+                self.state[pincode] = row
+            self._rebuild_heatmap(now)
+            self.passes += 1
+            self.last_pass = now
+        return len(pincodes)
+
+    def _rebuild_heatmap(self, now):
+        counts = {s: 0 for s in SEVERITY_RANK}
+        for row in self.state.values():
+            counts[row["severity"]] += 1
+        self.severity_counts = counts
+        alerts = [{
+            "pincode": r["pincode"],
+            "anomaly_count": r["affected_count"],
+            "total_transactions": r["transaction_count"],
+            "severity": r["severity"],
+            "confidence": r["confidence"],
+        } for r in self.state.values() if r["severity"] != "green"]
+        alerts.sort(key=lambda a: (-SEVERITY_RANK[a["severity"]], -a["anomaly_count"], a["pincode"]))
+        body = json.dumps({"alerts": alerts, "timestamp": now.isoformat()}).encode()
+        self.heatmap_json = body
+        self.heatmap_etag = '"' + hashlib.md5(body).hexdigest() + '"'
+
+    def status(self, pincode):
+        return self.state.get(pincode)
+
+    # --- Background loop ---
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                scored = await asyncio.to_thread(self.run_once)
+                if scored:
+                    logger.info(f"✓ Detection pass: {scored} pincodes re-scored")
+            except Exception as e:
+                logger.error(f"Detection pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {"pincodes": len(self.state), "by_severity": self.severity_counts, "passes": self.passes,
+                "last_pass": self.last_pass.isoformat() if self.last_pass else None}
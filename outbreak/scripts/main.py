@@ -3,16 +3,28 @@ FastAPI Backend for Hyper-Local Disease Surveillance
 Serves ML predictions, real-time alerts, and dashboard data
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 import pandas as pd
-import joblib
 import numpy as np
 from pathlib import Path
+import asyncio
 import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).parent))  # sibling modules, also under `uvicorn scripts.main:app`
+from streaming_aggregator import StreamingAggregator, FEATURES
+from micro_batcher import MicroBatcher
+import bulk_ingest
+from data_store import store as training_data
+from detection import OutbreakDetector
+from model_registry import ModelRegistry
+from model_store import ModelStore
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -39,20 +51,119 @@ BASE_DIR = Path(__file__).parent.parent
 MODEL_DIR = BASE_DIR / "models"
 DATA_DIR = BASE_DIR / "datasets"
 
-# Load models at startup
-models = {}
+# Rolling per-pincode/category counts feeding the anomaly detector
+aggregator = StreamingAggregator()
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("AGGREGATE_SNAPSHOT_SECONDS", "60"))
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(50 * 1024 * 1024)))
+
+def set_default_weather(scaler):
+    """Unseen pincodes get the training-mean weather (neutral after scaling)"""
+    mean = dict(zip(FEATURES, scaler.mean_))
+    aggregator.default_weather = (float(mean['temperature']), float(mean['humidity']))
+
+def open_forecasters():
+    """Prophet store: reads the index only, per-pincode models are decoded on demand"""
+    store = ModelStore(MODEL_DIR / "prophet_models.bin")
+    if not store.open():
+        raise FileNotFoundError(store.path)
+    return store
+
+# Models load on first use or in the background warm-up, never before the app serves
+models = ModelRegistry()
+models.register_joblib('scaler', MODEL_DIR / "scaler.pkl", mmap=True, on_load=set_default_weather)
+models.register_joblib('anomaly_detector', MODEL_DIR / "anomaly_detector.pkl")
+models.register_joblib('classifier_scaler', MODEL_DIR / "classifier_scaler.pkl", mmap=True)
+models.register_joblib('severity_classifier', MODEL_DIR / "severity_classifier.pkl")
+models.register('forecasters', open_forecasters)
+WARMUP_MODELS = [m for m in os.getenv(
+    "MODEL_WARMUP", "scaler,anomaly_detector,classifier_scaler,severity_classifier").split(",") if m]
 
 @app.on_event("startup")
 async def load_models():
-    """Load ML models into memory"""
+    """Start the model warm-up without blocking startup"""
+    app.state.warmup_task = asyncio.create_task(asyncio.to_thread(models.warm_up, WARMUP_MODELS))
+
+@app.on_event("startup")
+async def load_training_data():
+    """Warm the dashboard data store (reloaded on access when the file changes)"""
     try:
-        models['anomaly_detector'] = joblib.load(MODEL_DIR / "anomaly_detector.pkl")
-        models['scaler'] = joblib.load(MODEL_DIR / "scaler.pkl")
-        models['severity_classifier'] = joblib.load(MODEL_DIR / "severity_classifier.pkl")
-        models['classifier_scaler'] = joblib.load(MODEL_DIR / "classifier_scaler.pkl")
-        logger.info("✓ Models loaded successfully")
+        await asyncio.to_thread(training_data.refresh)
     except Exception as e:
-        logger.error(f"❌ Failed to load models: {e}")
+        logger.error(f"❌ Failed to load training data: {e}")
+
+@app.on_event("startup")
+async def start_aggregator():
+    """Restore the last aggregate snapshot and persist new ones periodically"""
+    try:
+        aggregator.load()
+    except Exception as e:
+        logger.error(f"❌ Failed to restore aggregates: {e}")
+    app.state.snapshot_task = asyncio.create_task(snapshot_loop())
+
+async def snapshot_loop():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(aggregator.save)
+        except Exception as e:
+            logger.error(f"Aggregate snapshot failed: {e}")
+
+@app.on_event("shutdown")
+async def stop_aggregator():
+    app.state.snapshot_task.cancel()
+    aggregator.save()
+    logger.info("✓ Aggregates saved")
+
+def score_anomalies(X):
+    """IsolationForest verdicts for feature rows (FEATURES order), scaled without pandas"""
+    scaler, detector_model = models.get('scaler'), models.get('anomaly_detector')
+    if scaler is None or detector_model is None:
+        return [False] * len(X)
+    X_scaled = (X - scaler.mean_) / scaler.scale_
+    return (detector_model.predict(X_scaled) == -1).tolist()
+
+# Concurrent transactions are scored together: one predict() per batch instead of per row
+scorer = MicroBatcher(
+    score_anomalies,
+    max_batch=int(os.getenv("SCORING_BATCH_SIZE", "256")),
+    max_wait_ms=float(os.getenv("SCORING_MAX_WAIT_MS", "5"))
+)
+
+@app.on_event("startup")
+async def start_scorer():
+    scorer.start()
+
+@app.on_event("shutdown")
+async def stop_scorer():
+    await scorer.stop()
+
+# Severity classifier feature order (07_train_models.py OutbreakClassifier)
+CLASSIFIER_FEATURES = ['transaction_count', 'baseline_30d', 'day_of_week', 'temperature', 'humidity']
+CLASSIFIER_COLUMNS = [FEATURES.index(f) for f in CLASSIFIER_FEATURES]
+
+def classify_pincodes(X):
+    """Anomaly verdicts + spike probabilities for pincode feature rows (FEATURES order)"""
+    X = np.asarray(X, dtype=float)
+    anomalies = score_anomalies(X)
+    scaler, clf = models.get('classifier_scaler'), models.get('severity_classifier')
+    if scaler is None or clf is None:
+        return anomalies, [0.0] * len(X)
+    X_scaled = (X[:, CLASSIFIER_COLUMNS] - scaler.mean_) / scaler.scale_
+    spike = list(clf.classes_).index(1) if 1 in clf.classes_ else None
+    probabilities = clf.predict_proba(X_scaled)[:, spike] if spike is not None else np.zeros(len(X))
+    return anomalies, probabilities.tolist()
+
+# Re-scores pincodes whose aggregates changed; status/heatmap endpoints only read its state
+detector = OutbreakDetector(aggregator, classify_pincodes,
+                            interval_seconds=float(os.getenv("DETECTION_INTERVAL_SECONDS", "5")))
+
+@app.on_event("startup")
+async def start_detector():
+    detector.start()
+
+@app.on_event("shutdown")
+async def stop_detector():
+    await detector.stop()
 
 # Pydantic models
 class Transaction(BaseModel):
@@ -62,6 +173,8 @@ class Transaction(BaseModel):
     category: str = Field(..., example="fever")
     quantity: int = Field(..., ge=1, example=2)
     customer_age: Optional[int] = Field(None, ge=0, le=120)
+    temperature: Optional[float] = Field(None, description="Local temperature (°C), if the POS reports it")
+    humidity: Optional[float] = Field(None, ge=0, le=100)
 
 class OutbreakStatus(BaseModel):
     pincode: str
@@ -77,7 +190,8 @@ async def root():
         "status": "operational",
         "service": "Flu Radar API",
         "version": "1.0.0",
-        "models_loaded": len(models) > 0
+        "models_loaded": models.ready(WARMUP_MODELS),
+        "models": models.status()
     }
 
 @app.post("/api/transactions")
@@ -87,58 +201,110 @@ async def add_transaction(txn: Transaction, background_tasks: BackgroundTasks):
     Processes in background and checks for anomalies
     """
     try:
-        # Mocking aggregated features for real-time check
-        current_features = pd.DataFrame([{
-            'transaction_count': txn.quantity * 5, 
-            'day_of_week': txn.timestamp.weekday(),
-            'temperature': 30.0, 
-            'humidity': 70.0,
-            'baseline_30d': 100.0
-        }])
-        
-        # Predict anomaly
-        if 'scaler' in models:
-            X_scaled = models['scaler'].transform(current_features)
-            is_anomaly = models['anomaly_detector'].predict(X_scaled)[0]
-        else:
-            is_anomaly = 1 
-        
-        severity = "normal"
-        if is_anomaly == -1:
-            severity = "red" 
+        # Real rolling features for the pincode: today's count, 30-day EWMA baseline, latest weather
+        features = aggregator.add(txn.pincode, txn.category, txn.timestamp, txn.quantity,
+                                  txn.temperature, txn.humidity)
+        is_anomaly = await scorer.submit(features)
         
         return {
             "status": "received",
             "transaction_id": f"txn_{txn.pincode}_{int(txn.timestamp.timestamp())}",
-            "is_anomaly": bool(is_anomaly == -1),
-            "severity": severity
+            "is_anomaly": is_anomaly,
+            "severity": "red" if is_anomaly else "normal",
+            "features": dict(zip(FEATURES, features))
         }
     except Exception as e:
         logger.error(f"Error processing transaction: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def ingest_bulk(body, fmt):
+    """
+    Parse + validate in pandas, update the aggregates once per (pincode, day)
+    and score every touched pincode-day in a single predict() call
+    """
+    t0 = time.perf_counter()
+    valid, summary = bulk_ingest.validate(bulk_ingest.parse(body, fmt))
+    days = bulk_ingest.daily_totals(valid)
+    features = [aggregator.add_day(pincode, day, counts, temp, hum)
+                for pincode, day, counts, temp, hum in days]
+    flags = score_anomalies(np.asarray(features, dtype=float)) if features else []
+
+    anomalies = [{"pincode": pincode, "date": datetime.fromordinal(day).date().isoformat(),
+                  "severity": "red", **dict(zip(FEATURES, f))}
+                 for (pincode, day, *_), f, flagged in zip(days, features, flags) if flagged]
+    by_pincode = {}
+    for a in anomalies:
+        by_pincode[a["pincode"]] = by_pincode.get(a["pincode"], 0) + 1
+
+    summary.update({
+        "pincode_days": len(days),
+        "anomalies_flagged": len(anomalies),
+        "anomalies_by_pincode": by_pincode,
+        "anomalies": anomalies,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)
+    })
+    logger.info(f"✓ Bulk ingest: {summary['accepted']} accepted, {summary['rejected']} rejected, "
+                f"{len(anomalies)} anomalous pincode-days in {summary['elapsed_ms']} ms")
+    return summary
+
+@app.post("/api/transactions/bulk")
+async def add_transactions_bulk(request: Request, format: Optional[str] = None):
+    """
+    Backfill / batch upload: NDJSON (application/x-ndjson) or CSV (text/csv)
+    body, one transaction per line. Invalid rows are counted and skipped.
+    Scored per pincode-day (the models' granularity), not per transaction.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > BULK_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Body larger than {BULK_MAX_BYTES} bytes")
+        chunks.append(chunk)
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty body")
+
+    try:
+        return await asyncio.to_thread(ingest_bulk, b"".join(chunks), fmt)
+    except bulk_ingest.BulkFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in bulk ingest: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/aggregates")
+async def get_aggregates(pincode: Optional[str] = None):
+    """Today's running counts and 30-day baselines per pincode/category"""
+    return {"aggregates": aggregator.summary(pincode), "transactions": aggregator.transactions,
+            "scoring": scorer.stats(), "detection": detector.stats()}
+
 @app.get("/api/outbreak-status/{pincode}", response_model=OutbreakStatus)
 async def get_outbreak_status(pincode: str):
-    """Get current outbreak status for a pincode"""
-    return OutbreakStatus(
-        pincode=pincode,
-        severity="green",
-        confidence=0.95,
-        affected_count=12,
-        detected_at=datetime.now()
-    )
+    """
+    Get current outbreak status for a pincode (as of the detector's last pass).
+    Monitored pincodes without transactions yet (e.g. right after a restart)
+    are green with zero confidence; 404 only for pincodes outside the training data.
+    """
+    status = detector.status(pincode)
+    if status is None:
+        if training_data.refresh() and pincode not in training_data.pincodes:
+            raise HTTPException(status_code=404, detail=f"Pincode {pincode} is not monitored")
+        status = OutbreakStatus(pincode=pincode, severity="green", confidence=0.0,
+                                affected_count=0, detected_at=datetime.now())
+    return status
 
 @app.get("/api/stats") # Alias for user's test script
 @app.get("/api/dashboard/stats")
 async def get_stats():
     """Get high-level dashboard stats"""
     try:
-        data_path = DATA_DIR / "final" / "training_data.csv"
         # Return fallback if file read fails, but try to read real stats
-        if data_path.exists():
-             df = pd.read_csv(data_path)
-             pincodes = df['pincode'].nunique()
-             total_txns = len(df) # approx
+        if training_data.refresh():
+             pincodes = training_data.stats['pincodes']
+             total_txns = training_data.stats['rows'] # approx
              
              # Calculate anomalies from file if possible, or dummy
              # Assume 5% anomaly rate
@@ -175,55 +341,28 @@ async def get_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/heatmap")
-async def get_heatmap():
-    """Get active outbreaks for heatmap"""
-    # Mock data for demo
-    return {
-        "alerts": [
-            {
-                "pincode": "400001",
-                "anomaly_count": 15,
-                "total_transactions": 150,
-                "severity": "red"
-            },
-            {
-                "pincode": "400005",
-                "anomaly_count": 5,
-                "total_transactions": 80,
-                "severity": "orange"
-            }
-        ],
-        "timestamp": datetime.now().isoformat()
-    }
+async def get_heatmap(request: Request):
+    """Get active outbreaks for heatmap (document precomputed by the detector)"""
+    etag = detector.heatmap_etag
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=detector.heatmap_json, media_type="application/json", headers={"ETag": etag})
 
 @app.get("/api/trends")
 async def get_trends(pincode: Optional[str] = None, days: int = 7):
     """Get purchase trends"""
     try:
-        # Load real data if available
-        data_path = DATA_DIR / "final" / "training_data.csv"
-        if data_path.exists():
-            df = pd.read_csv(data_path, parse_dates=['date'])
-            # Filter last N days from max date in dataset (since data is 2022)
-            max_date = df['date'].max()
-            start_date = max_date - timedelta(days=days)
-            
-            recent = df[df['date'] >= start_date]
-            if pincode:
-                recent = recent[recent['pincode'] == str(pincode)]
-            
-            # Aggregate per day
-            trends = recent.groupby('date')['transaction_count'].sum().reset_index()
-            trends['category'] = 'Total' # simplified for now
+        # Last N days from max date in dataset (since data is 2022), sliced from the in-memory store
+        result = training_data.trends(pincode, days)
+        if result is not None:
+            start_date, max_date, series = result
             
             # Format for frontend
-            data = []
-            for _, row in trends.iterrows():
-                data.append({
-                    "date": row['date'].strftime('%Y-%m-%d'),
-                    "category": "Fever", # Mock category split
-                    "quantity": int(row['transaction_count'])
-                })
+            data = [{
+                "date": day,
+                "category": "Fever", # Mock category split
+                "quantity": count
+            } for day, count in series]
                 
             return {
                 "data": data,
@@ -0,0 +1,91 @@
+"""
+Micro-Batching Scorer
+Collects concurrent scoring requests for a few milliseconds (or up to N rows)
+and scores them in one vectorized model call; each caller awaits its own row.
+"""
+
+import asyncio
+import time
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    score_fn(X: ndarray[n, d]) -> sequence of n results, called in a worker
+    thread so the event loop keeps accepting requests meanwhile. While a batch
+    is being scored the next one fills up, so batch size adapts to load.
+    """
+
+    def __init__(self, score_fn, max_batch=256, max_wait_ms=5.0):
+        self.score_fn = score_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self._task = None
+        self.batches = 0
+        self.rows = 0
+
+    def start(self):
+        if self._task is None:
+            self.queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, features):
+        """Score one feature vector; resolves when its batch has been scored"""
+        if self._task is None:
+            return self.score_fn(np.asarray([features], dtype=float))[0]
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, future))
+        return await future
+
+    async def _collect(self):
+        """First item blocks; then gather until max_batch or max_wait elapsed"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Drain what is already queued without waiting
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            futures = [f for _, f in batch]
+            try:
+                X = np.asarray([features for features, _ in batch], dtype=float)
+                results = await asyncio.to_thread(self.score_fn, X)
+                for future, result in zip(futures, results):
+                    if not future.done():
+                        future.set_result(result)
+                self.batches += 1
+                self.rows += len(batch)
+            except Exception as e:
+                logger.error(f"Batch scoring failed: {e}")
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self):
+        return {"batches": self.batches, "rows": self.rows,
+                "avg_batch_size": round(self.rows / self.batches, 1) if self.batches else 0.0,
+                "queued": self.queue.qsize() if self.queue is not None else 0}
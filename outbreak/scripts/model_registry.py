@@ -0,0 +1,90 @@
+"""
+Lazy Model Registry
+Models are registered with a loader and loaded on first use or by a
+background warm-up task, so the API starts serving immediately and only
+pays (time and memory) for models that are actually used.
+"""
+
+import threading
+import time
+import joblib
+import logging
+
+logger = logging.getLogger(__name__)
+
+NOT_LOADED, LOADING, READY, FAILED = "not_loaded", "loading", "ready", "failed"
+RETRY_SECONDS = 60  # failed loads are retried on use after this long
+
+
+class LazyModel:
+    def __init__(self, name, loader, on_load=None):
+        self.name = name
+        self.loader = loader
+        self.on_load = on_load
+        self.state = NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self._value = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The loaded model (loading it now if needed), or None if loading failed"""
+        if self.state == READY:
+            return self._value
+        with self._lock:
+            if self.state == READY:
+                return self._value
+            if self.state == FAILED and time.monotonic() - self._failed_at < RETRY_SECONDS:
+                return None
+            self.state = LOADING
+            start = time.perf_counter()
+            try:
+                value = self.loader()
+                if self.on_load is not None:
+                    self.on_load(value)
+            except Exception as e:
+                self.state, self.error, self._failed_at = FAILED, str(e), time.monotonic()
+                logger.error(f"❌ Failed to load {self.name}: {e}")
+                return None
+            self._value, self.error = value, None
+            self.load_seconds = round(time.perf_counter() - start, 3)
+            self.state = READY
+            logger.info(f"✓ Loaded {self.name} in {self.load_seconds}s")
+            return value
+
+    def status(self):
+        return {"state": self.state, "load_seconds": self.load_seconds, "error": self.error}
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._models = {}
+
+    def register(self, name, loader, on_load=None):
+        self._models[name] = LazyModel(name, loader, on_load)
+
+    def register_joblib(self, name, path, mmap=False, on_load=None):
+        """
+        mmap=True memory-maps the artifact's numpy arrays (read-only, shared
+        between workers). Only useful for array-only artifacts such as
+        scalers: sklearn trees copy their node arrays when unpickled.
+        """
+        self.register(name, lambda: joblib.load(path, mmap_mode='r' if mmap else None), on_load)
+
+    def get(self, name):
+        return self._models[name].get()
+
+    def __contains__(self, name):
+        return name in self._models and self._models[name].state == READY
+
+    def warm_up(self, names=None):
+        """Loads models in order (blocking; run it in a worker thread)"""
+        for name in names or list(self._models):
+            self._models[name].get()
+
+    def ready(self, names=None):
+        return all(self._models[n].state == READY for n in names or self._models)
+
+    def status(self):
+        return {name: m.status() for name, m in self._models.items()}
@@ -0,0 +1,153 @@
+"""
+Prophet Model Store
+All pincode forecasters in one indexed file instead of one pickle each.
+Each model is Prophet's JSON serialization (fitted parameters, scales,
+changepoints) with the training frame trimmed to its last row, zlib-compressed.
+Models are decoded lazily on first use and kept in a small LRU.
+
+File layout:
+    MAGIC | blob ... blob | index JSON | index offset (8 bytes, little endian)
+The index maps pincode -> [offset, length] plus per-model metadata.
+"""
+
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent.parent
+MODEL_DIR = BASE_DIR / "models"
+STORE_PATH = MODEL_DIR / "prophet_models.bin"
+
+MAGIC = b"PROPHETSTORE1\n"
+FOOTER = struct.Struct("<Q")
+CACHE_SIZE = int(os.getenv("PROPHET_CACHE_SIZE", "128"))
+
+
+def _compact(model):
+    """Serialized model without its training frame (only the last row is kept)"""
+    from prophet.serialize import model_to_dict
+    model_dict = model_to_dict(model)
+    # predict() only checks that a history exists; scales and changepoints are stored separately
+    model_dict['history'] = model.history.tail(1).to_json(orient='table', index=False)
+    return zlib.compress(json.dumps(model_dict).encode())
+
+
+def write_store(models, path=STORE_PATH, metadata=None):
+    """Writes {pincode: Prophet} to one store file (atomic replace); returns bytes written"""
+    path = Path(path)
+    tmp = path.with_suffix(".tmp")
+    index = {"created_at": datetime.now().isoformat(timespec='seconds'), "models": {}}
+    try:
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            for pincode, model in sorted(models.items()):
+                blob = _compact(model)
+                entry = {"offset": f.tell(), "length": len(blob)}
+                entry.update((metadata or {}).get(pincode, {}))
+                index["models"][str(pincode)] = entry
+                f.write(blob)
+            index_offset = f.tell()
+            f.write(json.dumps(index).encode())
+            f.write(FOOTER.pack(index_offset))
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    size = tmp.stat().st_size
+    os.replace(tmp, path)
+    logger.info(f"✓ Wrote {len(models)} Prophet models to {path.name} ({size / 1024:.0f} KB)")
+    return size
+
+
+class ModelStore:
+    """Read side: index loaded on open, models decoded on demand"""
+
+    def __init__(self, path=STORE_PATH, cache_size=CACHE_SIZE):
+        self.path = Path(path)
+        self.cache_size = cache_size
+        self.index = None
+        self._file = None
+        self._cache = OrderedDict()  # pincode -> Prophet, most recently used last
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def open(self):
+        """Reads the index only; False if the store doesn't exist"""
+        if not self.path.exists():
+            return False
+        f = open(self.path, "rb")
+        if f.read(len(MAGIC)) != MAGIC:
+            f.close()
+            raise ValueError(f"{self.path} is not a Prophet model store")
+        f.seek(-FOOTER.size, os.SEEK_END)
+        end = f.tell()
+        (index_offset,) = FOOTER.unpack(f.read(FOOTER.size))
+        f.seek(index_offset)
+        self.index = json.loads(f.read(end - index_offset))
+        self._file = f
+        logger.info(f"✓ Indexed {len(self.index['models'])} Prophet models in {self.path.name}")
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._cache.clear()
+
+    def pincodes(self):
+        return list(self.index["models"]) if self.index else []
+
+    def __contains__(self, pincode):
+        return self.index is not None and str(pincode) in self.index["models"]
+
+    def get(self, pincode):
+        """Prophet model for a pincode (decoded on first use), or None"""
+        from prophet.serialize import model_from_json
+        pincode = str(pincode)
+        with self._lock:
+            model = self._cache.get(pincode)
+            if model is not None:
+                self._cache.move_to_end(pincode)
+                self.hits += 1
+                return model
+            entry = self.index["models"].get(pincode) if self.index else None
+            if entry is None:
+                return None
+            self._file.seek(entry["offset"])
+            blob = self._file.read(entry["length"])
+        model = model_from_json(zlib.decompress(blob).decode())
+        with self._lock:
+            self._cache[pincode] = model
+            self._cache.move_to_end(pincode)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self.loads += 1
+        return model
+
+    def stats(self):
+        return {"models": len(self.index["models"]) if self.index else 0, "cached": len(self._cache),
+                "cache_size": self.cache_size, "loads": self.loads, "hits": self.hits}
+
+
+def migrate_pickles(model_dir=MODEL_DIR, path=STORE_PATH):
+    """One-off conversion of legacy prophet_{pincode}.pkl files into a store"""
+    import joblib
+    models = {p.stem[len("prophet_"):]: joblib.load(p) for p in sorted(Path(model_dir).glob("prophet_*.pkl"))}
+    if not models:
+        logger.warning(f"No prophet_*.pkl files in {model_dir}")
+        return 0
+    return write_store(models, path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_pickles()
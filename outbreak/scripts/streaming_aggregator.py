@@ -0,0 +1,246 @@
+"""
+Streaming Aggregator
+Keeps per-(pincode, day, category) transaction counts and an exponentially
+weighted 30-day baseline in memory, so incoming transactions can be scored
+on real rolling features in O(1) without pandas.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from datetime import date
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent.parent
+STATE_DIR = BASE_DIR / "datasets" / "state"
+SNAPSHOT_PATH = STATE_DIR / "aggregates.json"
+
+BASELINE_DAYS = 30
+ALPHA = 2 / (BASELINE_DAYS + 1)  # EWMA span matching the 30-day rolling baseline of script 03
+HISTORY_DAYS = 30                # Closed daily counts kept per series (for snapshots / trends)
+ALL_CATEGORIES = "*"             # Pincode-level series across categories (what the models were trained on)
+
+# Order must match the anomaly detector's training features (07_train_models.py)
+FEATURES = ['transaction_count', 'day_of_week', 'temperature', 'humidity', 'baseline_30d']
+
+
+class DailySeries:
+    """
+    Running count for the current day plus an EWMA over closed days.
+
+    The EWMA is linear in the daily counts, so days without transactions
+    just decay it by (1 - ALPHA) per day, and a late transaction for a closed
+    day adds ALPHA * (1 - ALPHA)^age to it.
+    """
+    __slots__ = ('day', 'count', 'quantity', 'ewma', 'days_seen', 'history')
+
+    def __init__(self):
+        self.day = None       # date ordinal of the open day
+        self.count = 0
+        self.quantity = 0
+        self.ewma = None      # baseline over closed days, None until a day closed
+        self.days_seen = 0
+        self.history = deque(maxlen=HISTORY_DAYS)  # [day ordinal, count] of closed days
+
+    def _close_day(self, new_day):
+        if self.day is not None:
+            gap = new_day - self.day  # >= 1; days in between had no transactions
+            if self.ewma is None:
+                self.ewma = float(self.count)
+            else:
+                self.ewma = ALPHA * self.count + (1 - ALPHA) * self.ewma
+            self.ewma *= (1 - ALPHA) ** (gap - 1)
+            self.history.append([self.day, self.count])
+            self.days_seen += 1
+        self.day = new_day
+        self.count = 0
+        self.quantity = 0
+
+    def add(self, day, quantity, n=1):
+        """n transactions (total quantity) on day"""
+        if self.day is None or day > self.day:
+            self._close_day(day)
+        if day == self.day:
+            self.count += n
+            self.quantity += quantity
+            return
+        # Late transactions for a closed day
+        age = self.day - day - 1
+        if self.ewma is not None:
+            self.ewma += n * ALPHA * (1 - ALPHA) ** age
+        for entry in reversed(self.history):
+            if entry[0] == day:
+                entry[1] += n
+                return
+        if len(self.history) < HISTORY_DAYS or day > self.history[0][0]:
+            self.history.append([day, n])
+            self.history = deque(sorted(self.history), maxlen=HISTORY_DAYS)
+
+    def count_on(self, day):
+        if day == self.day:
+            return self.count
+        for d, n in self.history:
+            if d == day:
+                return n
+        return 0
+
+    def baseline(self):
+        """
+        Baseline including today, like the rolling mean in training
+        (min_periods=1: the first day's baseline is its own count).
+        """
+        if self.ewma is None:
+            return float(self.count)
+        return ALPHA * self.count + (1 - ALPHA) * self.ewma
+
+    def to_dict(self):
+        return {"day": self.day, "count": self.count, "quantity": self.quantity,
+                "ewma": self.ewma, "days_seen": self.days_seen, "history": list(self.history)}
+
+    @classmethod
+    def from_dict(cls, d):
+        s = cls()
+        s.day, s.count, s.quantity = d["day"], d["count"], d["quantity"]
+        s.ewma, s.days_seen = d["ewma"], d["days_seen"]
+        s.history.extend(d.get("history", []))
+        return s
+
+
+class StreamingAggregator:
+    """Per-(pincode, category) daily series + last reported weather per pincode"""
+
+    def __init__(self, default_weather=(28.0, 65.0)):
+        self.series = {}   # (pincode, category) -> DailySeries; category ALL_CATEGORIES = pincode total
+        self.weather = {}  # pincode -> (temperature, humidity)
+        self.default_weather = default_weather
+        self.transactions = 0
+        self.dirty = set()  # pincodes changed since the detector's last take_dirty()
+        self._lock = threading.Lock()
+
+    def _get(self, pincode, category):
+        key = (pincode, category)
+        s = self.series.get(key)
+        if s is None:
+            s = self.series[key] = DailySeries()
+        return s
+
+    def _features(self, pincode, total, day):
+        """
+        Feature vector (FEATURES order) of a pincode for day. Days before the
+        open one (late backfills) are measured against the current baseline.
+        """
+        temp, hum = self.weather.get(pincode, self.default_weather)
+        if day == total.day:
+            count, baseline = total.count, total.baseline()
+        else:
+            count = total.count_on(day)
+            baseline = count if total.ewma is None else ALPHA * count + (1 - ALPHA) * total.ewma
+        return [float(count), float(date.fromordinal(day).weekday()), float(temp), float(hum), float(baseline)]
+
+    def _set_weather(self, pincode, temperature, humidity):
+        if temperature is not None and humidity is not None:
+            self.weather[pincode] = (temperature, humidity)
+
+    def add(self, pincode, category, timestamp, quantity=1, temperature=None, humidity=None):
+        """
+        Records one transaction and returns the pincode's current feature
+        vector (FEATURES order) for anomaly scoring.
+        """
+        day = timestamp.toordinal() if isinstance(timestamp, date) else int(timestamp)
+        with self._lock:
+            self._get(pincode, category.lower()).add(day, quantity)
+            total = self._get(pincode, ALL_CATEGORIES)
+            total.add(day, quantity)
+            self._set_weather(pincode, temperature, humidity)
+            self.transactions += 1
+            self.dirty.add(pincode)
+            return self._features(pincode, total, day)
+
+    def add_day(self, pincode, day, counts, temperature=None, humidity=None):
+        """
+        Bulk update for one pincode-day: counts = {category: (transactions, quantity)}.
+        Returns the pincode's feature vector for that day.
+        """
+        with self._lock:
+            n_total = q_total = 0
+            for category, (n, quantity) in counts.items():
+                self._get(pincode, category.lower()).add(day, quantity, n)
+                n_total += n
+                q_total += quantity
+            total = self._get(pincode, ALL_CATEGORIES)
+            total.add(day, q_total, n_total)
+            self._set_weather(pincode, temperature, humidity)
+            self.transactions += n_total
+            self.dirty.add(pincode)
+            return self._features(pincode, total, day)
+
+    def features(self, pincode):
+        """Current feature vector of a pincode, or None if never seen"""
+        with self._lock:
+            total = self.series.get((pincode, ALL_CATEGORIES))
+            if total is None:
+                return None
+            return self._features(pincode, total, total.day)
+
+    def take_dirty(self):
+        """Pincodes changed since the previous call, with their feature vectors"""
+        with self._lock:
+            dirty, self.dirty = self.dirty, set()
+            features = {}
+            for pincode in dirty:
+                total = self.series[(pincode, ALL_CATEGORIES)]
+                features[pincode] = self._features(pincode, total, total.day)
+            return features
+
+    def mark_dirty(self, pincodes):
+        with self._lock:
+            self.dirty.update(pincodes)
+
+    def summary(self, pincode=None):
+        """Open-day counts and baselines per (pincode, category)"""
+        with self._lock:
+            items = [(k, s.day, s.count, s.quantity, s.baseline()) for k, s in self.series.items()
+                     if pincode is None or k[0] == pincode]
+        return [{"pincode": k[0], "category": "all" if k[1] == ALL_CATEGORIES else k[1],
+                 "date": date.fromordinal(day).isoformat(), "transaction_count": count,
+                 "quantity": qty, "baseline_30d": round(base, 2)}
+                for k, day, count, qty, base in items]
+
+    # --- Snapshots ---
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "transactions": self.transactions,
+                "weather": {p: list(w) for p, w in self.weather.items()},
+                "series": [[p, c, s.to_dict()] for (p, c), s in self.series.items()]
+            }
+
+    def save(self, path=SNAPSHOT_PATH):
+        """Atomic JSON snapshot (written to a temp file, then renamed)"""
+        state = self.snapshot()
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+        return len(state["series"])
+
+    def load(self, path=SNAPSHOT_PATH):
+        path = Path(path)
+        if not path.exists():
+            return False
+        with open(path) as f:
+            state = json.load(f)
+        with self._lock:
+            self.transactions = state.get("transactions", 0)
+            self.weather = {p: tuple(w) for p, w in state.get("weather", {}).items()}
+            self.series = {(p, c): DailySeries.from_dict(d) for p, c, d in state.get("series", [])}
+            self.dirty = {p for p, c in self.series if c == ALL_CATEGORIES}
+        logger.info(f"✓ Restored {len(self.series)} aggregate series from {path}")
+        return True